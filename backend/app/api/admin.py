@@ -0,0 +1,76 @@
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from app.api.auth import require_role
+from app.config import settings
+from app.core.loopmonitor import loop_monitor
+from app.core.profiler import ProfilerBusyError, profiler, render_collapsed
+from app.models.user import User, UserRole
+
+router = APIRouter(prefix="/admin", tags=["运维"])
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=settings.profiler_max_seconds),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """对当前 worker 采样 N 秒，返回折叠栈（flamegraph 格式）"""
+    try:
+        stacks = await profiler.profile(seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(render_collapsed(stacks))
+
+
+@router.post("/profile/slow-requests")
+async def arm_slow_request_tracing(
+    threshold_ms: float = Query(500, gt=0),
+    seconds: float = Query(60, gt=0, le=settings.profiler_max_seconds),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """开启慢请求追踪：在 N 秒内记录超过阈值的请求及其调用栈"""
+    try:
+        profiler.arm_slow_requests(threshold_ms, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"armed": True, "threshold_ms": threshold_ms, "seconds": seconds}
+
+
+@router.get("/profile/slow-requests")
+async def get_slow_requests(
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """获取最近捕获的慢请求"""
+    return {
+        "armed": profiler.armed,
+        "requests": [
+            {
+                "method": r.method,
+                "path": r.path,
+                "duration_ms": r.duration_ms,
+                "started_at": r.started_at,
+                "collapsed": render_collapsed(Counter(r.stacks)),
+            }
+            for r in profiler.slow_requests
+        ],
+    }
+
+
+@router.delete("/profile/slow-requests")
+async def disarm_slow_request_tracing(
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """停止慢请求追踪"""
+    await profiler.disarm()
+    return {"armed": False}
+
+
+@router.get("/loop")
+async def get_loop_status(
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """当前 worker 的事件循环延迟、最近的阻塞记录及调试模式捕获的同步调用"""
+    return loop_monitor.status()
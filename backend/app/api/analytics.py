@@ -0,0 +1,38 @@
+from datetime import date
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.auth import require_role
+from app.database import get_db
+from app.models.user import User, UserRole
+from app.schemas.analytics import PosterComplianceResponse, TreatmentWeeklyResponse
+from app.services.analytics import AnalyticsService
+
+router = APIRouter(prefix="/analytics", tags=["经营分析"])
+
+
+@router.get("/simulations/weekly", response_model=TreatmentWeeklyResponse)
+async def simulations_weekly(
+    start: date | None = None,
+    end: date | None = None,
+    user_id: int | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """每周各治疗类型的模拟次数（读取汇总表）"""
+    items = await AnalyticsService.simulations_by_treatment(db, start, end, user_id)
+    watermarks = await AnalyticsService.watermarks(db)
+    return {"as_of": watermarks.get("simulations"), "items": items}
+
+
+@router.get("/posters/compliance", response_model=PosterComplianceResponse)
+async def poster_compliance(
+    start: date | None = None,
+    end: date | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """各营销人员的海报合规问题率（读取汇总表）"""
+    items = await AnalyticsService.poster_compliance_by_user(db, start, end)
+    watermarks = await AnalyticsService.watermarks(db)
+    return {"as_of": watermarks.get("generated_posters"), "items": items}
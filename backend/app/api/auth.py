@@ -4,8 +4,9 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models.user import User, UserRole
-from app.schemas.user import UserCreate, UserResponse, Token
+from app.schemas.user import UserBulkCreate, UserBulkResponse, UserCreate, UserResponse, Token
 from app.services.auth import AuthService
+from app.services.provisioning import ProvisioningService
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -48,6 +49,17 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     return await AuthService.create_user(db, user_data)
 
 
+@router.post("/users/bulk", response_model=UserBulkResponse)
+async def bulk_create_users(
+    data: UserBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_role(UserRole.MANAGER))
+):
+    """批量开通员工账号（院长权限），逐行返回开通结果与失败原因"""
+    result = await ProvisioningService.provision(db, data.users, dry_run=data.dry_run)
+    return result.as_dict()
+
+
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -1,16 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.ratelimit import heavy_work, rate_limit
+from app.core.responses import ModelSerializer
 from app.database import get_db
 from app.schemas.brandguard import (
     VIConfigCreate, VIConfigUpdate, VIConfigResponse,
-    PosterTemplateCreate, PosterTemplateResponse,
+    PosterTemplateCreate, PosterTemplateUpdate, PosterTemplateResponse,
+    LayoutPatchRequest, TemplateForkRequest, TemplateVersionResponse, LayoutDiffResponse,
     GeneratePosterRequest, GeneratedPosterResponse,
-    ComplianceCheckRequest, ComplianceCheckResponse
+    ComplianceCheckRequest, ComplianceCheckResponse,
+    SearchResponse
 )
-from app.services.brandguard import BrandGuardService
+from app.services.brandguard import BrandGuardService, TemplateVersionConflict
+from app.services.search import SearchService
 
 router = APIRouter(prefix="/brandguard", tags=["brandguard"])
 
+template_list_serializer = ModelSerializer(list[PosterTemplateResponse])
+poster_list_serializer = ModelSerializer(list[GeneratedPosterResponse])
+
 
 # 临时用户 ID（实际应从认证中间件获取）
 def get_current_user_id() -> int:
@@ -52,7 +63,8 @@ async def get_templates(
     user_id: int = Depends(get_current_user_id)
 ):
     """获取海报模板列表"""
-    return await BrandGuardService.get_templates(db, user_id)
+    templates = await BrandGuardService.get_templates(db, user_id)
+    return template_list_serializer.response(templates)
 
 
 @router.post("/templates", response_model=PosterTemplateResponse)
@@ -62,10 +74,136 @@ async def create_template(
     user_id: int = Depends(get_current_user_id)
 ):
     """创建海报模板"""
-    return await BrandGuardService.create_template(db, user_id, template)
+    try:
+        return await BrandGuardService.create_template(db, user_id, template)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _template_error(e: Exception) -> HTTPException:
+    if isinstance(e, LookupError):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    if isinstance(e, TemplateVersionConflict):
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/templates/{template_id}", response_model=PosterTemplateResponse)
+async def get_template(
+    template_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """获取海报模板"""
+    template = await BrandGuardService.get_template(db, user_id, template_id)
+    if template is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="模板不存在")
+    return template
+
+
+@router.put("/templates/{template_id}", response_model=PosterTemplateResponse)
+async def update_template(
+    template_id: int,
+    template: PosterTemplateUpdate,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """修改海报模板，布局变化时生成新版本"""
+    try:
+        return await BrandGuardService.update_template(db, user_id, template_id, template)
+    except (LookupError, ValueError, TemplateVersionConflict) as e:
+        raise _template_error(e)
+
+
+@router.patch("/templates/{template_id}/layout", response_model=PosterTemplateResponse)
+async def patch_template_layout(
+    template_id: int,
+    patch: LayoutPatchRequest,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """按 JSON Patch 局部修改布局，如 [{"op": "replace", "path": "/layers/2/text", "value": "..."}]"""
+    try:
+        return await BrandGuardService.patch_layout(
+            db, user_id, template_id,
+            [op.model_dump(exclude_unset=True) for op in patch.operations],
+            patch.base_version
+        )
+    except (LookupError, ValueError, TemplateVersionConflict) as e:
+        raise _template_error(e)
+
+
+@router.post("/templates/{template_id}/fork", response_model=PosterTemplateResponse)
+async def fork_template(
+    template_id: int,
+    fork: TemplateForkRequest,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """复制模板（共享布局节点，不复制数据）"""
+    try:
+        return await BrandGuardService.fork_template(db, user_id, template_id, fork.name)
+    except LookupError as e:
+        raise _template_error(e)
 
 
-@router.post("/generate", response_model=GeneratedPosterResponse)
+@router.get("/templates/{template_id}/versions", response_model=list[TemplateVersionResponse])
+async def get_template_versions(
+    template_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """模板版本历史"""
+    try:
+        return await BrandGuardService.get_versions(db, user_id, template_id)
+    except LookupError as e:
+        raise _template_error(e)
+
+
+@router.get("/templates/{template_id}/diff", response_model=LayoutDiffResponse)
+async def diff_template(
+    template_id: int,
+    version: int | None = Query(None, description="默认当前版本"),
+    base_template_id: int | None = Query(None, description="与另一模板比较，如复制来源；默认本模板"),
+    base_version: int | None = Query(None, description="默认本模板上一版本，或另一模板的当前版本"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """比较两个版本的布局，返回从基准版本到目标版本的 JSON Patch"""
+    try:
+        return await BrandGuardService.diff_template(
+            db, user_id, template_id, version, base_template_id, base_version
+        )
+    except LookupError as e:
+        raise _template_error(e)
+
+
+@router.get("/layouts/{layout_hash}")
+async def get_layout_node(
+    layout_hash: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """布局节点（子树以 {"$ref": 哈希} 引用）；内容由哈希决定、永不改变，渲染端可按哈希长期缓存；只能取自己模板（含历史版本）中的节点"""
+    body = await BrandGuardService.get_layout_node(db, user_id, layout_hash)
+    if body is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="布局节点不存在")
+    etag = f'"{layout_hash}"'
+    headers = {"etag": etag, "cache-control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+
+@router.post(
+    "/generate",
+    response_model=GeneratedPosterResponse,
+    dependencies=[
+        Depends(rate_limit("brandguard.generate", get_current_user_id)),
+        Depends(heavy_work.slot("brandguard.generate")),
+    ],
+)
 async def generate_poster(
     request: GeneratePosterRequest,
     db: AsyncSession = Depends(get_db),
@@ -84,8 +222,25 @@ async def check_compliance(request: ComplianceCheckRequest):
 
 @router.get("/posters", response_model=list[GeneratedPosterResponse])
 async def get_posters(
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
     db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
     """获取已生成海报列表"""
-    return await BrandGuardService.get_posters(db, user_id)
+    posters = await BrandGuardService.get_posters(db, user_id, created_after, created_before)
+    return poster_list_serializer.response(posters)
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    type: Literal["poster", "template"] | None = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """检索海报与模板（标题、正文、描述），按相关度排序"""
+    items, total = await SearchService.search(db, user_id, q, [type] if type else None, skip, limit)
+    return {"total": total, "items": items}
@@ -1,28 +1,54 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.auth import get_current_user
+from app.core.files import RangeFileResponse, content_hash, file_response
+from app.core.ratelimit import heavy_work, rate_limit
+from app.core.responses import ModelSerializer
+from app.config import settings
+from app.core.storage import storage
 from app.database import get_db
 from app.schemas.facesim import (
     ImageUploadResponse,
+    LesionQueryResponse,
+    SimilarImagesResponse,
     SkinAnalysisCreate,
     SkinAnalysisResponse,
-    SkinAnalysisResult,
     SimulationCreate,
     SimulationDetail,
     SimulationListResponse,
-    SimulationListItem
 )
-from app.services.facesim import FaceSimService
+from app.models.facesim import SkinIssueType
+from app.models.user import User
+from app.services.bundles import BundleService
+from app.services.embeddings import EmbeddingService
+from app.services.facesim import UPLOAD_PREFIX, FaceSimService
+from app.services.lesions import FACE_REGIONS, LesionService
+from app.services.variants import get_variant, variant_cache
 
 router = APIRouter(prefix="/facesim", tags=["FaceSim 2D"])
 
+skin_analysis_serializer = ModelSerializer(SkinAnalysisResponse)
+simulation_list_serializer = ModelSerializer(SimulationListResponse)
+
 
-# 临时：获取当前用户 ID（实际应从 JWT token 获取）
-async def get_current_user_id() -> int:
-    return 1  # TODO: 从认证中间件获取
+# 当前用户 ID：与文件、打包路由一样取自 JWT，保证写入与读取的归属一致
+async def get_current_user_id(current_user: User = Depends(get_current_user)) -> int:
+    return current_user.id
 
 
-@router.post("/upload", response_model=ImageUploadResponse)
+@router.post(
+    "/upload",
+    response_model=ImageUploadResponse,
+    dependencies=[
+        Depends(rate_limit("facesim.upload", get_current_user_id)),
+        Depends(heavy_work.slot("facesim.upload")),
+    ],
+)
 async def upload_face_image(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
@@ -39,7 +65,14 @@ async def upload_face_image(
     return image
 
 
-@router.post("/analyze", response_model=SkinAnalysisResponse)
+@router.post(
+    "/analyze",
+    response_model=SkinAnalysisResponse,
+    dependencies=[
+        Depends(rate_limit("facesim.analyze", get_current_user_id)),
+        Depends(heavy_work.slot("facesim.analyze")),
+    ],
+)
 async def analyze_skin_issues(
     data: SkinAnalysisCreate,
     db: AsyncSession = Depends(get_db)
@@ -49,9 +82,8 @@ async def analyze_skin_issues(
         analyses = await FaceSimService.analyze_skin(
             db, data.image_id, data.issue_types
         )
-        return SkinAnalysisResponse(
-            image_id=data.image_id,
-            analyses=[SkinAnalysisResult.model_validate(a) for a in analyses]
+        return skin_analysis_serializer.response(
+            {"image_id": data.image_id, "analyses": analyses}
         )
     except ValueError as e:
         raise HTTPException(
@@ -60,7 +92,69 @@ async def analyze_skin_issues(
         )
 
 
-@router.post("/simulate", response_model=SimulationDetail)
+@router.get("/images/{image_id}/lesions", response_model=LesionQueryResponse)
+async def query_lesions(
+    image_id: int,
+    issue_type: SkinIssueType | None = None,
+    region: str | None = Query(None, description=f"面部分区：{', '.join(FACE_REGIONS)}"),
+    bbox: str | None = Query(None, description="像素外包框 x0,y0,x1,y1"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """按面部分区或外包框查询皮损，如 T 区内的痘痘：?issue_type=acne&region=t_zone"""
+    box = None
+    if bbox is not None:
+        try:
+            box = tuple(int(v) for v in bbox.split(","))
+        except ValueError:
+            box = ()
+        if len(box) != 4 or box[0] >= box[2] or box[1] >= box[3]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox 格式应为 x0,y0,x1,y1"
+            )
+    try:
+        lesions = await LesionService.query_lesions(
+            db, user_id, image_id, issue_type, region, box
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"image_id": image_id, "count": len(lesions), "items": lesions}
+
+
+@router.get("/images/{image_id}/similar", response_model=SimilarImagesResponse)
+async def similar_images(
+    image_id: int,
+    k: int = Query(10, ge=1, le=100),
+    issue_type: SkinIssueType | None = None,
+    treatment_type: str | None = Query(None, description="只返回做过该治疗的病例，如：祛痘"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """相似皮肤病例：同一账号下外观最接近的图片，可按皮肤问题与治疗类型过滤"""
+    image = await FaceSimService.get_image(db, image_id, user_id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    hits = await EmbeddingService.similar_images(db, image, k, issue_type, treatment_type)
+    return {
+        "image_id": image_id,
+        "items": [
+            {"image_id": hit.id, "score": round(score, 4), "created_at": hit.created_at}
+            for hit, score in hits
+        ],
+    }
+
+
+@router.post(
+    "/simulate",
+    response_model=SimulationDetail,
+    dependencies=[
+        Depends(rate_limit("facesim.simulate", get_current_user_id)),
+        Depends(heavy_work.slot("facesim.simulate")),
+    ],
+)
 async def create_simulation(
     data: SimulationCreate,
     db: AsyncSession = Depends(get_db),
@@ -83,17 +177,16 @@ async def create_simulation(
 async def get_simulations(
     skip: int = 0,
     limit: int = 20,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
     db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
     """获取模拟记录列表"""
     simulations, total = await FaceSimService.get_simulations(
-        db, user_id, skip, limit
-    )
-    return SimulationListResponse(
-        total=total,
-        items=[SimulationListItem.model_validate(s) for s in simulations]
+        db, user_id, skip, limit, created_after, created_before
     )
+    return simulation_list_serializer.response({"total": total, "items": simulations})
 
 
 @router.get("/simulations/{simulation_id}", response_model=SimulationDetail)
@@ -112,3 +205,90 @@ async def get_simulation_detail(
             detail="模拟记录不存在"
         )
     return simulation
+
+
+def _file_not_found() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
+
+
+async def _image_response(request: Request, path: str | None, width: int | None, etag: str | None = None):
+    """下发图片：按 Accept / width 返回缓存的 AVIF、WebP 变体，否则返回原图（对象存储取本地副本）"""
+    found = await storage.fetch(path) if path and path.startswith(f"{UPLOAD_PREFIX}/") else None
+    if found is None:
+        raise _file_not_found()
+    source, stat_result = found
+    etag = etag or await content_hash(source, stat_result)
+    # 同一 URL 的响应随 Accept 变化，缓存必须区分
+    headers = {"vary": "Accept"}
+
+    variant = await get_variant(source, etag, request.headers.get("accept"), width)
+    if variant is None:
+        return RangeFileResponse(source, stat_result, etag, request, headers=headers)
+    variant_path, fmt = variant
+    response = await file_response(
+        request, variant_path, variant_cache.root,
+        etag=variant_path.name, media_type=fmt.media_type, headers=headers
+    )
+    if response is None:
+        raise _file_not_found()
+    return response
+
+
+@router.api_route("/images/{image_id}/file", methods=["GET", "HEAD"])
+async def get_image_file(
+    image_id: int,
+    request: Request,
+    width: int | None = Query(None, ge=1, description="目标宽度，吸附到固定档位"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """下载原图（支持 Range、ETag 条件请求，按 Accept 协商 AVIF / WebP）"""
+    image = await FaceSimService.get_image(db, image_id, current_user.id)
+    if not image:
+        raise _file_not_found()
+    return await _image_response(request, image.file_path, width, etag=image.content_hash)
+
+
+@router.api_route("/simulations/{simulation_id}/files/{kind}", methods=["GET", "HEAD"])
+async def get_simulation_file(
+    simulation_id: int,
+    kind: Literal["simulated", "comparison"],
+    request: Request,
+    width: int | None = Query(None, ge=1, description="目标宽度，吸附到固定档位"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """下载模拟效果图或对比图（支持 Range、ETag 条件请求，按 Accept 协商 AVIF / WebP）"""
+    path = await FaceSimService.get_simulation_file_path(db, simulation_id, current_user.id, kind)
+    return await _image_response(request, path, width)
+
+
+@router.get(
+    "/images/{image_id}/bundle",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/zip": {}}}, 304: {"description": "自 since 以来无变更"}},
+    dependencies=[Depends(rate_limit("facesim.bundle", get_current_user))],
+)
+async def get_image_bundle(
+    image_id: int,
+    request: Request,
+    since: str | None = Query(None, description="上次取得的版本号（X-Bundle-Version），只下发此后的变更"),
+    width: int | None = Query(settings.bundle_image_width, ge=1, description="包内图片宽度，吸附到固定档位"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """会诊预取包：图片、分析（含检测区域）、模拟记录及效果图 / 对比图打成一个 ZIP 流式下发"""
+    image = await BundleService.load_image(db, image_id, current_user.id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    try:
+        bundle = BundleService.plan(image, since, request.headers.get("accept"), width)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # 包内图片格式随 Accept 变化，缓存必须区分
+    headers = {"x-bundle-version": bundle.version, "vary": "Accept"}
+    if bundle.unchanged:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers["content-disposition"] = f'attachment; filename="image-{image_id}-bundle.zip"'
+    return StreamingResponse(BundleService.stream(bundle), media_type="application/zip", headers=headers)
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -6,6 +8,90 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379"
     secret_key: str = "change-me-in-production"
     access_token_expire_minutes: int = 1440  # 24小时
+    metrics_enabled: bool = True  # 是否开启 /metrics 与请求耗时统计
+    database_echo: bool = False  # 打印全部 SQL（同步写日志会阻塞事件循环，仅限本地排查）
+    loop_monitor_enabled: bool = True  # 事件循环延迟监控与阻塞检测
+    loop_monitor_interval_ms: float = 100  # 延迟探测间隔
+    loop_block_threshold_ms: float = 100  # 单个回调占用事件循环超过该时长时抓取调用栈
+    loop_debug: Literal["off", "warn", "raise"] = "off"  # 同步 I/O 检测：off / warn 记录日志 / raise 抛出异常（测试用）
+    profiler_max_seconds: int = 120  # 单次采样分析最长时长
+    warmup_mode: Literal["eager", "background", "lazy"] = "background"  # 预热模式：eager 启动前完成 / background 后台预热 / lazy 首次使用时加载
+    weights_dir: str = "models"  # 模型权重目录（safetensors 单文件，内存映射加载）
+    web_workers: int | None = None  # gunicorn worker 数，默认可用 CPU 核数（受 cgroup CPU 配额限制）
+
+    # 限流：每用户令牌桶 "容量/秒数"，可用 "路由:角色" 单独覆盖，如 {"facesim.simulate:manager": "60/60"}
+    rate_limits: dict[str, str] = {
+        "facesim.upload": "30/60",
+        "facesim.analyze": "30/60",
+        "facesim.simulate": "20/60",
+        "facesim.bundle": "60/60",
+        "brandguard.generate": "20/60",
+    }
+    heavy_work_concurrency: int = 8  # 渲染/检测类请求的单 worker 并发上限
+    heavy_work_queue: int = 32  # 达到并发上限后允许排队的请求数，超出直接 503
+    heavy_work_queue_timeout: float = 10.0  # 排队最长等待秒数
+
+    # 分区与归档
+    partition_months_ahead: int = 3  # 提前创建的月度分区数
+    partition_retention_months: int = 12  # 热表保留月数，更早的分区归档为 Parquet
+    archive_dir: str = "archive"  # 冷数据归档目录
+
+    # 对象存储（上传图片、模拟图与对比图）
+    storage_backend: Literal["local", "s3"] = "local"  # local 本地磁盘 / s3 兼容 S3 的对象存储（MinIO 等），多节点部署时使用
+    storage_local_root: str = "."  # local：对象键为该目录下的相对路径，如 uploads/facesim/x.jpg
+    storage_cache_dir: str = "cache/objects"  # s3：写入与读取过的对象在本地保留的副本
+    storage_cache_max_mb: int = 4096  # 本地副本总大小上限，超出按最近使用淘汰
+    s3_endpoint_url: str = "http://localhost:9000"
+    s3_bucket: str = "aestheticore"
+    s3_region: str = "us-east-1"
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    s3_part_size_mb: int = 8  # 分片上传 / 分段下载的分片大小（不小于 5）
+    s3_concurrency: int = 8  # 单个对象并行传输的分片数
+    s3_max_connections: int = 32  # 每个 worker 的连接池上限
+
+    # 图片转码缓存
+    variant_cache_dir: str = "cache/variants"  # WebP / AVIF 变体缓存目录
+    variant_cache_max_mb: int = 2048  # 缓存目录总大小上限（所有 worker 共享），超出按最近使用淘汰
+    variant_widths: list[int] = [320, 640, 960, 1280, 1920]  # 允许的输出宽度档位
+
+    # 清理与数据保留
+    stale_simulation_minutes: int = 30  # PROCESSING 超过该时长的模拟标记为失败
+    orphan_grace_minutes: int = 60  # 未被引用的文件超过该时长才删除，避免误删尚未提交的上传
+    retention_days: int | None = None  # 图片保留天数，None 表示不限
+    retention_max_images: int | None = None  # 每个用户（诊所账号）最多保留的图片数，超出删除最旧的
+
+    # 批量导入
+    ingest_workers: int | None = None  # 质检/检测进程数，默认 CPU 核数
+    ingest_batch_size: int = 200  # 每批写入的图片数（一个事务）
+    ingest_max_in_flight: int = 64  # 已读入内存、尚未写库的图片上限
+
+    # 批量开通账号
+    provision_workers: int | None = None  # 密码哈希进程数，默认 CPU 核数
+    provision_max_batch: int = 5000  # 单次开通的账号数上限
+
+    # 相似病例检索
+    embedding_index_dir: str = "data/embeddings"  # 人脸向量索引目录（各 worker 内存映射共享）
+    embedding_nprobe: int = 16  # 每次查询扫描的 IVF 列表数，越大召回越高、越慢
+
+    # 海报模板布局
+    layout_cache_entries: int = 20000  # 每个 worker 按哈希缓存的布局节点数与物化子树数
+
+    # 会诊预取包
+    bundle_image_width: int | None = 1280  # 包内图片默认宽度（吸附到 variant_widths），None 为原尺寸
+    bundle_prefetch: int = 2  # 输出当前图片条目时提前准备的后续条目数
+    bundle_delta_overlap_seconds: int = 60  # 增量按版本水位回退的秒数，覆盖写入时间早于提交时刻的记录
+
+    # 请求追踪
+    tracing_exporter: Literal["none", "otlp", "file"] = "none"  # none 关闭 / otlp 发送到 OTLP/HTTP 采集器 / file 以 OTLP JSON 逐行追加写入文件
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"  # 采集器的 OTLP/HTTP traces 地址
+    tracing_file: str = "traces/spans.jsonl"  # file：输出文件，多个 worker 追加写入同一文件
+    tracing_service_name: str = "aestheticore-api"
+    tracing_sample_ratio: float = 0.01  # 头部采样：请求开始时按比例决定保留；上游 traceparent 已带采样决定时沿用
+    tracing_tail_slow_ms: float | None = 1000  # 尾部采样：未被头部采样的请求出错或超过该耗时也保留，None 时只做头部采样
+    tracing_max_spans: int = 1000  # 单个追踪在内存中缓存的跨度上限，超出丢弃
+    tracing_queue_spans: int = 20000  # 待导出的跨度上限，导出跟不上时丢弃新追踪
+    tracing_export_interval: float = 2.0  # 后台批量导出间隔秒数
 
     class Config:
         env_file = ".env"
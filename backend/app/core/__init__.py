@@ -0,0 +1 @@
+# 基础设施
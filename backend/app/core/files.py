@@ -0,0 +1,232 @@
+"""静态文件高效下发
+
+- 强 ETag（内容 SHA-256）与 If-None-Match -> 304，长期缓存头（输出文件内容不可变）；
+- 单段 HTTP Range -> 206 / 416，If-Range 校验 ETag；
+- 服务器支持 ASGI zerocopysend 扩展时直接交给内核 sendfile，支持 pathsend 时按路径发送，
+  否则在线程池中分块读取。
+"""
+import hashlib
+import mimetypes
+import os
+import stat
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.core import tracing
+from app.core.warmup import warmups
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+_HASH_CACHE_SIZE = 4096
+_hash_cache: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+
+# 首次 guess_type 会同步读取系统 mime.types，提前在预热中完成
+warmups.register("files.mimetypes", mimetypes.init)
+
+
+def resolve_within(path: str | os.PathLike, root: str | os.PathLike) -> Path | None:
+    """解析路径，位于 root 之外（含符号链接逃逸）或不是普通文件时返回 None"""
+    root = Path(root).resolve()
+    try:
+        resolved = Path(path).resolve(strict=True)
+    except (FileNotFoundError, RuntimeError):
+        return None
+    if not resolved.is_relative_to(root) or not resolved.is_file():
+        return None
+    return resolved
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def content_hash(path: Path, stat_result: os.stat_result) -> str:
+    """文件内容 SHA-256，按 (路径, mtime, 大小) 在进程内缓存"""
+    key = (str(path), stat_result.st_mtime_ns, stat_result.st_size)
+    cached = _hash_cache.get(key)
+    if cached is not None:
+        _hash_cache.move_to_end(key)
+        return cached
+    with tracing.span("file.hash", attributes={"file.size": stat_result.st_size}):
+        value = await anyio.to_thread.run_sync(_sha256_file, path)
+    _hash_cache[key] = value
+    if len(_hash_cache) > _HASH_CACHE_SIZE:
+        _hash_cache.popitem(last=False)
+    return value
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """解析单段 Range，返回闭区间 (start, end)；多段或格式错误返回 None（按整文件响应），
+    不可满足时抛出 ValueError"""
+    unit, _, spec = header.partition("=")
+    start_text, sep, end_text = spec.strip().partition("-")
+    if (
+        unit.strip().lower() != "bytes" or not sep
+        or not (start_text.isdigit() or not start_text)
+        or not (end_text.isdigit() or not end_text)
+    ):
+        return None
+    if not start_text:
+        if not end_text:
+            return None
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("不可满足的 Range")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start >= size:
+        raise ValueError("不可满足的 Range")
+    if start > end:
+        return None
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """支持条件请求与 Range 的文件响应"""
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: Path,
+        stat_result: os.stat_result,
+        etag: str,
+        request: Request,
+        media_type: str | None = None,
+        cache_control: str = IMMUTABLE_CACHE_CONTROL,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.path = path
+        self.background = None
+        self.media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.offset, self.count = 0, stat_result.st_size
+        size = stat_result.st_size
+
+        base_headers = {
+            "etag": f'"{etag}"',
+            "cache-control": cache_control,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+            **(headers or {}),
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+
+        if if_none_match is not None and _etag_matches(if_none_match, base_headers["etag"]):
+            # 304 不带实体相关头
+            self.status_code = 304
+            self.count = 0
+            self.media_type = None
+            self.init_headers(base_headers)
+            return
+
+        self.status_code = 200
+        if range_header and request.method in ("GET", "HEAD") and (
+            if_range is None or if_range.strip() == base_headers["etag"]
+        ):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.count = 0
+                self.init_headers({**base_headers, "content-range": f"bytes */{size}", "content-length": "0"})
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.offset, self.count = start, end - start + 1
+                base_headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        self.init_headers({**base_headers, "content-length": str(self.count)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"].upper() == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+            with f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+        if "http.response.pathsend" in extensions and self.status_code == 200:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+            if remaining > 0:
+                # 文件在发送过程中被截断
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def resolve_file(path: str | os.PathLike, root: str | os.PathLike) -> tuple[Path, os.stat_result] | None:
+    """在线程池中解析并 stat 位于 root 下的文件；不存在或越界时返回 None"""
+    resolved = await anyio.to_thread.run_sync(resolve_within, path, root)
+    if resolved is None:
+        return None
+    stat_result = await anyio.to_thread.run_sync(os.stat, resolved)
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    return resolved, stat_result
+
+
+async def file_response(
+    request: Request,
+    path: str | os.PathLike,
+    root: str | os.PathLike,
+    etag: str | None = None,
+    media_type: str | None = None,
+    headers: dict[str, str] | None = None,
+) -> Response | None:
+    """下发 root 下的文件；文件不存在或越界时返回 None。etag 缺省时按内容哈希计算"""
+    found = await resolve_file(path, root)
+    if found is None:
+        return None
+    resolved, stat_result = found
+    if etag is None:
+        etag = await content_hash(resolved, stat_result)
+    return RangeFileResponse(resolved, stat_result, etag, request, media_type=media_type, headers=headers)
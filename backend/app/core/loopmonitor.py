@@ -0,0 +1,234 @@
+"""事件循环延迟监控与阻塞调用检测
+
+- 延迟：循环内的探测任务每 interval 秒醒来一次，实际醒来时间与预期之差即事件循环延迟，
+  计入 event_loop_lag_seconds 直方图；
+- 阻塞：看门狗线程检查探测任务的心跳，超过阈值未更新时抓取事件循环线程当前的调用栈，
+  即正在占用循环的回调，保存到最近阻塞记录并计数；
+- 调试模式（settings.loop_debug = warn / raise）：通过审计钩子（sys.addaudithook）
+  捕获在事件循环线程中执行的同步文件 / 网络 / 子进程 / sleep 调用，warn 记录日志，
+  raise 直接抛出 BlockingCallError，便于在测试中发现回归。审计钩子一经安装无法移除，
+  只在调试模式下安装；确需在循环中执行的调用用 allow_blocking() 包裹。
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.core.metrics import REGISTRY
+from app.core.profiler import collapse_frame
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "事件循环调度延迟",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_LAG_MAX = REGISTRY.gauge("event_loop_lag_max_seconds", "最近一个统计窗口内的最大事件循环延迟")
+LOOP_BLOCKED = REGISTRY.counter("event_loop_blocked", "事件循环被单个回调占用超过阈值的次数")
+LOOP_SYNC_CALLS = REGISTRY.counter("event_loop_sync_calls", "调试模式下在事件循环中执行的同步调用数", ("event",))
+
+# 视为阻塞的审计事件（open 另需排除模块导入）
+BLOCKING_EVENTS = {
+    "open", "time.sleep", "socket.connect", "socket.getaddrinfo", "subprocess.Popen", "os.system",
+    "shutil.copyfile", "shutil.copytree", "shutil.move", "shutil.rmtree", "os.listdir", "os.scandir",
+}
+_IMPORT_SUFFIXES = (".py", ".pyc", ".pth", ".so")
+_IMPORTLIB_DIR = f"{os.sep}importlib{os.sep}"
+MAX_SYNC_CALL_RECORDS = 200
+
+_allow_blocking: ContextVar[bool] = ContextVar("allow_blocking", default=False)
+
+
+class BlockingCallError(RuntimeError):
+    """调试模式下在事件循环中执行了同步阻塞调用"""
+
+
+@contextmanager
+def allow_blocking():
+    """标记确需在事件循环中执行的同步调用，不计入检测"""
+    token = _allow_blocking.set(True)
+    try:
+        yield
+    finally:
+        _allow_blocking.reset(token)
+
+
+@dataclass
+class StallRecord:
+    """一次事件循环阻塞"""
+    started_at: float
+    duration_ms: float
+    stack: str
+    ongoing: bool = True
+
+
+@dataclass
+class SyncCallRecord:
+    """调试模式捕获的同步调用"""
+    event: str
+    args: str
+    stack: str
+    count: int = 1
+    at: float = field(default_factory=time.time)
+
+
+class LoopMonitor:
+    """单 worker 的事件循环监控"""
+
+    def __init__(self):
+        self.interval = 0.1
+        self.threshold = 0.1
+        self.stalls: deque[StallRecord] = deque(maxlen=50)
+        self.sync_calls: dict[tuple[str, str], SyncCallRecord] = {}
+        self._loop_thread_id: int | None = None
+        self._heartbeat = 0.0
+        self._window_max = 0.0
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._debug_mode = "off"
+        self._hook_installed = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, interval_ms: float, threshold_ms: float, debug: str = "off") -> None:
+        """在当前事件循环中启动探测任务与看门狗线程"""
+        if self.running:
+            return
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._probe(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        self.set_debug(debug)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _probe(self) -> None:
+        window_started = time.monotonic()
+        window_max = 0.0
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._heartbeat = now
+            LOOP_LAG.observe(lag)
+            window_max = max(window_max, lag)
+            if now - window_started >= 10:
+                LOOP_LAG_MAX.set(window_max)
+                self._window_max = window_max
+                window_started, window_max = now, 0.0
+
+    def _watch(self) -> None:
+        """看门狗：心跳超时即判定阻塞，每次阻塞只抓一次栈，结束后补记总时长"""
+        current: StallRecord | None = None
+        check = min(self.threshold / 2, 0.05)
+        while not self._stop.wait(check):
+            overdue = time.monotonic() - self._heartbeat - self.interval
+            if overdue >= self.threshold:
+                if current is None:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    stack = collapse_frame(frame, "event-loop") if frame is not None else ""
+                    current = StallRecord(
+                        started_at=time.time() - overdue, duration_ms=round(overdue * 1000, 1), stack=stack
+                    )
+                    self.stalls.append(current)
+                    LOOP_BLOCKED.inc()
+                    logger.warning("事件循环被阻塞超过 %.0f ms，占用者调用栈: %s", self.threshold * 1000, stack)
+                else:
+                    current.duration_ms = round(overdue * 1000, 1)
+            elif current is not None:
+                current.ongoing = False
+                current = None
+
+    # 调试模式
+    def set_debug(self, mode: str) -> None:
+        """off / warn / raise；关闭后审计钩子仍在，但直接返回"""
+        self._debug_mode = mode
+        if mode != "off" and not self._hook_installed:
+            sys.addaudithook(self._audit)
+            self._hook_installed = True
+
+    def _audit(self, event: str, args: tuple) -> None:
+        if self._debug_mode == "off" or event not in BLOCKING_EVENTS:
+            return
+        if threading.get_ident() != self._loop_thread_id or asyncio._get_running_loop() is None:
+            return
+        if _allow_blocking.get():
+            return
+        if event == "open":
+            # 导入模块、按文件描述符打开（如 socket.makefile）不算
+            path = args[0]
+            if not isinstance(path, str | bytes) or os.fsdecode(path).endswith(_IMPORT_SUFFIXES):
+                return
+        elif event == "socket.connect" and not args[0].getblocking():
+            # asyncio 在非阻塞 socket 上发起连接，不会阻塞循环
+            return
+        frame = sys._getframe(1)
+        # 跳过导入系统内部触发的调用（模块导入、读取包元数据）
+        probe = frame
+        while probe is not None:
+            filename = probe.f_code.co_filename
+            if filename.startswith("<frozen importlib") or _IMPORTLIB_DIR in filename:
+                return
+            probe = probe.f_back
+        stack = collapse_frame(frame, "event-loop")
+        key = (event, stack)
+        record = self.sync_calls.get(key)
+        if record is None and len(self.sync_calls) < MAX_SYNC_CALL_RECORDS:
+            self.sync_calls[key] = SyncCallRecord(event=event, args=repr(args)[:200], stack=stack)
+            logger.warning("事件循环中执行了同步调用 %s%r，调用栈: %s", event, args[:2], stack)
+        elif record is not None:
+            record.count += 1
+            record.at = time.time()
+        LOOP_SYNC_CALLS.labels(event).inc()
+        if self._debug_mode == "raise":
+            raise BlockingCallError(f"事件循环中执行了同步调用 {event}{args[:2]!r}")
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "debug": self._debug_mode,
+            "lag_max_ms": round(self._window_max * 1000, 2),
+            "stalls": [
+                {
+                    "started_at": s.started_at,
+                    "duration_ms": s.duration_ms,
+                    "ongoing": s.ongoing,
+                    "collapsed": s.stack,
+                }
+                for s in reversed(self.stalls)
+            ],
+            "sync_calls": [
+                {"event": r.event, "args": r.args, "count": r.count, "last_at": r.at, "collapsed": r.stack}
+                for r in sorted(self.sync_calls.values(), key=lambda r: -r.count)
+            ],
+        }
+
+
+loop_monitor = LoopMonitor()
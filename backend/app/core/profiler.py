@@ -0,0 +1,201 @@
+"""按需采样分析器
+
+后台线程定时抓取 sys._current_frames()，输出 flamegraph 兼容的折叠栈
+（每行 "root;...;leaf count"，可直接交给 flamegraph.pl / speedscope）。
+空闲时没有任何采样线程，中间件只做一次布尔判断。
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter as CountMap, deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse_frame(frame, thread_name: str = "") -> str:
+    """将调用栈折叠为 root;...;leaf 形式"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame).replace(";", ":"))
+        frame = frame.f_back
+    if thread_name:
+        labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def render_collapsed(stacks: CountMap) -> str:
+    """折叠栈计数 -> 文本"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def _thread_names() -> dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+
+
+class _Sampler(threading.Thread):
+    """采样线程：每 interval 秒抓取一次所有（或指定）线程的调用栈"""
+
+    def __init__(self, interval: float, deadline: float, on_sample, thread_ids: set[int] | None = None):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.interval = interval
+        self.deadline = deadline
+        self.on_sample = on_sample
+        self.thread_ids = thread_ids
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        names = _thread_names()
+        next_names_refresh = time.monotonic() + 1.0
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now >= self.deadline:
+                break
+            if now >= next_names_refresh:
+                names = _thread_names()
+                next_names_refresh = now + 1.0
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+                self.on_sample(now, thread_id, collapse_frame(frame, names.get(thread_id, str(thread_id))))
+            self.stop_event.wait(self.interval)
+
+
+class ProfilerBusyError(RuntimeError):
+    """同一 worker 同时只允许一个采样任务"""
+
+
+@dataclass
+class SlowRequestRecord:
+    """慢请求记录"""
+    method: str
+    path: str
+    duration_ms: float
+    started_at: float
+    stacks: dict[str, int] = field(default_factory=dict)
+
+
+class Profiler:
+    """单 worker 的采样分析器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sampler: _Sampler | None = None
+        self._slow_sampler: _Sampler | None = None  # 慢请求追踪启动的采样线程，disarm 只停止它
+        # 慢请求追踪状态；armed 由中间件读取，其余字段仅在 armed 时使用
+        self.armed = False
+        self.slow_threshold = 0.0
+        self._ring: deque = deque(maxlen=20000)
+        self.slow_requests: deque[SlowRequestRecord] = deque(maxlen=50)
+
+    @property
+    def busy(self) -> bool:
+        return self._sampler is not None and self._sampler.is_alive()
+
+    def _start(self, sampler: _Sampler, prepare: Callable[[], None] | None = None) -> None:
+        """启动采样线程；prepare 在确认空闲后、启动前执行，忙碌时不改动任何状态"""
+        with self._lock:
+            if self.busy:
+                raise ProfilerBusyError("已有采样任务在运行")
+            if prepare is not None:
+                prepare()
+            self._sampler = sampler
+            sampler.start()
+
+    async def profile(self, seconds: float, interval: float, thread_ids: set[int] | None = None) -> CountMap:
+        """采样 seconds 秒，返回折叠栈计数"""
+        stacks: CountMap = CountMap()
+
+        def on_sample(_ts, _tid, stack):
+            stacks[stack] += 1
+
+        sampler = _Sampler(interval, time.monotonic() + seconds, on_sample, thread_ids)
+        self._start(sampler)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop_event.set()
+            await asyncio.to_thread(sampler.join)
+        return stacks
+
+    def arm_slow_requests(self, threshold_ms: float, seconds: float, interval: float) -> None:
+        """开启慢请求追踪：采样线程持续写入环形缓冲，超阈值的请求截取其时间窗内的栈"""
+        ring = self._ring
+
+        def on_sample(ts, tid, stack):
+            ring.append((ts, stack))
+
+        def prepare():
+            # 正在运行的采样任务仍在使用环形缓冲与阈值，必须先确认空闲
+            ring.clear()
+            self.slow_threshold = threshold_ms / 1000
+
+        sampler = _Sampler(interval, time.monotonic() + seconds, on_sample)
+        self._start(sampler, prepare)
+        self._slow_sampler = sampler
+        self.armed = True
+        threading.Thread(target=self._disarm_when_done, args=(sampler,), daemon=True).start()
+
+    def _disarm_when_done(self, sampler: _Sampler) -> None:
+        sampler.join()
+        if self._slow_sampler is sampler:
+            self._slow_sampler = None
+            self.armed = False
+
+    async def disarm(self) -> None:
+        """停止慢请求追踪；其他采样任务（如 /admin/profile）不受影响"""
+        sampler = self._slow_sampler
+        if sampler is not None:
+            sampler.stop_event.set()
+            await asyncio.to_thread(sampler.join)
+        self.armed = False
+
+    def record_request(self, method: str, path: str, started: float, finished: float) -> None:
+        """中间件回调：超过阈值则保存该请求时间窗内的采样"""
+        duration = finished - started
+        if duration < self.slow_threshold:
+            return
+        stacks: CountMap = CountMap()
+        for ts, stack in list(self._ring):
+            if started <= ts <= finished:
+                stacks[stack] += 1
+        self.slow_requests.append(SlowRequestRecord(
+            method=method,
+            path=path,
+            duration_ms=round(duration * 1000, 2),
+            started_at=time.time() - (time.monotonic() - started),
+            stacks=dict(stacks.most_common()),
+        ))
+
+
+profiler = Profiler()
+
+
+class SlowRequestMiddleware:
+    """慢请求追踪中间件，未开启时只有一次属性判断"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.armed:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            profiler.record_request(
+                scope["method"], getattr(route, "path", scope["path"]), started, time.monotonic()
+            )
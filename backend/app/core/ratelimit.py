@@ -0,0 +1,232 @@
+"""限流与准入控制
+
+- 令牌桶：按 路由 + 角色 + 用户 计数，优先存 Redis（多 worker / 多节点共享），
+  Redis 不可用时退化为进程内计数，并在冷却期后自动重试 Redis。
+- 并发闸门：渲染、检测类重任务的全局并发上限，排队过长或等待超时直接 503，
+  而不是让队列无限增长。
+规则在 Settings.rate_limits 中按路由配置，拒绝次数计入 /metrics。
+"""
+import asyncio
+import logging
+import math
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.config import settings
+from app.core import tracing
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "rate_limit_rejections", "限流/过载拒绝次数", ("route", "reason")
+)
+CONCURRENCY_IN_USE = REGISTRY.gauge(
+    "heavy_work_in_progress", "重任务并发占用数", ("limiter",)
+)
+CONCURRENCY_WAITING = REGISTRY.gauge(
+    "heavy_work_waiting", "重任务排队数", ("limiter",)
+)
+
+# KEYS[1]=桶 key；ARGV[1]=容量，ARGV[2]=每秒补充令牌数。时间取 Redis 服务器时钟，避免节点间时钟漂移
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+def parse_rule(rule: str) -> tuple[float, float]:
+    """"20/60" -> (容量 20, 每秒补充 20/60 个令牌)"""
+    capacity, seconds = rule.split("/", 1)
+    capacity, seconds = float(capacity), float(seconds)
+    if capacity <= 0 or seconds <= 0:
+        raise ValueError(f"无效的限流规则: {rule}")
+    return capacity, capacity / seconds
+
+
+class MemoryTokenBucket:
+    """进程内令牌桶（Redis 不可用时的退化实现）"""
+
+    max_keys = 100_000
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, capacity: float, rate: float) -> tuple[bool, float]:
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - ts) * rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            allowed, retry_after = True, 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            allowed, retry_after = False, (1 - tokens) / rate
+        if len(self._buckets) > self.max_keys:
+            self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now: float) -> None:
+        # 删除已回满且一分钟未访问的桶
+        stale = [k for k, (_, ts) in self._buckets.items() if now - ts > 60]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RateLimiter:
+    """令牌桶限流器：Redis 优先，失败时退化到进程内"""
+
+    retry_redis_after = 30.0
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self._redis = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self.memory = MemoryTokenBucket()
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(
+                self.redis_url, socket_timeout=0.2, socket_connect_timeout=0.2
+            )
+            self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+        return self._redis
+
+    async def take(self, key: str, capacity: float, rate: float) -> tuple[bool, float]:
+        """消耗一个令牌，返回 (是否放行, 建议重试秒数)"""
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                self._client()
+                with tracing.span("redis EVALSHA", tracing.KIND_CLIENT, {
+                    "db.system": "redis",
+                    "db.operation": "EVALSHA",
+                }):
+                    allowed, retry_after = await self._script(keys=[key], args=[capacity, rate])
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:  # redis 连接、超时、脚本错误统一降级
+                logger.warning("Redis 限流不可用，降级为进程内计数: %s", e)
+                self._redis_down_until = time.monotonic() + self.retry_redis_after
+        return self.memory.take(key, capacity, rate)
+
+
+rate_limiter = RateLimiter(settings.redis_url)
+
+
+def _token_from_request(request: Request):
+    """从 Bearer token 中取用户与角色（校验签名），用于限流分桶与选择档位"""
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    from app.services.auth import AuthService
+
+    try:
+        return AuthService.decode_token(authorization[7:])
+    except HTTPException:
+        return None
+
+
+def rate_limit(route: str, identity):
+    """限流依赖：identity 为当前用户依赖；返回 User 时直接用其 ID 与角色分桶，
+    否则以校验过签名的 token subject 分桶，匿名请求按客户端地址分桶"""
+    async def dependency(request: Request, current=Depends(identity)) -> None:
+        if hasattr(current, "id"):
+            user_id, role = current.id, getattr(current.role, "value", None)
+        else:
+            token = _token_from_request(request)
+            user_id = token.user_id if token else f"ip:{request.client.host if request.client else 'unknown'}"
+            role = token.role.value if token and token.role else None
+        rule = settings.rate_limits.get(f"{route}:{role}") if role else None
+        rule = rule or settings.rate_limits.get(route)
+        if not rule:
+            return
+        capacity, rate = parse_rule(rule)
+        allowed, retry_after = await rate_limiter.take(
+            f"ratelimit:{route}:{role or 'default'}:{user_id}", capacity, rate
+        )
+        if not allowed:
+            RATE_LIMIT_REJECTIONS.labels(route, "rate_limit").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="请求过于频繁，请稍后再试",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+    return dependency
+
+
+class ConcurrencyLimiter:
+    """全局并发闸门：超出上限排队，排队满或等待超时则拒绝"""
+
+    def __init__(self, name: str, limit: int, max_waiting: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self._waiting = 0
+        self._in_use = CONCURRENCY_IN_USE.labels(name)
+        self._waiting_gauge = CONCURRENCY_WAITING.labels(name)
+
+    def _overloaded(self, route: str) -> HTTPException:
+        RATE_LIMIT_REJECTIONS.labels(route, "overload").inc()
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务繁忙，请稍后再试",
+            headers={"Retry-After": str(max(1, math.ceil(self.timeout)))},
+        )
+
+    async def acquire(self, route: str) -> None:
+        if self._semaphore.locked() and self._waiting >= self.max_waiting:
+            raise self._overloaded(route)
+        self._waiting += 1
+        self._waiting_gauge.inc()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._overloaded(route)
+        finally:
+            self._waiting -= 1
+            self._waiting_gauge.dec()
+        self._in_use.inc()
+
+    def release(self) -> None:
+        self._semaphore.release()
+        self._in_use.dec()
+
+    def slot(self, route: str):
+        """并发闸门依赖"""
+        async def dependency():
+            await self.acquire(route)
+            try:
+                yield
+            finally:
+                self.release()
+        return dependency
+
+
+heavy_work = ConcurrencyLimiter(
+    "heavy_work",
+    limit=settings.heavy_work_concurrency,
+    max_waiting=settings.heavy_work_queue,
+    timeout=settings.heavy_work_queue_timeout,
+)
@@ -0,0 +1,26 @@
+"""快速 JSON 响应
+
+FastAPI 在声明 response_model 时会对返回值再做一次校验并经 jsonable_encoder
+转换后交给标准库 json 编码。列表接口改为返回预构建序列化器生成的 Response：
+ORM 对象只经过一次 from_attributes 校验，随后由 pydantic-core 直接输出 JSON 字节。
+路由上的 response_model 仍保留，用于 OpenAPI 文档。
+"""
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+class ModelSerializer:
+    """预构建的响应序列化器（模块加载时构建一次，按请求复用）"""
+
+    def __init__(self, type_: Any):
+        self.adapter = TypeAdapter(type_)
+
+    def dump(self, data: Any) -> bytes:
+        """ORM 对象 / dict -> JSON 字节"""
+        value = self.adapter.validate_python(data, from_attributes=True)
+        return self.adapter.dump_json(value)
+
+    def response(self, data: Any, status_code: int = 200) -> Response:
+        return Response(self.dump(data), status_code=status_code, media_type="application/json")
@@ -0,0 +1,746 @@
+"""对象存储：本地磁盘与兼容 S3 的对象存储
+
+上传图片、模拟图与对比图以对象键（如 uploads/facesim/<uuid>.jpg，与数据库中的 file_path 一致）存取：
+- LocalStorage：对象即 storage_local_root 下的文件，fetch 直接返回原文件路径，下发走 sendfile 零拷贝；
+- S3Storage：多节点共享的对象存储（MinIO、AWS S3 等），SigV4 签名，httpx 连接池复用连接。
+  大对象分片上传 / 按 Range 分段下载，单个对象的多个分片并行传输；写入与读取过的对象在本地保留
+  一份副本（大小受限的 LRU 缓存），下发与质检、检测等同步处理仍读本地文件。
+
+业务代码只依赖 Storage 接口：save（流式写入）、save_file（提交已写到 staging_path 的文件）、
+fetch（取本地可读文件）、copy、delete、list。
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import stat
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import httpx
+
+from app.config import settings
+from app.core import tracing
+from app.core.files import resolve_file
+from app.core.warmup import warmups
+
+logger = logging.getLogger(__name__)
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 要求除最后一片外每片不小于 5 MB
+LIST_PAGE_SIZE = 1000
+DELETE_BATCH_SIZE = 1000  # DeleteObjects 单次上限
+REQUEST_ATTEMPTS = 3
+
+
+class StorageError(OSError):
+    """对象存储错误（不继承 ValueError，接口层不会误报为参数错误或记录不存在）"""
+
+
+class InvalidKeyError(StorageError):
+    """对象键不合法"""
+
+
+def check_key(key: str) -> str:
+    """对象键必须是不含 .. 的相对路径"""
+    path = PurePosixPath(key)
+    if not key or path.is_absolute() or "\\" in key or any(part in ("", ".", "..") for part in key.split("/")):
+        raise InvalidKeyError(f"非法的对象键: {key!r}")
+    return key
+
+
+@dataclass
+class ObjectInfo:
+    key: str
+    size: int
+    mtime: float
+
+
+@dataclass
+class StoredObject:
+    """save 的结果"""
+    key: str
+    size: int
+    sha256: str
+
+
+def _write_chunk(f, digest, chunk: bytes) -> None:
+    f.write(chunk)
+    digest.update(chunk)
+
+
+def _open_temp(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    return tmp, open(tmp, "wb")
+
+
+class Storage(ABC):
+    """对象存储接口"""
+
+    is_local = False
+
+    @abstractmethod
+    def staging_path(self, key: str) -> Path:
+        """对象在本地落盘的位置：先写到这里再调用 save_file 提交"""
+
+    @abstractmethod
+    async def save(self, key: str, chunks: AsyncIterable[bytes], content_type: str | None = None) -> StoredObject:
+        """流式写入对象，返回大小与内容 SHA-256"""
+
+    @abstractmethod
+    async def save_file(self, key: str, content_type: str | None = None) -> None:
+        """提交已写到 staging_path(key) 的文件"""
+
+    @abstractmethod
+    async def fetch(self, key: str) -> tuple[Path, os.stat_result] | None:
+        """返回对象的本地可读文件及其 stat；对象不存在或键非法时返回 None"""
+
+    @abstractmethod
+    async def copy(self, source: str, target: str) -> None:
+        """复制对象"""
+
+    @abstractmethod
+    async def delete(self, keys: list[str]) -> int:
+        """批量删除对象，返回删除数（不存在的对象不报错）"""
+
+    @abstractmethod
+    def list(self, prefix: str) -> AsyncIterator[list[ObjectInfo]]:
+        """按页遍历 prefix 下的对象"""
+
+    async def local_file(self, key: str) -> Path:
+        """取对象的本地文件，不存在时抛出 FileNotFoundError"""
+        found = await self.fetch(key)
+        if found is None:
+            raise FileNotFoundError(key)
+        return found[0]
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(Storage):
+    """本地磁盘：对象键即 root 下的相对路径"""
+
+    is_local = True
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def staging_path(self, key: str) -> Path:
+        return self.root / check_key(key)
+
+    @tracing.traced("storage.save")
+    async def save(self, key: str, chunks: AsyncIterable[bytes], content_type: str | None = None) -> StoredObject:
+        path = self.staging_path(key)
+        tmp, f = await asyncio.to_thread(_open_temp, path)
+        digest, size = hashlib.sha256(), 0
+        try:
+            with f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+                    size += len(chunk)
+            await asyncio.to_thread(os.replace, tmp, path)
+        except BaseException:
+            await asyncio.to_thread(tmp.unlink, True)
+            raise
+        return StoredObject(key, size, digest.hexdigest())
+
+    @tracing.traced("storage.save_file")
+    async def save_file(self, key: str, content_type: str | None = None) -> None:
+        """文件已在最终位置"""
+
+    @tracing.traced("storage.fetch")
+    async def fetch(self, key: str) -> tuple[Path, os.stat_result] | None:
+        try:
+            path = self.staging_path(key)
+        except InvalidKeyError:
+            return None
+        return await resolve_file(path, self.root)
+
+    @tracing.traced("storage.copy")
+    async def copy(self, source: str, target: str) -> None:
+        def run() -> None:
+            path = self.staging_path(target)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Linux 上 copyfile 走 copy_file_range / sendfile，数据不经过用户态
+            shutil.copyfile(self.staging_path(source), path)
+
+        await asyncio.to_thread(run)
+
+    @tracing.traced("storage.delete")
+    async def delete(self, keys: list[str]) -> int:
+        def run() -> int:
+            removed = 0
+            for key in keys:
+                try:
+                    self.staging_path(key).unlink()
+                    removed += 1
+                except (FileNotFoundError, InvalidKeyError):
+                    pass
+            return removed
+
+        return await asyncio.to_thread(run)
+
+    def _scan_page(self, stack: list[Path], pending: list, limit: int) -> list[ObjectInfo]:
+        """深度优先遍历，不预先收集整棵目录树；stack / pending 保存遍历进度"""
+        page = []
+        while len(page) < limit:
+            if pending:
+                entry = pending.pop()
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith("."):
+                        stat_result = entry.stat(follow_symlinks=False)
+                        key = Path(entry.path).relative_to(self.root).as_posix()
+                        page.append(ObjectInfo(key, stat_result.st_size, stat_result.st_mtime))
+                except FileNotFoundError:
+                    pass
+            elif stack:
+                try:
+                    with os.scandir(stack.pop()) as it:
+                        pending.extend(it)
+                except FileNotFoundError:
+                    pass
+            else:
+                break
+        return page
+
+    async def list(self, prefix: str) -> AsyncIterator[list[ObjectInfo]]:
+        stack, pending = [self.root / check_key(prefix.rstrip("/"))], []
+        while page := await asyncio.to_thread(self._scan_page, stack, pending, LIST_PAGE_SIZE):
+            yield page
+
+
+class ObjectCache:
+    """S3 对象的本地副本：大小受限的磁盘 LRU，按对象键分目录存放
+
+    lookup / add / discard 在线程池中并发调用，LRU 记录与总大小的读写都持有 _lock。
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] | None = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.root / check_key(key)
+
+    def _load(self) -> OrderedDict[str, int]:
+        """首次使用时扫描缓存目录，按访问时间重建 LRU 顺序（调用方持有 _lock）"""
+        if self._entries is not None:
+            return self._entries
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith("."):
+                    continue
+                path = Path(dirpath) / name
+                try:
+                    stat_result = path.stat()
+                except FileNotFoundError:
+                    continue
+                key = path.relative_to(self.root).as_posix()
+                found.append((max(stat_result.st_atime, stat_result.st_mtime), key, stat_result.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total = sum(self._entries.values())
+        return self._entries
+
+    def lookup(self, key: str) -> tuple[Path, os.stat_result] | None:
+        """命中时刷新 LRU 顺序并返回本地文件（在线程池中调用）"""
+        path = self.path(key)
+        try:
+            stat_result = path.stat()
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                # 其他 worker 写入的副本
+                self._total += stat_result.st_size
+                entries[key] = stat_result.st_size
+            entries.move_to_end(key)
+        os.utime(path)
+        return path, stat_result
+
+    def add(self, key: str, size: int) -> None:
+        with self._lock:
+            entries = self._load()
+            self._total += size - entries.pop(key, 0)
+            entries[key] = size
+            # 淘汰与记录删除在同一把锁内，避免删掉另一线程刚写回的同名副本
+            while self._total > self.max_bytes and len(entries) > 1:
+                oldest, oldest_size = entries.popitem(last=False)
+                self._total -= oldest_size
+                self.path(oldest).unlink(missing_ok=True)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            if self._entries is not None:
+                self._total -= self._entries.pop(key, 0)
+            self.path(key).unlink(missing_ok=True)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._load()
+            return self._total
+
+
+class S3Error(StorageError):
+    """对象存储返回错误"""
+
+
+def _quote(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+class SigV4Signer:
+    """AWS Signature Version 4（服务名 s3）"""
+
+    def __init__(self, access_key: str, secret_key: str, region: str):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._keys: dict[str, bytes] = {}
+
+    def _signing_key(self, date: str) -> bytes:
+        key = self._keys.get(date)
+        if key is None:
+            key = f"AWS4{self.secret_key}".encode()
+            for part in (date, self.region, "s3", "aws4_request"):
+                key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+            self._keys = {date: key}
+        return key
+
+    def sign(
+        self,
+        method: str,
+        host: str,
+        path: str,
+        query: dict[str, str],
+        headers: dict[str, str],
+        payload_hash: str,
+        now: datetime | None = None,
+    ) -> dict[str, str]:
+        """返回加上 x-amz-date、x-amz-content-sha256 与 authorization 的请求头；path 须已 URI 编码"""
+        amz_date = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+        headers = {
+            **{k.lower(): v for k, v in headers.items()},
+            "host": host,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+        }
+        signed = sorted(headers)
+        canonical_headers = "".join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in signed)
+        canonical_query = "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items()))
+        canonical_request = "\n".join(
+            [method, path, canonical_query, canonical_headers, ";".join(signed), payload_hash]
+        )
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join(
+            ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+        )
+        signature = hmac.new(self._signing_key(date), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(signed)}, Signature={signature}"
+        )
+        return headers
+
+
+def _xml_find(root: ElementTree.Element, tag: str) -> list[ElementTree.Element]:
+    """忽略命名空间查找子孙元素"""
+    return [el for el in root.iter() if el.tag.rsplit("}", 1)[-1] == tag]
+
+
+def _xml_text(root: ElementTree.Element, tag: str) -> str | None:
+    found = _xml_find(root, tag)
+    return found[0].text if found else None
+
+
+class _MultipartUpload:
+    """一次分片上传：提交分片时先占用并发名额（控制内存中的分片数），失败时中止整个上传"""
+
+    def __init__(self, storage: "S3Storage", key: str, upload_id: str):
+        self.storage = storage
+        self.key = key
+        self.upload_id = upload_id
+        self.etags: dict[int, str] = {}
+        self._next = 1
+        self._slots = asyncio.Semaphore(storage.concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._error: BaseException | None = None
+
+    async def submit(self, data: bytes | Callable[[], Awaitable[bytes]]) -> None:
+        await self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+        number, self._next = self._next, self._next + 1
+        task = asyncio.create_task(self._upload(number, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _upload(self, number: int, data) -> None:
+        try:
+            body = data if isinstance(data, bytes) else await data()
+            self.etags[number] = await self.storage._upload_part(self.key, self.upload_id, number, body)
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            self._slots.release()
+
+    async def complete(self) -> None:
+        await asyncio.gather(*self._tasks)
+        if self._error is not None:
+            raise self._error
+        await self.storage._complete_upload(self.key, self.upload_id, self.etags)
+
+    async def abort(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        try:
+            await self.storage._request("DELETE", self.key, {"uploadId": self.upload_id}, ok=(204, 404))
+        except (httpx.HTTPError, S3Error) as e:
+            logger.warning("中止分片上传失败 %s: %s", self.key, e)
+
+
+class S3Storage(Storage):
+    """兼容 S3 的对象存储（路径风格寻址：<endpoint>/<bucket>/<key>）"""
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        cache: ObjectCache,
+        part_size: int = 8 * 1024 * 1024,
+        concurrency: int = 8,
+        max_connections: int = 32,
+    ):
+        self.endpoint = httpx.URL(endpoint_url)
+        self.host = self.endpoint.netloc.decode()
+        self.bucket = bucket
+        self.signer = SigV4Signer(access_key, secret_key, region)
+        self.cache = cache
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self._client: httpx.AsyncClient | None = None
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+                ),
+                timeout=httpx.Timeout(30, connect=5),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _path(self, key: str | None) -> str:
+        path = f"/{self.bucket}" if key is None else f"/{self.bucket}/{check_key(key)}"
+        return _quote(path, safe="-_.~/")
+
+    async def _request(
+        self,
+        method: str,
+        key: str | None,
+        query: dict[str, str] | None = None,
+        content: bytes = b"",
+        headers: dict[str, str] | None = None,
+        ok: tuple[int, ...] = (200,),
+        payload_hash: str | None = None,
+    ) -> httpx.Response:
+        """签名并发送请求；连接错误与 5xx 重试"""
+        query = query or {}
+        path = self._path(key)
+        if payload_hash is None:
+            payload_hash = hashlib.sha256(content).hexdigest() if content else EMPTY_SHA256
+        url = str(self.endpoint.copy_with(raw_path=path.encode()))
+        with tracing.span(f"s3 {method}", tracing.KIND_CLIENT, {
+            "http.request.method": method,
+            "url.path": path,
+            "http.request.body.size": len(content),
+        }) as current:
+            for attempt in range(REQUEST_ATTEMPTS):
+                signed = self.signer.sign(method, self.host, path, query, headers or {}, payload_hash)
+                signed_query = "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items()))
+                current.set("http.request.resend_count", attempt or None)
+                try:
+                    response = await self.client.request(
+                        method, f"{url}?{signed_query}" if signed_query else url, content=content, headers=signed
+                    )
+                except httpx.TransportError:
+                    if attempt == REQUEST_ATTEMPTS - 1:
+                        raise
+                else:
+                    current.set("http.response.status_code", response.status_code)
+                    if response.status_code in ok:
+                        return response
+                    if response.status_code < 500 or attempt == REQUEST_ATTEMPTS - 1:
+                        raise S3Error(f"{method} {path} 返回 {response.status_code}: {response.text[:200]}")
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        raise AssertionError("unreachable")
+
+    async def ensure_bucket(self) -> None:
+        """桶不存在时创建（用于 MinIO 等本地部署）"""
+        response = await self._request("HEAD", None, ok=(200, 404))
+        if response.status_code == 404:
+            await self._request("PUT", None, ok=(200,))
+            logger.info("已创建存储桶 %s", self.bucket)
+
+    # 写入
+    def staging_path(self, key: str) -> Path:
+        return self.cache.path(key)
+
+    async def _put_object(self, key: str, body: bytes, content_type: str | None) -> None:
+        headers = {"content-type": content_type} if content_type else {}
+        payload_hash = await asyncio.to_thread(lambda: hashlib.sha256(body).hexdigest())
+        await self._request("PUT", key, content=body, headers=headers, payload_hash=payload_hash)
+
+    async def _start_upload(self, key: str, content_type: str | None) -> _MultipartUpload:
+        headers = {"content-type": content_type} if content_type else {}
+        response = await self._request("POST", key, {"uploads": ""}, headers=headers)
+        upload_id = _xml_text(ElementTree.fromstring(response.content), "UploadId")
+        if not upload_id:
+            raise S3Error(f"创建分片上传失败: {response.text[:200]}")
+        return _MultipartUpload(self, key, upload_id)
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> str:
+        payload_hash = await asyncio.to_thread(lambda: hashlib.sha256(body).hexdigest())
+        response = await self._request(
+            "PUT", key, {"partNumber": str(number), "uploadId": upload_id},
+            content=body, payload_hash=payload_hash,
+        )
+        return response.headers["etag"]
+
+    async def _complete_upload(self, key: str, upload_id: str, etags: dict[int, str]) -> None:
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{n}</PartNumber><ETag>{etags[n]}</ETag></Part>" for n in sorted(etags)
+        ) + "</CompleteMultipartUpload>"
+        response = await self._request("POST", key, {"uploadId": upload_id}, content=body.encode())
+        # 合并失败时 S3 可能返回 200 与 Error 正文
+        if b"<Error>" in response.content:
+            raise S3Error(f"合并分片失败: {response.text[:200]}")
+
+    @tracing.traced("storage.save")
+    async def save(self, key: str, chunks: AsyncIterable[bytes], content_type: str | None = None) -> StoredObject:
+        """边写本地副本边上传：凑满一个分片即提交，超过一个分片时走分片上传"""
+        path = self.staging_path(key)
+        tmp, f = await asyncio.to_thread(_open_temp, path)
+        digest, size = hashlib.sha256(), 0
+        buffer = bytearray()
+        upload: _MultipartUpload | None = None
+        try:
+            with f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+                    size += len(chunk)
+                    buffer += chunk
+                    while len(buffer) >= self.part_size:
+                        if upload is None:
+                            upload = await self._start_upload(key, content_type)
+                        await upload.submit(bytes(buffer[:self.part_size]))
+                        del buffer[:self.part_size]
+            if upload is None:
+                await self._put_object(key, bytes(buffer), content_type)
+            else:
+                if buffer:
+                    await upload.submit(bytes(buffer))
+                await upload.complete()
+            await asyncio.to_thread(os.replace, tmp, path)
+        except BaseException:
+            if upload is not None:
+                await upload.abort()
+            await asyncio.to_thread(tmp.unlink, True)
+            raise
+        await asyncio.to_thread(self.cache.add, key, size)
+        return StoredObject(key, size, digest.hexdigest())
+
+    @tracing.traced("storage.save_file")
+    async def save_file(self, key: str, content_type: str | None = None) -> None:
+        """上传 staging_path 处的文件，多个分片按偏移并行读取与上传"""
+        path = self.staging_path(key)
+        size = (await asyncio.to_thread(path.stat)).st_size
+        if size <= self.part_size:
+            await self._put_object(key, await asyncio.to_thread(path.read_bytes), content_type)
+        else:
+            fd = await asyncio.to_thread(os.open, path, os.O_RDONLY)
+            upload = await self._start_upload(key, content_type)
+            try:
+                for offset in range(0, size, self.part_size):
+                    length = min(self.part_size, size - offset)
+                    await upload.submit(lambda offset=offset, length=length: asyncio.to_thread(
+                        os.pread, fd, length, offset
+                    ))
+                await upload.complete()
+            except BaseException:
+                await upload.abort()
+                raise
+            finally:
+                os.close(fd)
+        await asyncio.to_thread(self.cache.add, key, size)
+
+    # 读取
+    async def _download(self, key: str, path: Path) -> bool:
+        """首个分段的响应给出总大小，其余分段并行下载并按偏移写入"""
+        first = await self._request("GET", key, headers={"range": f"bytes=0-{self.part_size - 1}"}, ok=(200, 206, 404))
+        if first.status_code == 404:
+            return False
+        if first.status_code == 206:
+            size = int(first.headers["content-range"].rsplit("/", 1)[1])
+        else:
+            size = len(first.content)
+        tmp, f = await asyncio.to_thread(_open_temp, path)
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_range(offset: int) -> None:
+            async with slots:
+                end = min(offset + self.part_size, size) - 1
+                response = await self._request("GET", key, headers={"range": f"bytes={offset}-{end}"}, ok=(206,))
+                await asyncio.to_thread(os.pwrite, f.fileno(), response.content, offset)
+
+        try:
+            with f:
+                await asyncio.to_thread(os.pwrite, f.fileno(), first.content, 0)
+                await asyncio.gather(*(fetch_range(o) for o in range(len(first.content), size, self.part_size)))
+            await asyncio.to_thread(os.replace, tmp, path)
+        except BaseException:
+            await asyncio.to_thread(tmp.unlink, True)
+            raise
+        await asyncio.to_thread(self.cache.add, key, size)
+        return True
+
+    def _download_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 等待者都已取消时异常无人读取，避免 "exception was never retrieved" 告警
+            task.exception()
+
+    @tracing.traced("storage.fetch")
+    async def fetch(self, key: str) -> tuple[Path, os.stat_result] | None:
+        """优先读本地副本，未命中时下载（同一对象的并发请求共享一次下载）"""
+        try:
+            check_key(key)
+        except InvalidKeyError:
+            return None
+        found = await asyncio.to_thread(self.cache.lookup, key)
+        if found is not None:
+            return found
+
+        # 下载是独立任务，发起它的请求被取消也不影响其他等待者；各请求经 shield 等待
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._download(key, self.cache.path(key)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._download_done(key, done))
+        if not await asyncio.shield(task):
+            return None
+        return await asyncio.to_thread(self.cache.lookup, key)
+
+    @tracing.traced("storage.copy")
+    async def copy(self, source: str, target: str) -> None:
+        """服务端复制，不经过本节点"""
+        response = await self._request(
+            "PUT", target, headers={"x-amz-copy-source": self._path(source)}
+        )
+        if b"<Error>" in response.content:
+            raise S3Error(f"复制对象失败: {response.text[:200]}")
+
+    @tracing.traced("storage.delete")
+    async def delete(self, keys: list[str]) -> int:
+        removed = 0
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = [check_key(k) for k in keys[start:start + DELETE_BATCH_SIZE]]
+            body = ("<Delete><Quiet>true</Quiet>" + "".join(
+                f"<Object><Key>{_xml_escape(k)}</Key></Object>" for k in batch
+            ) + "</Delete>").encode()
+            response = await self._request(
+                "POST", None, {"delete": ""}, content=body,
+                headers={"content-md5": base64.b64encode(hashlib.md5(body).digest()).decode()},
+            )
+            failed = _xml_find(ElementTree.fromstring(response.content), "Error") if response.content else []
+            removed += len(batch) - len(failed)
+            for key in batch:
+                await asyncio.to_thread(self.cache.discard, key)
+        return removed
+
+    async def list(self, prefix: str) -> AsyncIterator[list[ObjectInfo]]:
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix, "max-keys": str(LIST_PAGE_SIZE)}
+            if token:
+                query["continuation-token"] = token
+            response = await self._request("GET", None, query)
+            root = ElementTree.fromstring(response.content)
+            page = [
+                ObjectInfo(
+                    key=_xml_text(item, "Key"),
+                    size=int(_xml_text(item, "Size")),
+                    mtime=datetime.fromisoformat(_xml_text(item, "LastModified").replace("Z", "+00:00")).timestamp(),
+                )
+                for item in _xml_find(root, "Contents")
+            ]
+            if page:
+                yield page
+            token = _xml_text(root, "NextContinuationToken")
+            if _xml_text(root, "IsTruncated") != "true" or not token:
+                return
+
+
+def _xml_escape(value: str) -> str:
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def create_storage() -> Storage:
+    if settings.storage_backend == "local":
+        return LocalStorage(settings.storage_local_root)
+    s3 = S3Storage(
+        settings.s3_endpoint_url,
+        settings.s3_bucket,
+        settings.s3_region,
+        settings.s3_access_key,
+        settings.s3_secret_key,
+        cache=ObjectCache(settings.storage_cache_dir, settings.storage_cache_max_mb * 1024 * 1024),
+        part_size=settings.s3_part_size_mb * 1024 * 1024,
+        concurrency=settings.s3_concurrency,
+        max_connections=settings.s3_max_connections,
+    )
+    warmups.register("storage.cache", lambda: s3.cache.total_bytes)
+    warmups.register("storage.bucket", s3.ensure_bucket)
+    return s3
+
+
+storage = create_storage()
@@ -0,0 +1,631 @@
+"""请求级追踪
+
+按路由的指标只能说明某个接口整体变慢，追踪记录单个请求内各阶段的耗时：
+- TracingMiddleware 为每个请求创建根跨度，上游带 W3C traceparent 时接入同一条追踪；
+- 子跨度覆盖服务层操作（observe 装饰的检测、渲染、合规检查等）、SQL 执行与会话提交 / 刷新、
+  文件与对象存储读写、转码以及 Redis 调用，跨度的父子关系经 contextvars 传递到任务与线程池；
+- 进程池中的后台工作由 run_in_worker 提交，子进程内的跨度随结果带回，记 job.id 并归入同一条追踪；
+  命令行任务由 job() 创建根跨度，TRACEPARENT 环境变量中的上游追踪记为链接。
+
+采样：请求开始时按 tracing_sample_ratio 决定是否保留（头部采样）；开启尾部采样时其余请求也先在内存中
+记录跨度，结束时出错或超过 tracing_tail_slow_ms 的保留，其余丢弃。保留的跨度由后台线程批量编码为
+OTLP/JSON（ExportTraceServiceRequest），发送到 OTLP/HTTP 采集器或逐行追加到文件（可由采集器的
+otlpjsonfile 接收器读取）。未开启时不创建根跨度，各处埋点只有一次 contextvar 读取。
+"""
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from app.config import settings
+from app.core.metrics import REGISTRY, UNMATCHED_ROUTE
+
+logger = logging.getLogger(__name__)
+
+SPANS_EXPORTED = REGISTRY.counter("trace_spans_exported", "已导出的追踪跨度数")
+SPANS_DROPPED = REGISTRY.counter("trace_spans_dropped", "丢弃的追踪跨度数", ("reason",))
+TRACES_FINISHED = REGISTRY.counter("traces_finished", "结束的追踪数（按采样结果）", ("decision",))
+
+# OTLP 枚举值
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT, KIND_PRODUCER, KIND_CONSUMER = 1, 2, 3, 4, 5
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+EXPORT_BATCH_SPANS = 2048  # 待导出跨度达到该数时提前导出
+STATEMENT_MAX_CHARS = 2000  # db.statement 截断长度
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """W3C traceparent -> (trace_id, 父 span_id, 是否已采样)，格式不符时返回 None"""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    _, trace_id, span_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        if int(trace_id, 16) == 0 or int(span_id, 16) == 0:
+            return None
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return trace_id, span_id, sampled
+
+
+class _Trace:
+    """一条追踪在本进程内的跨度缓冲，根跨度结束时决定是否导出"""
+    __slots__ = ("trace_id", "sampled", "spans", "dropped", "error")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list = []  # 已结束的 Span，或子进程带回的已编码跨度
+        self.dropped = 0
+        self.error = False
+
+    def add(self, span) -> None:
+        # list.append 在 GIL 下是原子的，线程池中结束的跨度可直接写入
+        if len(self.spans) < settings.tracing_max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def extend(self, spans: list) -> None:
+        for span in spans:
+            self.add(span)
+
+
+class Span:
+    """一个计时区间"""
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind", "attributes",
+        "start_ns", "end_ns", "status", "message", "events", "links",
+    )
+    recording = True
+
+    def __init__(
+        self,
+        trace: _Trace,
+        name: str,
+        kind: int = KIND_INTERNAL,
+        parent_id: str | None = None,
+        attributes: dict | None = None,
+    ):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.status = STATUS_UNSET
+        self.message = ""
+        self.events: list[tuple[str, int, dict]] | None = None
+        self.links: list[tuple[str, str, dict]] | None = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def add_link(self, trace_id: str, span_id: str, attributes: dict | None = None) -> None:
+        if self.links is None:
+            self.links = []
+        self.links.append((trace_id, span_id, attributes or {}))
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.set_error(f"{type(exc).__name__}: {exc}")
+        if self.events is None:
+            self.events = []
+        self.events.append(("exception", time.time_ns(), {
+            "exception.type": type(exc).__qualname__,
+            "exception.message": str(exc)[:500],
+        }))
+
+    def set_error(self, message: str = "") -> None:
+        self.status = STATUS_ERROR
+        self.message = message[:500]
+        self.trace.error = True
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self.trace.add(self)
+
+    def to_otlp(self) -> dict:
+        data = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.events:
+            data["events"] = [
+                {"name": name, "timeUnixNano": str(ts), "attributes": _attributes(attrs)}
+                for name, ts, attrs in self.events
+            ]
+        if self.links:
+            data["links"] = [
+                {"traceId": trace_id, "spanId": span_id, "attributes": _attributes(attrs)}
+                for trace_id, span_id, attrs in self.links
+            ]
+        return data
+
+
+def _value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # OTLP/JSON 中 int64 以字符串表示
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: dict) -> list[dict]:
+    return [{"key": key, "value": _value(value)} for key, value in attributes.items() if value is not None]
+
+
+_current: ContextVar[Span | None] = ContextVar("trace_span", default=None)
+_job_id: ContextVar[str | None] = ContextVar("trace_job_id", default=None)
+
+
+class _NoopSpan:
+    """未在追踪中时的占位，埋点代码无需判断"""
+    __slots__ = ()
+    recording = False
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def add_link(self, trace_id: str, span_id: str, attributes: dict | None = None) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def set_error(self, message: str = "") -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self) -> _NoopSpan:
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+class _SpanScope:
+    """进入时设为当前跨度，退出时结束并恢复父跨度；异常记入跨度后继续抛出"""
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if isinstance(exc, Exception):
+            self.span.record_exception(exc)
+        self.span.end()
+        _current.reset(self._token)
+        return False
+
+
+def current_span() -> Span | _NoopSpan:
+    return _current.get() or NOOP_SPAN
+
+
+def span(name: str, kind: int = KIND_INTERNAL, attributes: dict | None = None):
+    """子跨度上下文管理器（同步、异步代码均可用）；当前不在追踪中时为空操作"""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP_SCOPE
+    return _SpanScope(Span(parent.trace, name, kind, parent.span_id, attributes))
+
+
+def traced(name: str, kind: int = KIND_INTERNAL):
+    """函数级跨度装饰器，支持同步与异步函数"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class _FileSink:
+    """逐行追加 OTLP/JSON；每批一次 O_APPEND 写入，多个 worker 写同一文件时行不交错"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def __call__(self, payload: bytes) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload + b"\n")
+        finally:
+            os.close(fd)
+
+
+class _OtlpSink:
+    """OTLP/HTTP JSON 编码发送到采集器"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._client = None
+
+    def __call__(self, payload: bytes) -> None:
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.Client(timeout=5)
+        response = self._client.post(self.endpoint, content=payload, headers={"content-type": "application/json"})
+        response.raise_for_status()
+
+
+class Exporter:
+    """后台线程批量导出；队列满时丢弃新追踪，不阻塞请求"""
+
+    def __init__(self, sink, max_spans: int, interval: float):
+        self.sink = sink
+        self.max_spans = max_spans
+        self.interval = interval
+        self._pending: list = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: threading.Thread | None = None
+        self._pid = 0
+
+    def _ensure_thread(self) -> None:
+        # gunicorn 预加载后 fork 的 worker 不继承线程，按进程号判断是否需要重新启动
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = []
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, spans: list) -> None:
+        self._ensure_thread()
+        with self._lock:
+            if len(self._pending) + len(spans) > self.max_spans:
+                SPANS_DROPPED.labels("queue_full").inc(len(spans))
+                return
+            self._pending.extend(spans)
+            full = len(self._pending) >= EXPORT_BATCH_SPANS
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._pending = self._pending, []
+        for start in range(0, len(spans), EXPORT_BATCH_SPANS):
+            batch = spans[start:start + EXPORT_BATCH_SPANS]
+            try:
+                self.sink(_encode(batch))
+            except Exception as e:
+                logger.warning("追踪导出失败，丢弃 %s 个跨度: %s", len(batch), e)
+                SPANS_DROPPED.labels("export_error").inc(len(batch))
+            else:
+                SPANS_EXPORTED.inc(len(batch))
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """停止后台线程并导出剩余跨度"""
+        if self._pid != os.getpid():
+            return
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+        self._pid = 0
+
+
+def _encode(spans: list) -> bytes:
+    """一批跨度 -> ExportTraceServiceRequest（OTLP/JSON）"""
+    return json.dumps({"resourceSpans": [{
+        "resource": {"attributes": _attributes({
+            "service.name": settings.tracing_service_name,
+            "process.pid": os.getpid(),
+        })},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [s if isinstance(s, dict) else s.to_otlp() for s in spans],
+        }],
+    }]}, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class Tracer:
+    """根跨度的创建、采样决定与导出"""
+
+    def __init__(self):
+        self.exporter: Exporter | None = None
+        self.sample_ratio = 0.0
+        self.tail_slow_ns: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(
+        self,
+        exporter: str,
+        sample_ratio: float,
+        tail_slow_ms: float | None,
+        otlp_endpoint: str = "",
+        file: str = "",
+        max_queue_spans: int = 20000,
+        interval: float = 2.0,
+    ) -> None:
+        if exporter == "none":
+            self.exporter = None
+            return
+        if exporter == "otlp":
+            sink = _OtlpSink(otlp_endpoint)
+        elif exporter == "file":
+            sink = _FileSink(file)
+        else:
+            raise ValueError(f"未知的追踪导出方式: {exporter}")
+        self.exporter = Exporter(sink, max_queue_spans, interval)
+        self.sample_ratio = sample_ratio
+        self.tail_slow_ns = None if tail_slow_ms is None else int(tail_slow_ms * 1_000_000)
+
+    def start(
+        self,
+        name: str,
+        kind: int = KIND_SERVER,
+        parent: tuple[str, str, bool] | None = None,
+        attributes: dict | None = None,
+        sampled: bool | None = None,
+    ) -> Span | None:
+        """创建本进程的根跨度；未开启，或未被头部采样且未开启尾部采样时返回 None（不记录）"""
+        if self.exporter is None:
+            return None
+        if sampled is None:
+            sampled = parent[2] if parent is not None else random.random() < self.sample_ratio
+        if not sampled and self.tail_slow_ns is None:
+            return None
+        trace = _Trace(parent[0] if parent is not None else _new_id(128), sampled)
+        return Span(trace, name, kind, parent[1] if parent is not None else None, attributes)
+
+    def finish(self, root: Span) -> None:
+        """结束根跨度：头部已采样、出错或慢的追踪导出，其余丢弃"""
+        root.end()
+        trace = root.trace
+        if trace.sampled:
+            decision = "head"
+        elif trace.error:
+            decision = "error"
+        elif root.end_ns - root.start_ns >= self.tail_slow_ns:
+            decision = "slow"
+        else:
+            TRACES_FINISHED.labels("dropped").inc()
+            return
+        TRACES_FINISHED.labels(decision).inc()
+        if trace.dropped:
+            SPANS_DROPPED.labels("trace_limit").inc(trace.dropped)
+            root.set("trace.dropped_spans", trace.dropped)
+        self.exporter.submit(trace.spans)
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+tracer = Tracer()
+tracer.configure(
+    settings.tracing_exporter,
+    settings.tracing_sample_ratio,
+    settings.tracing_tail_slow_ms,
+    otlp_endpoint=settings.tracing_otlp_endpoint,
+    file=settings.tracing_file,
+    max_queue_spans=settings.tracing_queue_spans,
+    interval=settings.tracing_export_interval,
+)
+# 命令行任务退出时导出剩余跨度（API 进程在 lifespan 结束时导出）
+atexit.register(tracer.shutdown)
+
+
+class TracingMiddleware:
+    """为每个请求创建根跨度（纯 ASGI 实现），未开启追踪时直接透传"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        method = scope["method"]
+        root = tracer.start(method, KIND_SERVER, parse_traceparent(traceparent), {
+            "http.request.method": method,
+            "url.path": scope["path"],
+        })
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.record_exception(e)
+            raise
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            root.name = f"{method} {route}"
+            root.set("http.route", route)
+            root.set("http.response.status_code", status_code)
+            if status_code >= 500 and root.status != STATUS_ERROR:
+                root.set_error()
+            tracer.finish(root)
+
+
+@contextmanager
+def job(name: str, job_id: str | None = None):
+    """后台任务的根跨度（总是采样），产出任务 ID；TRACEPARENT 环境变量中的上游追踪记为链接"""
+    job_id = job_id or new_job_id()
+    job_token = _job_id.set(job_id)
+    root = tracer.start(name, KIND_CONSUMER, attributes={"job.name": name, "job.id": job_id}, sampled=True)
+    if root is None:
+        try:
+            yield job_id
+        finally:
+            _job_id.reset(job_token)
+        return
+
+    upstream = parse_traceparent(os.environ.get("TRACEPARENT"))
+    if upstream is not None:
+        root.add_link(upstream[0], upstream[1])
+    logger.info("任务 %s job_id=%s trace_id=%s", name, job_id, root.trace.trace_id)
+    token = _current.set(root)
+    try:
+        yield job_id
+    except Exception as e:
+        root.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        _job_id.reset(job_token)
+        tracer.finish(root)
+
+
+def _run_traced(func, trace_id: str, parent_id: str, name: str, job_id: str, *args):
+    """子进程内执行 func，返回 (结果, 已编码的跨度)，由提交方归入原追踪"""
+    trace = _Trace(trace_id, True)
+    root = Span(trace, name, KIND_CONSUMER, parent_id, {"job.id": job_id, "process.pid": os.getpid()})
+    token = _current.set(root)
+    try:
+        result = func(*args)
+    finally:
+        _current.reset(token)
+        root.end()
+    return result, [s.to_otlp() for s in trace.spans]
+
+
+async def run_in_worker(pool, name: str, func, *args):
+    """在进程池中执行 func；在追踪中时记录提交方与子进程两个跨度，均带 job.id"""
+    loop = asyncio.get_running_loop()
+    parent = _current.get()
+    if parent is None:
+        return await loop.run_in_executor(pool, func, *args)
+    job_id = _job_id.get() or new_job_id()
+    with span(name, KIND_PRODUCER, {"job.id": job_id}) as current:
+        call = functools.partial(_run_traced, func, current.trace.trace_id, current.span_id, name, job_id)
+        result, spans = await loop.run_in_executor(pool, call, *args)
+        current.trace.extend(spans)
+    return result
+
+
+def instrument_engine(engine) -> None:
+    """为 SQLAlchemy 引擎挂载 SQL 执行跨度"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    system = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None:
+            conn.info.setdefault("_trace_spans", []).append(None)
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        conn.info.setdefault("_trace_spans", []).append(Span(parent.trace, f"db {verb}", KIND_CLIENT, parent.span_id, {
+            "db.system": system,
+            "db.operation": verb,
+            "db.statement": statement[:STATEMENT_MAX_CHARS],
+            "db.executemany": executemany or None,
+        }))
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("_trace_spans")
+        current = spans.pop() if spans else None
+        if current is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                current.set("db.rowcount", cursor.rowcount)
+            current.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        spans = conn.info.get("_trace_spans") if conn is not None else None
+        current = spans.pop() if spans else None
+        if current is not None:
+            current.record_exception(context.original_exception)
+            current.end()
@@ -0,0 +1,125 @@
+"""启动预热与就绪状态
+
+重依赖（图像库、检测模型、字体缓存等）不在模块导入时加载：
+- 通过 lazy_import 延迟到首次访问属性时才真正导入；
+- 通过 warmups.register 注册预热任务，由 lifespan 在后台执行，/ready 报告进度；
+- gunicorn 预加载模式下由 master 在 fork 前执行同步预热任务（run_sync），worker 继承结果后跳过。
+"""
+import asyncio
+import importlib
+import inspect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from types import ModuleType
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule(ModuleType):
+    """首次访问属性时才导入的模块代理"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_name = name
+        self._lazy_module: ModuleType | None = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    self._lazy_module = importlib.import_module(self._lazy_name)
+        return self._lazy_module
+
+    def __getattr__(self, item: str):
+        return getattr(self._load(), item)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """延迟导入模块，例如 np = lazy_import("numpy")"""
+    return LazyModule(name)
+
+
+@dataclass
+class WarmupTask:
+    """预热任务"""
+    name: str
+    func: object
+    status: str = "pending"  # pending / running / done / failed
+    seconds: float | None = None
+    error: str | None = None
+
+
+class WarmupRegistry:
+    """预热任务注册表"""
+
+    def __init__(self):
+        self._tasks: dict[str, WarmupTask] = {}
+        self._started = False
+
+    def register(self, name: str, func) -> None:
+        """注册预热函数（同步函数在线程池中执行，异步函数直接 await）"""
+        self._tasks[name] = WarmupTask(name=name, func=func)
+
+    async def _run_one(self, task: WarmupTask) -> None:
+        task.status = "running"
+        start = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(task.func):
+                await task.func()
+            else:
+                await asyncio.to_thread(task.func)
+            task.status = "done"
+        except Exception as e:
+            task.status = "failed"
+            task.error = f"{type(e).__name__}: {e}"
+            logger.exception("预热任务 %s 失败", task.name)
+        finally:
+            task.seconds = round(time.perf_counter() - start, 3)
+
+    def run_sync(self) -> None:
+        """在当前线程依次执行同步预热任务（fork 前调用，不创建线程与事件循环）"""
+        for task in self._tasks.values():
+            if task.status != "pending" or inspect.iscoroutinefunction(task.func):
+                continue
+            task.status = "running"
+            start = time.perf_counter()
+            try:
+                task.func()
+                task.status = "done"
+            except Exception as e:
+                # 留给 worker 重试
+                task.status = "pending"
+                logger.warning("预加载任务 %s 失败，将由 worker 重试: %s", task.name, e)
+            finally:
+                task.seconds = round(time.perf_counter() - start, 3)
+
+    async def run_all(self) -> None:
+        """并发执行所有预热任务"""
+        self._started = True
+        await asyncio.gather(*(self._run_one(t) for t in self._tasks.values() if t.status == "pending"))
+
+    def mark_skipped(self) -> None:
+        """lazy 模式：不预热，直接视为就绪，依赖在首次使用时加载"""
+        self._started = True
+        for task in self._tasks.values():
+            if task.status == "pending":
+                task.status = "skipped"
+
+    @property
+    def ready(self) -> bool:
+        return self._started and all(t.status in ("done", "skipped") for t in self._tasks.values())
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "tasks": {
+                t.name: {"status": t.status, "seconds": t.seconds, "error": t.error}
+                for t in self._tasks.values()
+            },
+        }
+
+
+warmups = WarmupRegistry()
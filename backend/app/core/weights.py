@@ -0,0 +1,129 @@
+"""模型权重：单文件内存映射加载
+
+权重文件采用 safetensors 布局（8 字节小端头长度 + JSON 头 + 连续张量数据），
+以 np.memmap 只读映射，各张量是映射上的零拷贝视图：
+- 多个 worker 进程映射同一文件时共享页缓存，权重只占一份物理内存；
+- gunicorn 预加载模式下在 master 中映射并预读，fork 出的 worker 直接继承映射。
+"""
+import json
+import logging
+import mmap
+import struct
+import threading
+from pathlib import Path
+
+from app.config import settings
+from app.core.warmup import lazy_import, warmups
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+
+# safetensors dtype -> numpy dtype 名称（字符串，导入本模块时不加载 numpy）
+DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8",
+    "U8": "uint8", "BOOL": "bool",
+}
+DTYPE_NAMES = {v: k for k, v in DTYPES.items()}
+ALIGNMENT = 64
+
+
+def save_weights(path: str | Path, tensors: "dict[str, np.ndarray]", metadata: dict[str, str] | None = None) -> None:
+    """写出 safetensors 格式的权重文件"""
+    header, offset = {}, 0
+    for name, array in tensors.items():
+        size = array.nbytes
+        header[name] = {
+            "dtype": DTYPE_NAMES[array.dtype.name],
+            "shape": list(array.shape),
+            "data_offsets": [offset, offset + size],
+        }
+        offset += size
+    if metadata:
+        header["__metadata__"] = metadata
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    # 头部补空格使数据区按 ALIGNMENT 对齐
+    encoded += b" " * (-(8 + len(encoded)) % ALIGNMENT)
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        for array in tensors.values():
+            f.write(np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<"), copy=False).tobytes())
+    tmp.replace(path)
+
+
+def _map_weights(path: str | Path) -> "tuple[np.memmap, dict[str, np.ndarray]]":
+    raw = np.memmap(path, dtype=np.uint8, mode="r")
+    (header_size,) = struct.unpack("<Q", raw[:8].tobytes())
+    header = json.loads(raw[8:8 + header_size].tobytes())
+    header.pop("__metadata__", None)
+    base = 8 + header_size
+    tensors = {}
+    for name, spec in header.items():
+        start, end = spec["data_offsets"]
+        dtype = np.dtype(DTYPES[spec["dtype"]]).newbyteorder("<")
+        tensors[name] = raw[base + start:base + end].view(dtype).reshape(spec["shape"])
+    return raw, tensors
+
+
+def load_weights(path: str | Path) -> "dict[str, np.ndarray]":
+    """只读映射权重文件，返回 {张量名: 零拷贝视图}"""
+    return _map_weights(path)[1]
+
+
+class WeightStore:
+    """按名称注册、首次使用时映射的模型权重"""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self._files: dict[str, str] = {}
+        self._loaded: "dict[str, dict[str, np.ndarray]]" = {}
+        self._maps: "dict[str, np.memmap]" = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, filename: str) -> None:
+        """注册模型权重文件，并登记预热任务（文件不存在时跳过）"""
+        self._files[name] = filename
+        warmups.register(f"weights.{name}", lambda: self.get(name))
+
+    def path(self, name: str) -> Path:
+        return self.root / self._files[name]
+
+    def get(self, name: str) -> "dict[str, np.ndarray] | None":
+        """返回模型的张量字典；权重文件尚未部署时返回 None（调用方走占位逻辑）"""
+        tensors = self._loaded.get(name)
+        if tensors is not None:
+            return tensors
+        with self._lock:
+            if name not in self._loaded:
+                path = self.path(name)
+                if not path.exists():
+                    return None
+                self._maps[name], self._loaded[name] = _map_weights(path)
+                logger.info("已映射模型权重 %s (%s)", name, path)
+        return self._loaded[name]
+
+    def preload(self, touch: bool = True) -> dict[str, int]:
+        """映射全部已部署的权重，返回各文件字节数；touch 时预读所有页，避免 worker 首个请求触发磁盘读"""
+        loaded = {}
+        for name in self._files:
+            if self.get(name) is None:
+                continue
+            raw = self._maps[name]
+            if touch and raw.size:
+                raw._mmap.madvise(mmap.MADV_WILLNEED)
+                int(raw[::mmap.PAGESIZE].sum())
+            loaded[name] = raw.size
+        return loaded
+
+    def status(self) -> dict:
+        return {
+            name: {"path": str(self.path(name)), "loaded": name in self._loaded}
+            for name in self._files
+        }
+
+
+weights = WeightStore(settings.weights_dir)
@@ -2,15 +2,54 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sess
 from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
+from app.core import tracing
+from app.core.metrics import instrument_engine
 
-engine = create_async_engine(settings.database_url, echo=True)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+class TracedSession(AsyncSession):
+    """提交、刷新与回滚记录追踪跨度（其中的 SQL 执行由引擎事件记录为子跨度）"""
+
+    async def commit(self) -> None:
+        with tracing.span("db.commit", tracing.KIND_CLIENT):
+            await super().commit()
+
+    async def flush(self, objects=None) -> None:
+        with tracing.span("db.flush", tracing.KIND_CLIENT):
+            await super().flush(objects)
+
+    async def refresh(self, instance, attribute_names=None, with_for_update=None) -> None:
+        with tracing.span("db.refresh", tracing.KIND_CLIENT, {"db.entity": type(instance).__name__}):
+            await super().refresh(instance, attribute_names, with_for_update)
+
+    async def rollback(self) -> None:
+        with tracing.span("db.rollback", tracing.KIND_CLIENT):
+            await super().rollback()
+
+
+engine = create_async_engine(settings.database_url, echo=settings.database_echo)
+if settings.metrics_enabled:
+    instrument_engine(engine)
+if tracing.tracer.enabled:
+    tracing.instrument_engine(engine)
+async_session = async_sessionmaker(engine, class_=TracedSession, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def dialect_insert(db: AsyncSession):
+    """按方言返回支持 on_conflict_do_update 的 insert 构造函数（PostgreSQL / SQLite）"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"upsert 不支持 {dialect}")
+    return insert
+
+
 async def get_db():
     async with async_session() as session:
         yield session
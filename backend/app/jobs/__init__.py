@@ -0,0 +1 @@
+# 批处理任务与命令行入口
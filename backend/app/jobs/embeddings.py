@@ -0,0 +1,50 @@
+"""相似病例向量索引维护命令行
+
+上传与批量导入时自动写入索引；以下命令用于历史数据回填与 IVF 聚类中心训练。
+
+用法（在 backend 目录下）:
+    python -m app.jobs.embeddings backfill              # 为尚未入索引的图片计算向量
+    python -m app.jobs.embeddings train --lists 1024    # 训练聚类中心并压缩已删除行，建议数据量翻倍后重跑
+    python -m app.jobs.embeddings stats
+"""
+import argparse
+import asyncio
+import json
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.services.embeddings import EmbeddingService, embedding_index
+
+
+async def run(args) -> None:
+    try:
+        if args.command == "backfill":
+            with tracing.job("embeddings.backfill"):
+                async with async_session() as db:
+                    result = await EmbeddingService.backfill(db, args.batch_size, args.workers)
+        elif args.command == "train":
+            result = await asyncio.to_thread(embedding_index.train, args.lists, args.iterations)
+        else:
+            result = {
+                "rows": embedding_index.size,
+                "lists": 0 if embedding_index.centroids is None else len(embedding_index.centroids),
+                "generation": embedding_index.meta.get("generation", 0),
+                "treatments": embedding_index.meta.get("treatments", []),
+            }
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="维护人脸向量相似检索索引")
+    parser.add_argument("command", choices=["backfill", "train", "stats"])
+    parser.add_argument("--batch-size", type=int, default=500, help="backfill 每批处理的图片数")
+    parser.add_argument("--workers", type=int, default=None, help="backfill 向量计算进程数，默认 CPU 核数")
+    parser.add_argument("--lists", type=int, default=None, help="IVF 列表数，默认 sqrt(行数)")
+    parser.add_argument("--iterations", type=int, default=10, help="k-means 迭代次数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""历史照片批量导入命令行
+
+用法（在 backend 目录下）:
+    python -m app.jobs.ingest /data/clinic-a --user-id 3
+    python -m app.jobs.ingest archive.zip --user-id 3 --issue-types acne,spot,wrinkle
+    tar -cf - photos/ | python -m app.jobs.ingest - --user-id 3 --checkpoint ingest.ckpt
+
+中断后使用相同的 --checkpoint 重跑即可从断点继续。
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.models.facesim import SkinIssueType
+from app.services.ingest import IngestService, IngestStats
+
+
+def _issue_types(value: str) -> list[SkinIssueType]:
+    return [SkinIssueType(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def _print_progress(stats: IngestStats) -> None:
+    print(
+        f"已读取 {stats.read}，导入 {stats.imported}，重复 {stats.duplicates}，"
+        f"失败 {stats.failed}，{stats.images_per_second:.1f} 张/秒",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+async def run(args) -> dict:
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.source != "-":
+        checkpoint = Path(f"{Path(args.source).name}.ingest-checkpoint")
+    try:
+        with tracing.job("ingest"):
+            async with async_session() as db:
+                stats = await IngestService.ingest(
+                    db,
+                    args.user_id,
+                    args.source,
+                    args.issue_types,
+                    workers=args.workers,
+                    batch_size=args.batch_size,
+                    max_in_flight=args.max_in_flight,
+                    checkpoint_path=checkpoint,
+                    on_progress=_print_progress,
+                    progress_interval=args.progress_interval,
+                )
+        return stats.as_dict()
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量导入历史照片并完成质检与皮肤分析")
+    parser.add_argument("source", help="目录、zip / tar 归档，或 - 表示从 stdin 读取 tar 流")
+    parser.add_argument("--user-id", type=int, required=True, help="照片归属用户")
+    parser.add_argument("--issue-types", type=_issue_types, default=[SkinIssueType.ACNE, SkinIssueType.SPOT],
+                        help="逗号分隔的检测类型，默认 acne,spot")
+    parser.add_argument("--workers", type=int, help="进程数，默认 CPU 核数")
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--max-in-flight", type=int)
+    parser.add_argument("--checkpoint", type=Path, help="断点文件，默认 <源名称>.ingest-checkpoint")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="进度输出间隔秒数")
+
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
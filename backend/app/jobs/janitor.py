@@ -0,0 +1,44 @@
+"""清理任务命令行
+
+用法（在 backend 目录下）:
+    python -m app.jobs.janitor                  # 执行一轮
+    python -m app.jobs.janitor --dry-run        # 只统计，不修改
+    python -m app.jobs.janitor --interval 600   # 常驻，每 10 分钟执行一轮
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.services.janitor import JanitorService
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args) -> dict:
+    try:
+        while True:
+            with tracing.job("janitor"):
+                async with async_session() as db:
+                    report = await JanitorService.run(db, dry_run=args.dry_run)
+            print(json.dumps(report.as_dict(), ensure_ascii=False), flush=True)
+            if not args.interval:
+                return report.as_dict()
+            await asyncio.sleep(args.interval)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="标记卡住的模拟、清理孤儿文件并执行数据保留策略")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改数据库与文件")
+    parser.add_argument("--interval", type=int, default=0, help="常驻运行的间隔秒数，0 表示只执行一轮")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""分区维护与归档命令行
+
+用法（在 backend 目录下，建议每天由 cron / k8s CronJob 执行 maintain 与 archive）:
+    python -m app.jobs.partitions maintain [--months-ahead 3]
+    python -m app.jobs.partitions archive [--retention-months 12] [--archive-dir archive]
+    python -m app.jobs.partitions list
+    python -m app.jobs.partitions query simulations --from 2024-01 --to 2024-03 --where user_id=1
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, datetime
+from pathlib import Path
+
+from app.core import tracing
+from app.database import engine
+from app.services.partitioning import PARTITIONED_TABLES, PartitionService
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def _where(items: list[str]) -> dict:
+    filters = {}
+    for item in items or []:
+        column, value = item.split("=", 1)
+        filters[column] = int(value) if value.lstrip("-").isdigit() else value
+    return filters
+
+
+async def run(args) -> object:
+    if args.command == "query":
+        return PartitionService.query_archive(
+            args.table, args.start, args.end, _where(args.where), args.limit, args.archive_dir
+        )
+
+    try:
+        with tracing.job(f"partitions.{args.command}"):
+            async with engine.connect() as conn:
+                if args.command == "maintain":
+                    created = await PartitionService.ensure_partitions(conn, args.months_ahead)
+                    await conn.commit()
+                    return {"created": created}
+                if args.command == "archive":
+                    return {"archived": await PartitionService.archive_expired(
+                        conn, args.retention_months, args.archive_dir
+                    )}
+                if args.command == "list":
+                    return {
+                        table: [p.name for p in await PartitionService.list_partitions(conn, table)]
+                        for table in PARTITIONED_TABLES
+                    }
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="分区维护与冷数据归档")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    maintain = sub.add_parser("maintain", help="创建当月及未来月份的分区")
+    maintain.add_argument("--months-ahead", type=int)
+
+    archive = sub.add_parser("archive", help="归档超过保留期的分区")
+    archive.add_argument("--retention-months", type=int)
+    archive.add_argument("--archive-dir", type=Path)
+
+    sub.add_parser("list", help="列出现有分区")
+
+    query = sub.add_parser("query", help="查询已归档数据")
+    query.add_argument("table", choices=PARTITIONED_TABLES)
+    query.add_argument("--from", dest="start", type=_month)
+    query.add_argument("--to", dest="end", type=_month)
+    query.add_argument("--where", action="append", help="列等值条件，如 user_id=1，可重复")
+    query.add_argument("--limit", type=int, default=100)
+    query.add_argument("--archive-dir", type=Path)
+
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""批量开通员工账号命令行
+
+CSV 首行为表头，列：username, email, password, role（role 为空时使用 --role），
+支持 Excel 导出的带 BOM 的 UTF-8 文件。
+
+用法（在 backend 目录下）:
+    python -m app.jobs.provision_users staff.csv --dry-run
+    python -m app.jobs.provision_users staff.csv --role consultant --workers 8
+
+逐行输出失败原因（CSV 行号），其余行照常开通；存在失败行时退出码为 1。
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from pathlib import Path
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.models.user import UserRole
+from app.services.provisioning import ProvisioningService
+
+FIRST_DATA_LINE = 2  # 表头占第 1 行
+
+
+def read_users(path: Path, default_role: UserRole | None) -> tuple[list[dict], list[int]]:
+    """读取 CSV，返回 (原始行, 对应的 CSV 行号)；格式校验由 ProvisioningService 逐行完成"""
+    records, lines = [], []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line, record in enumerate(csv.DictReader(f), start=FIRST_DATA_LINE):
+            record = {k.strip(): (v or "").strip() for k, v in record.items() if k}
+            if not record.get("role") and default_role is not None:
+                record["role"] = default_role.value
+            records.append(record)
+            lines.append(line)
+    return records, lines
+
+
+async def run(args) -> dict:
+    records, lines = read_users(args.csv, args.role)
+    try:
+        with tracing.job("provision_users"):
+            async with async_session() as db:
+                result = await ProvisioningService.provision(db, records, workers=args.workers, dry_run=args.dry_run)
+    finally:
+        await engine.dispose()
+
+    errors = [
+        {
+            "line": lines[e.row],
+            "username": e.username,
+            "field": e.field,
+            "message": e.message if e.duplicate_of is None else f"{e.message}（第 {lines[e.duplicate_of]} 行）",
+        }
+        for e in result.errors
+    ]
+    return {
+        "dry_run": args.dry_run,
+        "rows": len(records),
+        "created": len(result.created),
+        "errors": sorted(errors, key=lambda e: e["line"]),
+        "elapsed_seconds": round(result.elapsed, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="从 CSV 批量开通员工账号")
+    parser.add_argument("csv", type=Path, help="账号清单 CSV")
+    parser.add_argument("--role", type=UserRole, help="role 列为空时使用的角色")
+    parser.add_argument("--workers", type=int, help="密码哈希进程数，默认 CPU 核数")
+    parser.add_argument("--dry-run", action="store_true", help="只校验，不写库")
+
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
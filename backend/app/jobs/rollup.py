@@ -0,0 +1,45 @@
+"""汇总表维护命令行
+
+用法（在 backend 目录下）:
+    python -m app.jobs.rollup refresh                # 增量推进水位，建议每几分钟执行一次
+    python -m app.jobs.rollup refresh --interval 300 # 常驻运行
+    python -m app.jobs.rollup backfill               # 清空后按历史数据全量重算
+"""
+import argparse
+import asyncio
+import json
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.services.analytics import DEFAULT_CHUNK_SIZE, DEFAULT_LAG_SECONDS, AnalyticsService
+
+
+async def run(args) -> None:
+    try:
+        while True:
+            with tracing.job(f"rollup.{args.command}"):
+                async with async_session() as db:
+                    if args.command == "backfill":
+                        result = await AnalyticsService.backfill(db, chunk_size=args.chunk_size)
+                    else:
+                        result = await AnalyticsService.refresh(db, args.lag_seconds, args.chunk_size)
+            print(json.dumps({"processed": result}, ensure_ascii=False), flush=True)
+            if args.command == "backfill" or not args.interval:
+                return
+            await asyncio.sleep(args.interval)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="维护模拟与海报的周汇总表")
+    parser.add_argument("command", choices=["refresh", "backfill"])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每个事务处理的 id 区间")
+    parser.add_argument("--lag-seconds", type=int, default=DEFAULT_LAG_SECONDS,
+                        help="只汇总早于该秒数之前创建的行，避开未提交事务")
+    parser.add_argument("--interval", type=int, default=0, help="refresh 常驻运行的间隔秒数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""检索索引重建命令行
+
+索引随海报 / 模板写入增量维护，仅在首次上线或分词规则变更后需要重建。
+
+用法（在 backend 目录下）:
+    python -m app.jobs.search_index rebuild
+"""
+import argparse
+import asyncio
+import json
+
+from app.core import tracing
+from app.database import async_session, engine
+from app.services.search import SearchService
+
+
+async def run(args) -> None:
+    try:
+        with tracing.job("search_index.rebuild"):
+            async with async_session() as db:
+                result = await SearchService.rebuild(db, batch_size=args.batch_size)
+        print(json.dumps({"indexed": result}, ensure_ascii=False), flush=True)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="重建海报与模板的检索索引")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--batch-size", type=int, default=1000, help="每个事务索引的文档数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
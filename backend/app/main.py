@@ -1,11 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, brandguard, facesim
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from app.api import admin, analytics, auth, brandguard, facesim
+from app.config import settings
+from app.core.loopmonitor import loop_monitor
+from app.core.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from app.core.profiler import SlowRequestMiddleware
+from app.core.storage import storage
+from app.core.tracing import TracingMiddleware, tracer
+from app.core.warmup import warmups
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时按 warmup_mode 预热重依赖，并启动事件循环监控"""
+    if settings.loop_monitor_enabled:
+        loop_monitor.start(
+            settings.loop_monitor_interval_ms, settings.loop_block_threshold_ms, settings.loop_debug
+        )
+    warmup_task = None
+    if settings.warmup_mode == "eager":
+        await warmups.run_all()
+    elif settings.warmup_mode == "background":
+        warmup_task = asyncio.create_task(warmups.run_all())
+    else:
+        warmups.mark_skipped()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await storage.close()
+    await loop_monitor.stop()
+    await asyncio.to_thread(tracer.shutdown)
+
 
 app = FastAPI(
     title="AesthetiCore API",
     description="医美诊所一体化 AI 智能操作系统",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -16,12 +51,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(SlowRequestMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+# 最外层，根跨度覆盖其余中间件的耗时
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware)
+
 # 注册路由
 app.include_router(auth.router)
 app.include_router(brandguard.router)
 app.include_router(facesim.router)
+app.include_router(admin.router)
+app.include_router(analytics.router)
 
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """就绪探针：预热完成前返回 503，负载均衡据此决定是否导流"""
+    status = warmups.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus 指标"""
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,33 @@
+from datetime import date, datetime
+from sqlalchemy import String, Date, DateTime, Integer, BigInteger, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class SimulationWeeklyRollup(Base):
+    """模拟次数周汇总（按用户、治疗类型）"""
+    __tablename__ = "simulation_weekly_rollups"
+
+    week: Mapped[date] = mapped_column(Date, primary_key=True)  # 周一
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    treatment_type: Mapped[str] = mapped_column(String(100), primary_key=True)
+    simulations: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class PosterWeeklyRollup(Base):
+    """海报生成与合规问题周汇总（按用户）"""
+    __tablename__ = "poster_weekly_rollups"
+
+    week: Mapped[date] = mapped_column(Date, primary_key=True)  # 周一
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    posters: Mapped[int] = mapped_column(Integer, default=0)
+    violations: Mapped[int] = mapped_column(Integer, default=0)  # 存在合规问题的海报数
+
+
+class RollupWatermark(Base):
+    """汇总进度水位：源表中已计入汇总的最大 id"""
+    __tablename__ = "rollup_watermarks"
+
+    source: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_id: Mapped[int] = mapped_column(BigInteger, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
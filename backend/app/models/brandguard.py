@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, DateTime, Text, JSON, Integer, ForeignKey
+from sqlalchemy import String, DateTime, Text, JSON, Integer, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 
@@ -28,13 +28,45 @@ class PosterTemplate(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     name: Mapped[str] = mapped_column(String(100))
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
-    layout_config: Mapped[dict] = mapped_column(JSON)  # 布局配置
+    layout_hash: Mapped[str] = mapped_column(ForeignKey("layout_nodes.hash"))  # 当前版本布局的根节点
+    version: Mapped[int] = mapped_column(Integer, default=1)  # 当前版本号
+    forked_from_id: Mapped[int | None] = mapped_column(ForeignKey("poster_templates.id"), nullable=True)
     width: Mapped[int] = mapped_column(Integer, default=1080)
     height: Mapped[int] = mapped_column(Integer, default=1920)
     thumbnail_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # 物化后的布局配置（不对应数据库列），由 BrandGuardService 按 layout_hash 从布局节点还原后填充
+    layout_config = None
+
+
+class PosterTemplateVersion(Base):
+    """海报模板版本：每次修改布局记录一个根节点哈希"""
+    __tablename__ = "poster_template_versions"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    template_id: Mapped[int] = mapped_column(ForeignKey("poster_templates.id"), index=True)
+    number: Mapped[int] = mapped_column(Integer)
+    layout_hash: Mapped[str] = mapped_column(ForeignKey("layout_nodes.hash"))
+    # 上一版本；复制出的模板，首个版本指向来源模板当时的版本
+    parent_id: Mapped[int | None] = mapped_column(ForeignKey("poster_template_versions.id"), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("template_id", "number", name="uq_poster_template_versions_number"),
+    )
+
+
+class LayoutNode(Base):
+    """布局内容寻址节点：不可变，哈希为节点规范 JSON 的 SHA-256，较大的子树以 {"$ref": 哈希} 引用"""
+    __tablename__ = "layout_nodes"
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    body: Mapped[dict | list] = mapped_column(JSON)
+    size: Mapped[int] = mapped_column(Integer)  # 规范 JSON 字节数
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 
 class GeneratedPoster(Base):
     """生成的海报模型"""
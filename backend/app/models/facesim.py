@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from sqlalchemy import String, DateTime, Integer, Text, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import String, DateTime, Integer, Text, ForeignKey, Enum as SQLEnum, JSON, LargeBinary, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 
@@ -33,7 +33,8 @@ class FaceImage(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
-    file_path: Mapped[str] = mapped_column(String(500))
+    file_path: Mapped[str] = mapped_column(String(500), index=True)
+    content_hash: Mapped[str | None] = mapped_column(String(64), default=None)  # 文件内容 SHA-256，用于去重
     quality_status: Mapped[ImageQualityStatus] = mapped_column(
         SQLEnum(ImageQualityStatus), default=ImageQualityStatus.PENDING
     )
@@ -41,6 +42,10 @@ class FaceImage(Base):
     quality_issues: Mapped[dict | None] = mapped_column(JSON, default=None)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_face_images_user_hash", "user_id", "content_hash"),
+    )
+
     # 关系
     analyses: Mapped[list["SkinAnalysis"]] = relationship(back_populates="image", cascade="all, delete-orphan")
 
@@ -53,13 +58,41 @@ class SkinAnalysis(Base):
     image_id: Mapped[int] = mapped_column(ForeignKey("face_images.id"), index=True)
     issue_type: Mapped[SkinIssueType] = mapped_column(SQLEnum(SkinIssueType))
     severity: Mapped[int] = mapped_column(Integer)  # 严重程度 1-10
-    detected_areas: Mapped[dict] = mapped_column(JSON)  # 检测区域坐标
+    detected_areas: Mapped[dict] = mapped_column(JSON)  # 检测附加信息（旧数据含 regions 坐标）
     confidence: Mapped[float] = mapped_column()  # 置信度
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    # 紧凑存储，编解码见 app.services.lesions
+    boxes: Mapped[bytes | None] = mapped_column(LargeBinary, default=None)  # int16 (x, y, w, h) 数组
+    mask_rle: Mapped[bytes | None] = mapped_column(LargeBinary, default=None)  # 游程编码掩码
+    region_count: Mapped[int] = mapped_column(Integer, default=0)
+    frame_width: Mapped[int | None] = mapped_column(Integer, default=None)  # 检测时的画面尺寸
+    frame_height: Mapped[int | None] = mapped_column(Integer, default=None)
+    # 全部检测框的外包框，用于查询时在 SQL 中预过滤
+    bbox_x0: Mapped[int | None] = mapped_column(Integer, default=None)
+    bbox_y0: Mapped[int | None] = mapped_column(Integer, default=None)
+    bbox_x1: Mapped[int | None] = mapped_column(Integer, default=None)
+    bbox_y1: Mapped[int | None] = mapped_column(Integer, default=None)
+
+    __table_args__ = (
+        Index("ix_skin_analyses_image_issue", "image_id", "issue_type"),
+    )
+
     # 关系
     image: Mapped["FaceImage"] = relationship(back_populates="analyses")
-    simulations: Mapped[list["Simulation"]] = relationship(back_populates="analysis", cascade="all, delete-orphan")
+    simulations: Mapped[list["Simulation"]] = relationship(
+        back_populates="analysis",
+        cascade="all, delete-orphan",
+        primaryjoin="SkinAnalysis.id == foreign(Simulation.analysis_id)",
+    )
+
+    @property
+    def areas(self) -> dict:
+        """检测区域（保持 {"regions": [...]} 结构，新数据从紧凑列解码）"""
+        if self.boxes is None:
+            return self.detected_areas
+        from app.services.lesions import boxes_to_regions
+        return {**(self.detected_areas or {}), "regions": boxes_to_regions(self.boxes)}
 
 
 class Simulation(Base):
@@ -67,11 +100,12 @@ class Simulation(Base):
     __tablename__ = "simulations"
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    analysis_id: Mapped[int] = mapped_column(ForeignKey("skin_analyses.id"), index=True)
+    # 两表按 created_at 分区后主键为 (id, created_at)，不能建外键，由应用层保证一致性（见迁移 0002）
+    analysis_id: Mapped[int] = mapped_column(Integer, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     treatment_type: Mapped[str] = mapped_column(String(100))  # 治疗类型
-    simulated_image_path: Mapped[str] = mapped_column(String(500))
-    comparison_image_path: Mapped[str | None] = mapped_column(String(500), default=None)
+    simulated_image_path: Mapped[str] = mapped_column(String(500), index=True)
+    comparison_image_path: Mapped[str | None] = mapped_column(String(500), default=None, index=True)
     status: Mapped[SimulationStatus] = mapped_column(
         SQLEnum(SimulationStatus), default=SimulationStatus.PROCESSING
     )
@@ -80,4 +114,7 @@ class Simulation(Base):
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, default=None)
 
     # 关系
-    analysis: Mapped["SkinAnalysis"] = relationship(back_populates="simulations")
+    analysis: Mapped["SkinAnalysis"] = relationship(
+        back_populates="simulations",
+        primaryjoin="SkinAnalysis.id == foreign(Simulation.analysis_id)",
+    )
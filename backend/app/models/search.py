@@ -0,0 +1,31 @@
+from sqlalchemy import String, Integer, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+# PostgreSQL 下词元列使用 "C" 排序规则：单字前缀查询 LIKE '字%' 可直接走主键 B 树范围扫描
+# （非 C 排序规则下 LIKE 前缀无法使用普通 B 树索引）
+TOKEN_TYPE = String(32).with_variant(String(32, collation="C"), "postgresql")
+
+
+class SearchPosting(Base):
+    """倒排索引：词元 -> 文档（主键顺序保证按 所有者+词元 的范围扫描）"""
+    __tablename__ = "search_postings"
+
+    owner_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    token: Mapped[str] = mapped_column(TOKEN_TYPE, primary_key=True)  # 中文二元组或英文/数字词
+    doc_type: Mapped[str] = mapped_column(String(16), primary_key=True)  # poster / template
+    doc_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    weight: Mapped[int] = mapped_column(Integer, default=1)  # 词频，标题中出现加权
+
+    __table_args__ = (
+        Index("ix_search_postings_doc", "doc_type", "doc_id"),
+    )
+
+
+class SearchTerm(Base):
+    """词元文档频次，用于选择最稀有词元驱动求交与打分"""
+    __tablename__ = "search_terms"
+
+    owner_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    token: Mapped[str] = mapped_column(TOKEN_TYPE, primary_key=True)
+    doc_count: Mapped[int] = mapped_column(Integer, default=0)
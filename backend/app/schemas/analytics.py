@@ -0,0 +1,26 @@
+from datetime import date, datetime
+from pydantic import BaseModel
+
+
+class TreatmentWeeklyItem(BaseModel):
+    week: date
+    treatment_type: str
+    simulations: int
+
+
+class TreatmentWeeklyResponse(BaseModel):
+    as_of: datetime | None  # 汇总最近一次推进水位的时间
+    items: list[TreatmentWeeklyItem]
+
+
+class PosterComplianceItem(BaseModel):
+    user_id: int
+    username: str
+    posters: int
+    violations: int
+    violation_rate: float
+
+
+class PosterComplianceResponse(BaseModel):
+    as_of: datetime | None
+    items: list[PosterComplianceItem]
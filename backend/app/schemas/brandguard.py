@@ -1,5 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel, Field
+from typing import Any, Literal
+from pydantic import BaseModel, Field, model_validator
 
 
 class VIConfigBase(BaseModel):
@@ -47,9 +48,22 @@ class PosterTemplateCreate(PosterTemplateBase):
     pass
 
 
+class PosterTemplateUpdate(BaseModel):
+    name: str | None = Field(None, max_length=100)
+    description: str | None = None
+    layout_config: dict | None = None  # 整份替换；只改个别字段用 PATCH .../layout
+    width: int | None = Field(None, ge=100, le=4096)
+    height: int | None = Field(None, ge=100, le=4096)
+    thumbnail_url: str | None = None
+    base_version: int | None = Field(None, description="编辑所基于的版本号，与当前版本不一致时返回 409")
+
+
 class PosterTemplateResponse(PosterTemplateBase):
     id: int
     user_id: int
+    layout_hash: str  # 布局根节点哈希，子树见 GET /brandguard/layouts/{hash}
+    version: int
+    forked_from_id: int | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -57,6 +71,49 @@ class PosterTemplateResponse(PosterTemplateBase):
         from_attributes = True
 
 
+# 模板版本
+class LayoutPatchOperation(BaseModel):
+    """JSON Patch（RFC 6902）操作，path 为 JSON Pointer，如 /layers/2/text"""
+    op: Literal["add", "replace", "remove"]
+    path: str
+    value: Any = None
+
+    @model_validator(mode="after")
+    def check_value(self):
+        if self.op != "remove" and "value" not in self.model_fields_set:
+            raise ValueError(f"{self.op} 操作需要 value")
+        return self
+
+
+class LayoutPatchRequest(BaseModel):
+    operations: list[LayoutPatchOperation] = Field(..., min_length=1, max_length=500)
+    base_version: int | None = Field(None, description="编辑所基于的版本号，与当前版本不一致时返回 409")
+
+
+class TemplateForkRequest(BaseModel):
+    name: str | None = Field(None, max_length=100, description="默认沿用来源模板名称")
+
+
+class TemplateVersionResponse(BaseModel):
+    id: int
+    template_id: int
+    number: int
+    layout_hash: str
+    parent_id: int | None  # 上一版本的 id，复制出的模板首个版本指向来源模板的版本
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class LayoutDiffResponse(BaseModel):
+    template_id: int
+    version: int
+    base_template_id: int
+    base_version: int
+    operations: list[dict]  # 从基准到当前版本的 JSON Patch
+
+
 class GeneratePosterRequest(BaseModel):
     template_id: int | None = None
     title: str = Field(..., max_length=200)
@@ -86,3 +143,18 @@ class ComplianceCheckRequest(BaseModel):
 class ComplianceCheckResponse(BaseModel):
     is_compliant: bool
     issues: list[str]
+
+
+# 检索
+class SearchHit(BaseModel):
+    doc_type: Literal["poster", "template"]
+    id: int
+    title: str
+    snippet: str
+    score: float
+    created_at: datetime
+
+
+class SearchResponse(BaseModel):
+    total: int
+    items: list[SearchHit]
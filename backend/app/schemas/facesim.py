@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field, computed_field
 from app.models.facesim import ImageQualityStatus, SkinIssueType, SimulationStatus
 
 
@@ -12,6 +12,11 @@ class ImageUploadResponse(BaseModel):
     quality_issues: dict | None = None
     created_at: datetime
 
+    @computed_field
+    @property
+    def file_url(self) -> str:
+        return f"/facesim/images/{self.id}/file"
+
     class Config:
         from_attributes = True
 
@@ -27,7 +32,7 @@ class SkinAnalysisResult(BaseModel):
     image_id: int
     issue_type: SkinIssueType
     severity: int
-    detected_areas: dict
+    detected_areas: dict = Field(validation_alias=AliasChoices("areas", "detected_areas"))
     confidence: float
     created_at: datetime
 
@@ -35,11 +40,51 @@ class SkinAnalysisResult(BaseModel):
         from_attributes = True
 
 
+# 会诊预取包内的分析记录，附检测时的画面尺寸，便于在缩放后的图片上叠加检测框
+class BundleAnalysis(SkinAnalysisResult):
+    region_count: int
+    frame_width: int | None = None
+    frame_height: int | None = None
+
+
 class SkinAnalysisResponse(BaseModel):
     image_id: int
     analyses: list[SkinAnalysisResult]
 
 
+# 皮损空间查询
+class LesionItem(BaseModel):
+    analysis_id: int
+    issue_type: SkinIssueType
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class LesionQueryResponse(BaseModel):
+    image_id: int
+    count: int
+    items: list[LesionItem]
+
+
+# 相似病例
+class SimilarImage(BaseModel):
+    image_id: int
+    score: float
+    created_at: datetime
+
+    @computed_field
+    @property
+    def file_url(self) -> str:
+        return f"/facesim/images/{self.image_id}/file"
+
+
+class SimilarImagesResponse(BaseModel):
+    image_id: int
+    items: list[SimilarImage]
+
+
 # 模拟效果
 class SimulationCreate(BaseModel):
     analysis_id: int
@@ -59,6 +104,18 @@ class SimulationDetail(BaseModel):
     created_at: datetime
     completed_at: datetime | None
 
+    @computed_field
+    @property
+    def simulated_image_url(self) -> str:
+        return f"/facesim/simulations/{self.id}/files/simulated"
+
+    @computed_field
+    @property
+    def comparison_image_url(self) -> str | None:
+        if self.comparison_image_path is None:
+            return None
+        return f"/facesim/simulations/{self.id}/files/comparison"
+
     class Config:
         from_attributes = True
 
@@ -1,5 +1,7 @@
 from datetime import datetime
+from typing import Any
 from pydantic import BaseModel, EmailStr, Field
+from app.config import settings
 from app.models.user import UserRole
 
 
@@ -25,6 +27,34 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserBulkCreate(BaseModel):
+    """批量开通 Schema"""
+    # 每行按 UserCreate 单独校验，格式错误的行记入 errors，不影响其余行
+    users: list[Any] = Field(..., min_length=1, max_length=settings.provision_max_batch)
+    dry_run: bool = False  # 只校验不写库
+
+
+class UserBulkCreated(BaseModel):
+    row: int
+    id: int
+    username: str
+
+
+class UserBulkError(BaseModel):
+    row: int  # 在 users 中的序号（从 0 开始）
+    username: str | None
+    field: str | None
+    message: str
+    duplicate_of: int | None = None  # 批次内重复时，首次出现的行序号
+
+
+class UserBulkResponse(BaseModel):
+    """批量开通结果：校验失败的行不影响其余行"""
+    created: list[UserBulkCreated]
+    errors: list[UserBulkError]
+    elapsed_seconds: float
+
+
 class Token(BaseModel):
     """Token 响应"""
     access_token: str
@@ -0,0 +1,233 @@
+"""增量汇总：模拟与海报的周维度统计
+
+按源表自增 id 维护水位（rollup_watermarks），每次只聚合水位之后的新行并 upsert 到汇总表，
+汇总与水位在同一事务中提交并锁定水位行，重复或并发执行都不会重复计数。
+为避免并发事务晚提交导致的 id 空洞被跳过，只处理 created_at 早于 lag_seconds 之前的行。
+看板查询只读汇总表，代价与桶数量成正比，与原始行数无关。
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, Text, case, cast, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import dialect_insert
+from app.models.analytics import PosterWeeklyRollup, RollupWatermark, SimulationWeeklyRollup
+from app.models.brandguard import GeneratedPoster
+from app.models.facesim import Simulation
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAG_SECONDS = 60
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _dialect(db: AsyncSession) -> str:
+    return db.bind.dialect.name
+
+
+def week_start(db: AsyncSession, column):
+    """时间列 -> 所在周的周一"""
+    if _dialect(db) == "postgresql":
+        return cast(func.date_trunc("week", column), Date)
+    # SQLite：先退 6 天再前进到周一
+    return func.date(column, "-6 days", "weekday 1")
+
+
+def _as_date(value) -> date:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def _upsert(db: AsyncSession, model, rows: list[dict], keys: list[str], measures: list[str]) -> None:
+    """按主键累加计数"""
+    if not rows:
+        return
+    stmt = dialect_insert(db)(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={m: getattr(model, m) + getattr(stmt.excluded, m) for m in measures},
+    )
+    await db.execute(stmt)
+
+
+async def _aggregate_simulations(db: AsyncSession, lo: int, hi: int) -> None:
+    week = week_start(db, Simulation.created_at)
+    result = await db.execute(
+        select(week, Simulation.user_id, Simulation.treatment_type, func.count())
+        .where(Simulation.id > lo, Simulation.id <= hi)
+        .group_by(week, Simulation.user_id, Simulation.treatment_type)
+    )
+    await _upsert(
+        db, SimulationWeeklyRollup,
+        [
+            {"week": _as_date(w), "user_id": u, "treatment_type": t, "simulations": n}
+            for w, u, t, n in result
+        ],
+        keys=["week", "user_id", "treatment_type"],
+        measures=["simulations"],
+    )
+
+
+async def _aggregate_posters(db: AsyncSession, lo: int, hi: int) -> None:
+    week = week_start(db, GeneratedPoster.created_at)
+    # compliance_issues 无问题时为 JSON null（或 SQL NULL）
+    has_issues = case((cast(GeneratedPoster.compliance_issues, Text).notin_(["null", "[]"]), 1), else_=0)
+    result = await db.execute(
+        select(week, GeneratedPoster.user_id, func.count(), func.sum(has_issues))
+        .where(GeneratedPoster.id > lo, GeneratedPoster.id <= hi)
+        .group_by(week, GeneratedPoster.user_id)
+    )
+    await _upsert(
+        db, PosterWeeklyRollup,
+        [
+            {"week": _as_date(w), "user_id": u, "posters": n, "violations": v or 0}
+            for w, u, n, v in result
+        ],
+        keys=["week", "user_id"],
+        measures=["posters", "violations"],
+    )
+
+
+@dataclass
+class RollupSource:
+    """汇总源"""
+    name: str
+    model: type
+    aggregate: object
+    rollups: tuple[type, ...]
+
+
+SOURCES = (
+    RollupSource("simulations", Simulation, _aggregate_simulations, (SimulationWeeklyRollup,)),
+    RollupSource("generated_posters", GeneratedPoster, _aggregate_posters, (PosterWeeklyRollup,)),
+)
+
+
+class AnalyticsService:
+    """汇总维护与看板查询服务"""
+
+    @staticmethod
+    async def _lock_watermark(db: AsyncSession, source: str) -> RollupWatermark | None:
+        """锁定并读取水位行（FOR UPDATE SKIP LOCKED），另一个刷新正持有该行时返回 None"""
+        await db.execute(
+            dialect_insert(db)(RollupWatermark)
+            .values(source=source, last_id=0)
+            .on_conflict_do_nothing(index_elements=["source"])
+        )
+        return await db.scalar(
+            select(RollupWatermark)
+            .where(RollupWatermark.source == source)
+            .with_for_update(skip_locked=True)
+            .execution_options(populate_existing=True)
+        )
+
+    @staticmethod
+    async def refresh(
+        db: AsyncSession,
+        lag_seconds: int = DEFAULT_LAG_SECONDS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> dict[str, int]:
+        """把水位之后的新行计入汇总，返回各源新处理的 id 区间长度
+
+        每个分块在同一事务内锁定水位行、聚合并推进水位；水位行被并发的刷新锁住时跳过该源，
+        累加式 upsert 不会被重复计数。
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=lag_seconds)
+        processed = {}
+        for source in SOURCES:
+            upper = await db.scalar(
+                select(func.max(source.model.id)).where(source.model.created_at < cutoff)
+            ) or 0
+            processed[source.name] = 0
+            while True:
+                watermark = await AnalyticsService._lock_watermark(db, source.name)
+                if watermark is None:
+                    logger.info("汇总源 %s 正由其他进程刷新，跳过", source.name)
+                    break
+                lo = watermark.last_id
+                if lo >= upper:
+                    break
+                hi = min(lo + chunk_size, upper)
+                await source.aggregate(db, lo, hi)
+                watermark.last_id = hi
+                watermark.updated_at = datetime.utcnow()
+                await db.commit()
+                processed[source.name] += hi - lo
+            await db.commit()
+        return processed
+
+    @staticmethod
+    async def backfill(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict[str, int]:
+        """清空汇总表与水位后全量重算"""
+        for source in SOURCES:
+            for rollup in source.rollups:
+                await db.execute(delete(rollup))
+        await db.execute(delete(RollupWatermark))
+        await db.commit()
+        return await AnalyticsService.refresh(db, chunk_size=chunk_size)
+
+    @staticmethod
+    async def watermarks(db: AsyncSession) -> dict[str, datetime | None]:
+        result = await db.execute(select(RollupWatermark.source, RollupWatermark.updated_at))
+        return dict(result.all())
+
+    @staticmethod
+    async def simulations_by_treatment(
+        db: AsyncSession,
+        start: date | None = None,
+        end: date | None = None,
+        user_id: int | None = None
+    ) -> list[dict]:
+        """每周各治疗类型的模拟次数"""
+        conditions = []
+        if start is not None:
+            conditions.append(SimulationWeeklyRollup.week >= start)
+        if end is not None:
+            conditions.append(SimulationWeeklyRollup.week <= end)
+        if user_id is not None:
+            conditions.append(SimulationWeeklyRollup.user_id == user_id)
+        total = func.sum(SimulationWeeklyRollup.simulations)
+        result = await db.execute(
+            select(SimulationWeeklyRollup.week, SimulationWeeklyRollup.treatment_type, total)
+            .where(*conditions)
+            .group_by(SimulationWeeklyRollup.week, SimulationWeeklyRollup.treatment_type)
+            .order_by(SimulationWeeklyRollup.week, SimulationWeeklyRollup.treatment_type)
+        )
+        return [
+            {"week": _as_date(week), "treatment_type": treatment_type, "simulations": count}
+            for week, treatment_type, count in result
+        ]
+
+    @staticmethod
+    async def poster_compliance_by_user(
+        db: AsyncSession,
+        start: date | None = None,
+        end: date | None = None
+    ) -> list[dict]:
+        """各营销人员的海报数与合规问题率"""
+        conditions = []
+        if start is not None:
+            conditions.append(PosterWeeklyRollup.week >= start)
+        if end is not None:
+            conditions.append(PosterWeeklyRollup.week <= end)
+        posters = func.sum(PosterWeeklyRollup.posters)
+        violations = func.sum(PosterWeeklyRollup.violations)
+        result = await db.execute(
+            select(PosterWeeklyRollup.user_id, User.username, posters, violations)
+            .join(User, User.id == PosterWeeklyRollup.user_id)
+            .where(*conditions)
+            .group_by(PosterWeeklyRollup.user_id, User.username)
+            .order_by(violations.desc(), PosterWeeklyRollup.user_id)
+        )
+        return [
+            {
+                "user_id": user_id,
+                "username": username,
+                "posters": total,
+                "violations": flagged,
+                "violation_rate": round(flagged / total, 4) if total else 0.0,
+            }
+            for user_id, username, total, flagged in result
+        ]
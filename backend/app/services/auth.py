@@ -1,25 +1,32 @@
+import asyncio
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from app.models.user import User, UserRole
 from app.schemas.user import UserCreate, TokenData
 from app.config import settings
+from app.core.metrics import observe
+from app.core.warmup import warmups
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt 后端在首次哈希时才探测加载，放到预热阶段完成
+warmups.register("auth.bcrypt_backend", lambda: pwd_context.handler("bcrypt").get_backend())
 
 
 class AuthService:
     """认证服务"""
 
     @staticmethod
+    @observe("auth.hash_password")
     def hash_password(password: str) -> str:
         """哈希密码"""
         return pwd_context.hash(password)
 
     @staticmethod
+    @observe("auth.verify_password")
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """验证密码"""
         return pwd_context.verify(plain_password, hashed_password)
@@ -49,21 +56,23 @@ class AuthService:
     @staticmethod
     async def create_user(db: AsyncSession, user_data: UserCreate) -> User:
         """创建用户"""
-        # 检查用户名是否存在
-        result = await db.execute(select(User).where(User.username == user_data.username))
-        if result.scalar_one_or_none():
+        # 一条查询同时检查用户名与邮箱是否存在
+        result = await db.execute(
+            select(User.username, User.email).where(
+                or_(User.username == user_data.username, User.email == user_data.email)
+            )
+        )
+        existing = result.all()
+        if any(username == user_data.username for username, _ in existing):
             raise HTTPException(status_code=400, detail="用户名已存在")
-
-        # 检查邮箱是否存在
-        result = await db.execute(select(User).where(User.email == user_data.email))
-        if result.scalar_one_or_none():
+        if existing:
             raise HTTPException(status_code=400, detail="邮箱已存在")
 
         # 创建用户
         user = User(
             username=user_data.username,
             email=user_data.email,
-            hashed_password=AuthService.hash_password(user_data.password),
+            hashed_password=await asyncio.to_thread(AuthService.hash_password, user_data.password),
             role=user_data.role,
         )
         db.add(user)
@@ -77,7 +86,8 @@ class AuthService:
         result = await db.execute(select(User).where(User.username == username))
         user = result.scalar_one_or_none()
 
-        if not user or not AuthService.verify_password(password, user.hashed_password):
+        # bcrypt 单次约数十到数百毫秒，放到线程池避免阻塞事件循环
+        if not user or not await asyncio.to_thread(AuthService.verify_password, password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="用户名或密码错误",
@@ -1,8 +1,14 @@
+from datetime import datetime
+from typing import Any
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.brandguard import VIConfig, PosterTemplate, GeneratedPoster
+from app.core.metrics import observe
+from app.models.brandguard import VIConfig, PosterTemplate, PosterTemplateVersion, GeneratedPoster
+from app.services.layouts import LayoutService
+from app.services.search import DOC_POSTER, DOC_TEMPLATE, SearchService
 from app.schemas.brandguard import (
-    VIConfigCreate, VIConfigUpdate, PosterTemplateCreate,
+    VIConfigCreate, VIConfigUpdate, PosterTemplateCreate, PosterTemplateUpdate,
     GeneratePosterRequest, ComplianceCheckRequest
 )
 
@@ -17,6 +23,10 @@ PROHIBITED_WORDS = [
 ]
 
 
+class TemplateVersionConflict(RuntimeError):
+    """模板在编辑期间已被其他请求更新"""
+
+
 class BrandGuardService:
     """BrandGuard 业务逻辑服务"""
 
@@ -48,26 +58,228 @@ class BrandGuardService:
             await db.refresh(new_config)
             return new_config
 
+    @staticmethod
+    async def _attach_layouts(db: AsyncSession, templates: list[PosterTemplate]) -> list[PosterTemplate]:
+        """按根哈希还原布局配置（多个模板共享节点查询与子树缓存）"""
+        layouts = await LayoutService.materialize(db, {t.layout_hash for t in templates})
+        for template in templates:
+            template.layout_config = layouts[template.layout_hash]
+        return templates
+
     @staticmethod
     async def get_templates(db: AsyncSession, user_id: int) -> list[PosterTemplate]:
         """获取用户的海报模板列表"""
         result = await db.execute(
             select(PosterTemplate).where(PosterTemplate.user_id == user_id)
         )
-        return list(result.scalars().all())
+        return await BrandGuardService._attach_layouts(db, list(result.scalars().all()))
+
+    @staticmethod
+    async def _find_template(db: AsyncSession, user_id: int, template_id: int) -> PosterTemplate:
+        template = await db.scalar(
+            select(PosterTemplate).where(PosterTemplate.id == template_id, PosterTemplate.user_id == user_id)
+        )
+        if template is None:
+            raise LookupError("模板不存在")
+        return template
+
+    @staticmethod
+    async def get_template(db: AsyncSession, user_id: int, template_id: int) -> PosterTemplate | None:
+        """获取单个海报模板"""
+        try:
+            template = await BrandGuardService._find_template(db, user_id, template_id)
+        except LookupError:
+            return None
+        await BrandGuardService._attach_layouts(db, [template])
+        return template
+
+    @staticmethod
+    async def _version_id(db: AsyncSession, template: PosterTemplate, number: int) -> int | None:
+        return await db.scalar(
+            select(PosterTemplateVersion.id).where(
+                PosterTemplateVersion.template_id == template.id, PosterTemplateVersion.number == number
+            )
+        )
+
+    @staticmethod
+    async def _add_version(db: AsyncSession, template: PosterTemplate, parent_id: int | None) -> None:
+        db.add(PosterTemplateVersion(
+            template_id=template.id,
+            number=template.version,
+            layout_hash=template.layout_hash,
+            parent_id=parent_id,
+        ))
+        await db.flush()
 
     @staticmethod
     async def create_template(
         db: AsyncSession, user_id: int, template_data: PosterTemplateCreate
     ) -> PosterTemplate:
-        """创建海报模板"""
-        template = PosterTemplate(user_id=user_id, **template_data.model_dump())
+        """创建海报模板（布局拆分为内容寻址节点，记为版本 1）"""
+        data = template_data.model_dump()
+        layout = data.pop("layout_config")
+        layout_hash = await LayoutService.save(db, layout)
+        template = PosterTemplate(user_id=user_id, layout_hash=layout_hash, version=1, **data)
         db.add(template)
+        await db.flush()
+        await BrandGuardService._add_version(db, template, None)
+        # 检索索引与模板在同一事务中写入
+        await SearchService.index_document(
+            db, user_id, DOC_TEMPLATE, template.id, template.name, template.description
+        )
         await db.commit()
         await db.refresh(template)
+        template.layout_config = layout
         return template
 
     @staticmethod
+    def _check_base_version(template: PosterTemplate, base_version: int | None) -> None:
+        if base_version is not None and base_version != template.version:
+            raise TemplateVersionConflict(f"模板已更新到版本 {template.version}，请刷新后重试")
+
+    @staticmethod
+    async def _commit_layout(db: AsyncSession, template: PosterTemplate, layout_hash: str) -> PosterTemplate:
+        """布局有变化时记录新版本，提交并还原布局"""
+        try:
+            if layout_hash != template.layout_hash:
+                parent_id = await BrandGuardService._version_id(db, template, template.version)
+                template.layout_hash = layout_hash
+                template.version += 1
+                await BrandGuardService._add_version(db, template, parent_id)
+            await db.commit()
+        except IntegrityError:
+            # 并发编辑抢先写入了同一版本号
+            await db.rollback()
+            raise TemplateVersionConflict("模板已被其他编辑更新，请刷新后重试")
+        await db.refresh(template)
+        return (await BrandGuardService._attach_layouts(db, [template]))[0]
+
+    @staticmethod
+    @observe("brandguard.update_template")
+    async def update_template(
+        db: AsyncSession, user_id: int, template_id: int, template_data: PosterTemplateUpdate
+    ) -> PosterTemplate:
+        """修改模板；整份替换布局时只写入新增的子树，布局不变时不产生新版本"""
+        template = await BrandGuardService._find_template(db, user_id, template_id)
+        BrandGuardService._check_base_version(template, template_data.base_version)
+        fields = template_data.model_dump(exclude_unset=True, exclude={"layout_config", "base_version"})
+        for key, value in fields.items():
+            if value is not None or key in ("description", "thumbnail_url"):
+                setattr(template, key, value)
+        if "name" in fields or "description" in fields:
+            await SearchService.index_document(
+                db, user_id, DOC_TEMPLATE, template.id, template.name, template.description, replace=True
+            )
+        layout_hash = template.layout_hash
+        if template_data.layout_config is not None:
+            layout_hash = await LayoutService.save(db, template_data.layout_config)
+        return await BrandGuardService._commit_layout(db, template, layout_hash)
+
+    @staticmethod
+    @observe("brandguard.patch_layout")
+    async def patch_layout(
+        db: AsyncSession, user_id: int, template_id: int, operations: list[dict], base_version: int | None = None
+    ) -> PosterTemplate:
+        """按 JSON Patch 局部修改布局，只重建修改路径上的节点"""
+        template = await BrandGuardService._find_template(db, user_id, template_id)
+        BrandGuardService._check_base_version(template, base_version)
+        layout_hash = await LayoutService.patch(db, template.layout_hash, operations)
+        return await BrandGuardService._commit_layout(db, template, layout_hash)
+
+    @staticmethod
+    async def fork_template(
+        db: AsyncSession, user_id: int, template_id: int, name: str | None = None
+    ) -> PosterTemplate:
+        """复制模板：新模板指向来源模板当前的布局根节点，不复制布局数据"""
+        source = await BrandGuardService._find_template(db, user_id, template_id)
+        fork = PosterTemplate(
+            user_id=user_id,
+            name=name or source.name,
+            description=source.description,
+            layout_hash=source.layout_hash,
+            version=1,
+            forked_from_id=source.id,
+            width=source.width,
+            height=source.height,
+            thumbnail_url=source.thumbnail_url,
+        )
+        db.add(fork)
+        await db.flush()
+        parent_id = await BrandGuardService._version_id(db, source, source.version)
+        await BrandGuardService._add_version(db, fork, parent_id)
+        await SearchService.index_document(db, user_id, DOC_TEMPLATE, fork.id, fork.name, fork.description)
+        await db.commit()
+        await db.refresh(fork)
+        return (await BrandGuardService._attach_layouts(db, [fork]))[0]
+
+    @staticmethod
+    async def get_versions(db: AsyncSession, user_id: int, template_id: int) -> list[PosterTemplateVersion]:
+        """模板的版本历史（新版本在前）"""
+        template = await BrandGuardService._find_template(db, user_id, template_id)
+        result = await db.execute(
+            select(PosterTemplateVersion)
+            .where(PosterTemplateVersion.template_id == template.id)
+            .order_by(PosterTemplateVersion.number.desc())
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def get_layout_node(db: AsyncSession, user_id: int, layout_hash: str) -> Any | None:
+        """用户模板（含历史版本）可达的布局节点，其他节点一律视为不存在"""
+        roots = await db.scalars(
+            select(PosterTemplate.layout_hash).where(PosterTemplate.user_id == user_id)
+            .union(
+                select(PosterTemplateVersion.layout_hash)
+                .join(PosterTemplate, PosterTemplate.id == PosterTemplateVersion.template_id)
+                .where(PosterTemplate.user_id == user_id)
+            )
+        )
+        return await LayoutService.get_node(db, layout_hash, roots.all())
+
+    @staticmethod
+    async def _layout_at(db: AsyncSession, template: PosterTemplate, number: int | None) -> tuple[int, str]:
+        if number is None or number == template.version:
+            return template.version, template.layout_hash
+        layout_hash = await db.scalar(
+            select(PosterTemplateVersion.layout_hash).where(
+                PosterTemplateVersion.template_id == template.id, PosterTemplateVersion.number == number
+            )
+        )
+        if layout_hash is None:
+            raise LookupError(f"版本 {number} 不存在")
+        return number, layout_hash
+
+    @staticmethod
+    async def diff_template(
+        db: AsyncSession,
+        user_id: int,
+        template_id: int,
+        version: int | None = None,
+        base_template_id: int | None = None,
+        base_version: int | None = None
+    ) -> dict:
+        """比较模板版本的布局：默认比较当前版本与上一版本，也可与另一模板（如复制来源）比较"""
+        template = await BrandGuardService._find_template(db, user_id, template_id)
+        version, layout_hash = await BrandGuardService._layout_at(db, template, version)
+        if base_template_id is None or base_template_id == template.id:
+            base = template
+            if base_version is None:
+                base_version = version - 1
+                if base_version < 1:
+                    raise LookupError("没有更早的版本")
+        else:
+            base = await BrandGuardService._find_template(db, user_id, base_template_id)
+        base_version, base_hash = await BrandGuardService._layout_at(db, base, base_version)
+        return {
+            "template_id": template.id,
+            "version": version,
+            "base_template_id": base.id,
+            "base_version": base_version,
+            "operations": await LayoutService.diff(db, base_hash, layout_hash),
+        }
+
+    @staticmethod
+    @observe("brandguard.generate_poster")
     async def generate_poster(
         db: AsyncSession, user_id: int, request: GeneratePosterRequest
     ) -> GeneratedPoster:
@@ -88,11 +300,14 @@ class BrandGuardService:
             compliance_issues=compliance_issues if compliance_issues else None
         )
         db.add(poster)
+        await db.flush()
+        await SearchService.index_document(db, user_id, DOC_POSTER, poster.id, poster.title, poster.content)
         await db.commit()
         await db.refresh(poster)
         return poster
 
     @staticmethod
+    @observe("brandguard.check_compliance")
     def check_compliance_sync(content: str) -> list[str]:
         """同步违禁词检查"""
         issues = []
@@ -114,11 +329,21 @@ class BrandGuardService:
         }
 
     @staticmethod
-    async def get_posters(db: AsyncSession, user_id: int) -> list[GeneratedPoster]:
-        """获取已生成海报列表"""
+    async def get_posters(
+        db: AsyncSession,
+        user_id: int,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None
+    ) -> list[GeneratedPoster]:
+        """获取已生成海报列表（指定时间范围时 PostgreSQL 只扫描对应月份分区）"""
+        conditions = [GeneratedPoster.user_id == user_id]
+        if created_after is not None:
+            conditions.append(GeneratedPoster.created_at >= created_after)
+        if created_before is not None:
+            conditions.append(GeneratedPoster.created_at < created_before)
         result = await db.execute(
             select(GeneratedPoster)
-            .where(GeneratedPoster.user_id == user_id)
+            .where(*conditions)
             .order_by(GeneratedPoster.created_at.desc())
         )
         return list(result.scalars().all())
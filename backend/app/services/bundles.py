@@ -0,0 +1,272 @@
+"""会诊预取包
+
+iPad 打开会诊时原本要分别请求原图、每条皮肤分析、每条模拟记录及其效果图 / 对比图，
+诊所 Wi-Fi 较差时往返次数决定了等待时间。预取包把一张图片的全部资料打成一个 ZIP 流式下发：
+- 记录元数据（图片、含检测区域的分析、模拟）为 JSON 条目，DEFLATE 压缩；
+- 图片条目按 Accept 与宽度取转码缓存中的 WebP / AVIF 变体，本身已压缩，原样存储；
+- 数据库记录一次查出，图片条目边准备边输出（提前准备后续 bundle_prefetch 个），写完一个条目即下发；
+- manifest.json 最后写入，列出当前全部条目及其版本，客户端删除清单中不存在的本地条目。
+
+版本号为 "<水位>-<摘要>-<图片档位>"：水位是各记录时间戳的最大值（微秒），摘要覆盖全部记录的
+ID、状态与时间戳，档位为输出格式与宽度。客户端带上次的版本号 since 请求时：
+- 与当前版本一致，无变更（接口返回 304）；
+- 档位不同，图片需要重新转码，下发全量；
+- 否则只下发时间戳晚于 since 水位的条目。记录的时间戳在写入时生成、早于提交时刻，
+  为不漏掉提交较晚的记录，水位回退 bundle_delta_overlap_seconds 后再比较，重复下发的条目由客户端覆盖。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import zipfile
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.config import settings
+from app.core.files import content_hash
+from app.core.storage import storage
+from app.models.facesim import FaceImage, SkinAnalysis
+from app.schemas.facesim import BundleAnalysis, ImageUploadResponse, SimulationDetail
+from app.services.facesim import UPLOAD_PREFIX
+from app.services.variants import FORMATS, get_variant, negotiate_format, snap_width
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+EPOCH = datetime(1970, 1, 1)
+ZIP_EPOCH = datetime(1980, 1, 1)  # ZIP 条目时间的下限
+
+
+def _stamp(value: datetime) -> int:
+    """naive UTC 时间 -> 微秒"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def image_profile(accept: str | None, width: int | None) -> str:
+    """图片档位：与 get_variant 相同的格式协商与宽度吸附，如 webp1280；不转码时为 original"""
+    fmt = negotiate_format(accept)
+    width = snap_width(width)
+    if fmt is None and width is None:
+        return "original"
+    return f"{(fmt or FORMATS['jpeg']).name}{width or ''}"
+
+
+def parse_version(version: str) -> tuple[int, str, str]:
+    """解析版本号 -> (水位, 摘要, 图片档位)"""
+    watermark, digest, profile = (version.split("-") + ["", ""])[:3]
+    if not watermark.isdigit() or not digest or not profile:
+        raise ValueError("版本号格式错误")
+    return int(watermark), digest, profile
+
+
+@dataclass
+class BundleEntry:
+    """包内条目：JSON 元数据（data）或图片（key）"""
+    name: str
+    stamp: int  # 所属记录的版本时间戳（微秒）
+    data: bytes | None = None
+    key: str | None = None
+    etag: str | None = None  # 原图内容哈希，缺省时按文件计算
+
+
+@dataclass
+class Bundle:
+    """一次预取的条目清单与版本"""
+    image_id: int
+    version: str
+    since: str | None
+    cutoff: int | None  # 只下发 stamp 大于该值的条目，None 为全量
+    accept: str | None
+    width: int | None
+    entries: list[BundleEntry] = field(default_factory=list)
+
+    @property
+    def unchanged(self) -> bool:
+        return self.since == self.version
+
+    def included(self, entry: BundleEntry) -> bool:
+        return self.cutoff is None or entry.stamp > self.cutoff
+
+
+def _json(model) -> bytes:
+    return model.model_dump_json().encode()
+
+
+def _collect_entries(image: FaceImage) -> list[BundleEntry]:
+    """按记录展开条目：元数据在前，图片在后（先下发的小条目让客户端尽早可用）"""
+    image_stamp = _stamp(image.created_at)
+    meta = [BundleEntry("image.json", image_stamp, data=_json(ImageUploadResponse.model_validate(image)))]
+    files = [BundleEntry("image", image_stamp, key=image.file_path, etag=image.content_hash)]
+    for analysis in sorted(image.analyses, key=lambda a: a.id):
+        meta.append(BundleEntry(
+            f"analyses/{analysis.id}.json", _stamp(analysis.created_at),
+            data=_json(BundleAnalysis.model_validate(analysis)),
+        ))
+        for simulation in sorted(analysis.simulations, key=lambda s: s.id):
+            stamp = _stamp(simulation.completed_at or simulation.created_at)
+            meta.append(BundleEntry(
+                f"simulations/{simulation.id}.json", stamp,
+                data=_json(SimulationDetail.model_validate(simulation)),
+            ))
+            # 处理中的模拟还没有图片
+            if simulation.simulated_image_path:
+                files.append(BundleEntry(
+                    f"simulations/{simulation.id}/simulated", stamp, key=simulation.simulated_image_path
+                ))
+            if simulation.comparison_image_path:
+                files.append(BundleEntry(
+                    f"simulations/{simulation.id}/comparison", stamp, key=simulation.comparison_image_path
+                ))
+    return meta + files
+
+
+def _version(image: FaceImage, entries: list[BundleEntry], profile: str) -> str:
+    digest = hashlib.sha256()
+    for analysis in image.analyses:
+        for simulation in analysis.simulations:
+            digest.update(f"s{simulation.id}:{simulation.status.value}\n".encode())
+    for entry in entries:
+        digest.update(f"{entry.name}:{entry.stamp}\n".encode())
+    watermark = max(entry.stamp for entry in entries)
+    return f"{watermark}-{digest.hexdigest()[:16]}-{profile}"
+
+
+async def _load_file(entry: BundleEntry, accept: str | None, width: int | None) -> tuple[bytes, str] | None:
+    """取图片条目内容与媒体类型，对象不存在时返回 None"""
+    key = entry.key
+    found = await storage.fetch(key) if key.startswith(f"{UPLOAD_PREFIX}/") else None
+    if found is None:
+        return None
+    source, stat_result = found
+    etag = entry.etag or await content_hash(source, stat_result)
+    variant = await get_variant(source, etag, accept, width)
+    if variant is None:
+        path, media_type = source, mimetypes.guess_type(source.name)[0] or "application/octet-stream"
+    else:
+        path, media_type = variant[0], variant[1].media_type
+    try:
+        return await asyncio.to_thread(path.read_bytes), media_type
+    except FileNotFoundError:
+        # 变体或本地副本在读取前被缓存淘汰
+        return None
+
+
+async def _prefetched(jobs: Iterable[Callable[[], Awaitable]], ahead: int) -> AsyncIterator:
+    """按顺序产出结果，等待当前结果时后续 ahead 个任务已在准备"""
+    jobs = iter(jobs)
+    pending: deque[asyncio.Task] = deque()
+    try:
+        for job in jobs:
+            pending.append(asyncio.ensure_future(job()))
+            if len(pending) > ahead:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class _ChunkSink:
+    """ZipFile 的只写输出：缓存写入的字节，每写完一个条目由生成器取走"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_info(name: str, stamp: int, compress: bool) -> zipfile.ZipInfo:
+    modified = max(EPOCH + timedelta(microseconds=stamp), ZIP_EPOCH)
+    info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    return info
+
+
+class BundleService:
+    """会诊预取包服务"""
+
+    @staticmethod
+    async def load_image(db: AsyncSession, image_id: int, user_id: int) -> FaceImage | None:
+        """一次查出图片及其全部分析与模拟记录"""
+        result = await db.execute(
+            select(FaceImage)
+            .options(selectinload(FaceImage.analyses).selectinload(SkinAnalysis.simulations))
+            .where(FaceImage.id == image_id, FaceImage.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    def plan(image: FaceImage, since: str | None, accept: str | None, width: int | None) -> Bundle:
+        """计算当前版本与需要下发的条目；since 格式错误时抛出 ValueError"""
+        profile = image_profile(accept, width)
+        entries = _collect_entries(image)
+        bundle = Bundle(image.id, _version(image, entries, profile), since, None, accept, width, entries)
+        if since is not None:
+            watermark, _, since_profile = parse_version(since)
+            if since_profile == profile:
+                overlap = settings.bundle_delta_overlap_seconds * 1_000_000
+                bundle.cutoff = watermark - overlap
+        return bundle
+
+    @staticmethod
+    async def stream(bundle: Bundle) -> AsyncIterator[bytes]:
+        """逐条目生成 ZIP 字节流"""
+        sink = _ChunkSink()
+        manifest = []
+        with zipfile.ZipFile(sink, "w", compresslevel=6) as archive:
+            files = []
+            for entry in bundle.entries:
+                item = {"name": entry.name, "version": entry.stamp, "included": bundle.included(entry)}
+                manifest.append(item)
+                if not item["included"]:
+                    continue
+                if entry.data is not None:
+                    archive.writestr(_zip_info(entry.name, entry.stamp, True), entry.data)
+                    yield sink.take()
+                else:
+                    files.append((entry, item))
+
+            jobs = (
+                lambda entry=entry: _load_file(entry, bundle.accept, bundle.width)
+                for entry, _ in files
+            )
+            pending = iter(files)
+            async with aclosing(_prefetched(jobs, settings.bundle_prefetch)) as loaded:
+                async for content in loaded:
+                    entry, item = next(pending)
+                    if content is None:
+                        logger.warning("预取包缺少文件 %s（%s）", entry.name, entry.key)
+                        item.update(included=False, missing=True)
+                        continue
+                    data, media_type = content
+                    item.update(media_type=media_type, size=len(data))
+                    archive.writestr(_zip_info(entry.name, entry.stamp, False), data)
+                    yield sink.take()
+
+            archive.writestr(_zip_info(MANIFEST, max(e.stamp for e in bundle.entries), True), json.dumps({
+                "image_id": bundle.image_id,
+                "version": bundle.version,
+                "since": bundle.since,
+                "full": bundle.cutoff is None,
+                "entries": manifest,
+            }, ensure_ascii=False).encode())
+        yield sink.take()
@@ -0,0 +1,496 @@
+"""人脸向量相似病例检索（NumPy IVF 索引，内存映射共享）
+
+- 目录（settings.embedding_index_dir）下 meta.json 记录当前代次与治疗类型位表，
+  每一代 gen-N/ 保存按行对齐的定长列：vectors.f32、owners.i32、lists.i32、tags.u64、ids.i64，
+  以及训练得到的 IVF 聚类中心 centroids.npy 与列表偏移 offsets.npy（训练时行按列表排序，
+  每个列表是连续区间，训练后追加的行位于尾部）；
+- 所有 worker 以 np.memmap 打开同一组文件，共享页缓存；
+- 写入（上传时追加、分析/模拟后更新标签）在文件锁内进行，ids 最后写入，行数以 ids 为准；
+- 查询按与中心的相似度选 nprobe 个列表（未训练时全量扫描），
+  再按所有者、皮肤问题与治疗类型标签位过滤，精确计算内积取 top-k；候选不足 k 时扩大 nprobe 重试；
+- 训练任务在当前向量上做球面 k-means，压缩已删除行后写入新一代并原子切换 meta.json。
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+from collections.abc import Iterable
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core import tracing
+from app.core.storage import storage
+from app.core.warmup import lazy_import, warmups
+from app.models.facesim import FaceImage, SkinAnalysis, Simulation, SkinIssueType
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+EMBEDDING_DIM = 64
+
+# 标签位：0-7 皮肤问题类型，8-62 治疗类型（按首次出现顺序分配），63 已删除
+ISSUE_BITS = {issue_type.value: i for i, issue_type in enumerate(SkinIssueType)}
+TREATMENT_BIT_START = 8
+MAX_TREATMENTS = 55
+DELETED = 1 << 63  # Python int，与 uint64 标签列按位运算时按 uint64 处理，导入时不加载 numpy
+
+COLUMNS = {
+    "vectors": ("float32", EMBEDDING_DIM, "vectors.f32"),
+    "owners": ("int32", None, "owners.i32"),
+    "lists": ("int32", None, "lists.i32"),
+    "tags": ("uint64", None, "tags.u64"),
+    "ids": ("int64", None, "ids.i64"),  # 最后写入
+}
+UNASSIGNED = -1  # 尚未训练聚类中心时追加的行
+
+
+def embed_image_sync(file_path: str) -> "np.ndarray | None":
+    """人脸向量（AI 占位：缩略图颜色布局 + 亮度直方图，L2 归一化）；无法解码时返回 None"""
+    # TODO: 集成真实人脸 / 肤质向量模型，维度变化时需重新训练并回填
+    try:
+        with Image.open(file_path) as img:
+            img.draft("RGB", (64, 64))
+            img = img.convert("RGB")
+            layout = np.asarray(img.resize((4, 4)), dtype=np.float32).reshape(-1) / 255
+            histogram = np.asarray(img.convert("L").histogram(), dtype=np.float32).reshape(16, 16).sum(axis=1)
+    except (OSError, ValueError):
+        return None
+    histogram /= max(histogram.sum(), 1.0)
+    vector = np.concatenate([layout - layout.mean(), histogram - 1 / 16])
+    norm = np.linalg.norm(vector)
+    return (vector / norm).astype(np.float32) if norm > 0 else None
+
+
+def train_centroids(vectors: "np.ndarray", n_lists: int, iterations: int = 10, seed: int = 0) -> "np.ndarray":
+    """球面 k-means：在抽样向量上训练 IVF 聚类中心"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * 256)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # 空簇保留原中心
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return centroids.astype(np.float32)
+
+
+def assign_lists(vectors: "np.ndarray", centroids: "np.ndarray", chunk: int = 65536) -> "np.ndarray":
+    """按内积最大分配到聚类中心（分块计算，限制临时矩阵大小）"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        assign[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+class EmbeddingIndex:
+    """内存映射的 IVF 向量索引"""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.meta: dict = {}
+        self.centroids: "np.ndarray | None" = None
+        self.offsets: "np.ndarray | None" = None
+        self._meta_mtime: int | None = None
+        self._maps: "dict[str, np.ndarray]" = {}
+        self._rows = 0
+
+    # 文件布局
+    @property
+    def _generation_dir(self) -> Path:
+        return self.root / f"gen-{self.meta.get('generation', 0)}"
+
+    def _column_path(self, name: str, directory: Path | None = None) -> Path:
+        return (directory or self._generation_dir) / COLUMNS[name][2]
+
+    @contextmanager
+    def _locked(self):
+        """跨进程写锁"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp = self.root / f".meta.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(meta, ensure_ascii=False))
+        tmp.replace(self.root / "meta.json")
+
+    def _refresh(self) -> None:
+        """元数据或行数变化时重新映射（其他 worker 追加、训练任务切换代次后生效）"""
+        meta_path = self.root / "meta.json"
+        try:
+            mtime = meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._meta_mtime:
+            self.meta = json.loads(meta_path.read_text()) if mtime else {"generation": 0, "treatments": []}
+            centroids_path = self._generation_dir / "centroids.npy"
+            if centroids_path.exists():
+                self.centroids = np.load(centroids_path, mmap_mode="r")
+                self.offsets = np.load(self._generation_dir / "offsets.npy")
+            else:
+                self.centroids = self.offsets = None
+            self._meta_mtime = mtime
+            self._maps, self._rows = {}, 0
+
+        try:
+            rows = self._column_path("ids").stat().st_size // np.dtype(np.int64).itemsize
+        except FileNotFoundError:
+            rows = 0
+        if rows != self._rows:
+            self._maps = {}
+            if rows:
+                for name, (dtype, width, _) in COLUMNS.items():
+                    self._maps[name] = np.memmap(
+                        self._column_path(name), dtype=dtype, mode="r+" if name == "tags" else "r",
+                        shape=(rows, width) if width else (rows,),
+                    )
+            self._rows = rows
+
+    @property
+    def size(self) -> int:
+        self._refresh()
+        return self._rows
+
+    # 标签
+    def _tag_bits(self, issue_types: Iterable[str] = (), treatments: Iterable[str] = (), create: bool = False) -> int | None:
+        """标签位；create=False 时遇到未登记的治疗类型返回 None"""
+        bits = 0
+        for issue_type in issue_types:
+            bits |= 1 << ISSUE_BITS[getattr(issue_type, "value", issue_type)]
+        vocabulary = self.meta.setdefault("treatments", [])
+        for treatment in treatments:
+            if treatment not in vocabulary:
+                if not create:
+                    return None
+                if len(vocabulary) >= MAX_TREATMENTS:
+                    logger.warning("治疗类型位已满，%s 不参与相似检索过滤", treatment)
+                    continue
+                vocabulary.append(treatment)
+                self._write_meta(self.meta)
+            bits |= 1 << (TREATMENT_BIT_START + vocabulary.index(treatment))
+        return bits
+
+    # 写入
+    def add(
+        self,
+        image_ids: list[int],
+        owner_ids: list[int],
+        vectors: "np.ndarray",
+        tags: list[int] | None = None
+    ) -> None:
+        """追加向量（同一图片重复追加时旧行标记删除）"""
+        if not image_ids:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        with self._locked():
+            self._refresh()
+            self._generation_dir.mkdir(parents=True, exist_ok=True)
+            self._mark_deleted(image_ids)
+            columns = {
+                "vectors": vectors,
+                "owners": np.asarray(owner_ids, dtype=np.int32),
+                "lists": (
+                    assign_lists(vectors, self.centroids) if self.centroids is not None
+                    else np.full(len(image_ids), UNASSIGNED, dtype=np.int32)
+                ),
+                "tags": np.asarray(tags or [0] * len(image_ids), dtype=np.uint64),
+                "ids": np.asarray(image_ids, dtype=np.int64),
+            }
+            for name, values in columns.items():
+                dtype, width, _ = COLUMNS[name]
+                row_bytes = np.dtype(dtype).itemsize * (width or 1)
+                with open(self._column_path(name), "ab") as f:
+                    # 上次写入中途失败留下的多余行先截掉，保证各列对齐
+                    f.truncate(self._rows * row_bytes)
+                    f.write(values.tobytes())
+            self._refresh()
+
+    def _mark_deleted(self, image_ids: Iterable[int]) -> int:
+        if not self._rows:
+            return 0
+        rows = np.flatnonzero(np.isin(self._maps["ids"], np.fromiter(image_ids, dtype=np.int64)))
+        self._maps["tags"][rows] |= DELETED
+        return len(rows)
+
+    def remove(self, image_ids: Iterable[int]) -> int:
+        """标记删除（训练时压缩掉），返回行数"""
+        with self._locked():
+            self._refresh()
+            removed = self._mark_deleted(image_ids)
+            if removed:
+                self._maps["tags"].flush()
+            return removed
+
+    def encode_tags(self, items: list[tuple[Iterable[str], Iterable[str]]]) -> list[int]:
+        """[(皮肤问题类型, 治疗类型)] -> 标签位，按需登记新的治疗类型"""
+        with self._locked():
+            self._refresh()
+            return [self._tag_bits(issue_types, treatments, create=True) for issue_types, treatments in items]
+
+    def tag(self, image_id: int, issue_types: Iterable[str] = (), treatments: Iterable[str] = ()) -> None:
+        """为图片追加皮肤问题 / 治疗类型标签"""
+        with self._locked():
+            self._refresh()
+            bits = self._tag_bits(issue_types, treatments, create=True)
+            self._refresh()
+            if not bits or not self._rows:
+                return
+            rows = np.flatnonzero(self._maps["ids"] == image_id)
+            self._maps["tags"][rows] |= np.uint64(bits)
+            self._maps["tags"].flush()
+
+    def vector(self, image_id: int) -> "np.ndarray | None":
+        self._refresh()
+        if not self._rows:
+            return None
+        rows = np.flatnonzero((self._maps["ids"] == image_id) & ((self._maps["tags"] & DELETED) == 0))
+        return np.array(self._maps["vectors"][rows[-1]]) if len(rows) else None
+
+    # 查询
+    def search(
+        self,
+        vector: "np.ndarray",
+        owner_id: int,
+        k: int = 10,
+        issue_type: str | None = None,
+        treatment: str | None = None,
+        exclude_id: int | None = None,
+        nprobe: int | None = None
+    ) -> list[tuple[int, float]]:
+        """过滤后的 top-k，返回 [(image_id, 相似度)]"""
+        self._refresh()
+        if not self._rows:
+            return []
+        required = self._tag_bits(
+            [issue_type] if issue_type else (), [treatment] if treatment else ()
+        )
+        if required is None:
+            return []
+
+        ids, owners, lists, tags, vectors = (
+            self._maps["ids"], self._maps["owners"], self._maps["lists"], self._maps["tags"], self._maps["vectors"]
+        )
+        vector = np.asarray(vector, dtype=np.float32)
+        n_lists = 0 if self.centroids is None else len(self.centroids)
+        trained = min(self.meta.get("trained_rows", 0), self._rows) if n_lists else 0
+        nprobe = nprobe or settings.embedding_nprobe
+        order = np.argsort(-(self.centroids @ vector)) if n_lists else None
+        required = np.uint64(required)
+
+        while True:
+            if n_lists and nprobe < n_lists:
+                probe = np.zeros(n_lists, dtype=bool)
+                probe[order[:nprobe]] = True
+                # 已训练部分：各列表为连续区间；尾部：按追加时分配的列表过滤
+                candidates = np.concatenate(
+                    [np.arange(self.offsets[i], self.offsets[i + 1]) for i in order[:nprobe]]
+                    + [trained + np.flatnonzero(probe[lists[trained:]])]
+                )
+            else:
+                candidates = np.arange(self._rows)
+            keep = (owners[candidates] == owner_id) & ((tags[candidates] & (required | DELETED)) == required)
+            if exclude_id is not None:
+                keep &= ids[candidates] != exclude_id
+            rows = candidates[keep]
+            if len(rows) >= k or not n_lists or nprobe >= n_lists:
+                break
+            nprobe *= 4
+
+        if not len(rows):
+            return []
+        scores = vectors[rows] @ vector
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[rows[i]]), float(scores[i])) for i in top]
+
+    # 训练
+    def train(self, n_lists: int | None = None, iterations: int = 10) -> dict:
+        """训练 IVF 聚类中心，压缩已删除行，写入新一代并切换"""
+        self._refresh()
+        live = np.flatnonzero((self._maps["tags"] & DELETED) == 0) if self._rows else np.empty(0, dtype=np.int64)
+        if not len(live):
+            return {"rows": 0, "lists": 0}
+        n_lists = min(n_lists or max(int(np.sqrt(len(live))), 1), len(live))
+        # 训练耗时较长，在锁外进行；切换时只做分配与拷贝
+        centroids = train_centroids(self._maps["vectors"][live], n_lists, iterations)
+
+        with self._locked():
+            self._refresh()
+            live = np.flatnonzero((self._maps["tags"] & DELETED) == 0)
+            old_dir = self._generation_dir
+            meta = dict(self.meta, generation=self.meta.get("generation", 0) + 1)
+            new_dir = self.root / f"gen-{meta['generation']}"
+            shutil.rmtree(new_dir, ignore_errors=True)
+            new_dir.mkdir(parents=True)
+            assign = assign_lists(self._maps["vectors"][live], centroids)
+            # 按列表排序，查询时每个列表只读一段连续行
+            order = np.argsort(assign, kind="stable")
+            live, assign = live[order], assign[order]
+            columns = {
+                "vectors": self._maps["vectors"][live],
+                "owners": self._maps["owners"][live],
+                "lists": assign,
+                "tags": self._maps["tags"][live],
+                "ids": self._maps["ids"][live],
+            }
+            for name, values in columns.items():
+                np.ascontiguousarray(values).tofile(self._column_path(name, new_dir))
+            np.save(new_dir / "centroids.npy", centroids)
+            np.save(new_dir / "offsets.npy", np.searchsorted(assign, np.arange(n_lists + 1)))
+            meta["trained_rows"] = int(len(live))
+            self._write_meta(meta)
+            self._refresh()
+        # 旧文件仍被其他 worker 映射时，Linux 上删除目录项不影响已建立的映射
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return {"rows": int(len(live)), "lists": int(n_lists), "generation": meta["generation"]}
+
+
+embedding_index = EmbeddingIndex(settings.embedding_index_dir)
+
+
+class EmbeddingService:
+    """相似病例检索：索引维护与查询"""
+
+    @staticmethod
+    async def index_image(image_id: int, owner_id: int, file_path: str) -> bool:
+        """计算并写入图片向量；索引失败不影响上传"""
+        try:
+            vector = await asyncio.to_thread(embed_image_sync, str(await storage.local_file(file_path)))
+            if vector is None:
+                return False
+            await asyncio.to_thread(embedding_index.add, [image_id], [owner_id], vector[None, :])
+            return True
+        except OSError as e:
+            logger.warning("向量索引写入失败 image=%s: %s", image_id, e)
+            return False
+
+    @staticmethod
+    async def tag_image(image_id: int, issue_types: Iterable[str] = (), treatments: Iterable[str] = ()) -> None:
+        try:
+            await asyncio.to_thread(embedding_index.tag, image_id, list(issue_types), list(treatments))
+        except OSError as e:
+            logger.warning("向量索引标签更新失败 image=%s: %s", image_id, e)
+
+    @staticmethod
+    async def similar_images(
+        db: AsyncSession,
+        image: FaceImage,
+        k: int = 10,
+        issue_type: SkinIssueType | None = None,
+        treatment_type: str | None = None
+    ) -> list[tuple[FaceImage, float]]:
+        """同一用户（诊所账号）下与 image 最相似的图片，可按皮肤问题与做过的治疗过滤"""
+        vector = await asyncio.to_thread(embedding_index.vector, image.id)
+        if vector is None:
+            found = await storage.fetch(image.file_path)
+            vector = await asyncio.to_thread(embed_image_sync, str(found[0])) if found else None
+            if vector is None:
+                return []
+        hits = await asyncio.to_thread(
+            embedding_index.search, vector, image.user_id, k,
+            issue_type.value if issue_type else None, treatment_type, image.id
+        )
+        if not hits:
+            return []
+        result = await db.execute(
+            select(FaceImage).where(FaceImage.id.in_([i for i, _ in hits]), FaceImage.user_id == image.user_id)
+        )
+        images = {row.id: row for row in result.scalars()}
+        return [(images[i], score) for i, score in hits if i in images]
+
+    @staticmethod
+    async def _tags(db: AsyncSession, image_ids: list[int]) -> dict[int, int]:
+        """从数据库汇总图片的标签位"""
+        issues = {image_id: set() for image_id in image_ids}
+        treatments = {image_id: set() for image_id in image_ids}
+        result = await db.execute(
+            select(SkinAnalysis.image_id, SkinAnalysis.issue_type).where(SkinAnalysis.image_id.in_(image_ids))
+        )
+        for image_id, issue_type in result:
+            issues[image_id].add(issue_type)
+        result = await db.execute(
+            select(SkinAnalysis.image_id, Simulation.treatment_type)
+            .join(Simulation, Simulation.analysis_id == SkinAnalysis.id)
+            .where(SkinAnalysis.image_id.in_(image_ids))
+            .distinct()
+        )
+        for image_id, treatment in result:
+            treatments[image_id].add(treatment)
+        bits = await asyncio.to_thread(
+            embedding_index.encode_tags, [(issues[i], treatments[i]) for i in image_ids]
+        )
+        return dict(zip(image_ids, bits))
+
+    @staticmethod
+    async def backfill(db: AsyncSession, batch_size: int = 500, workers: int | None = None) -> dict[str, int]:
+        """为尚未入索引的图片计算向量并写入（向量计算在进程池中执行）"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with embedding_index._locked():
+            embedding_index._refresh()
+            indexed = np.unique(embedding_index._maps["ids"]) if embedding_index._rows else np.empty(0, np.int64)
+
+        stats = {"scanned": 0, "indexed": 0, "skipped": 0}
+        last_id = 0
+        context = multiprocessing.get_context("forkserver")  # 同 provisioning：避免 fork 继承其他线程持有的锁
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            while True:
+                rows = (await db.execute(
+                    select(FaceImage.id, FaceImage.user_id, FaceImage.file_path)
+                    .where(FaceImage.id > last_id).order_by(FaceImage.id).limit(batch_size)
+                )).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                stats["scanned"] += len(rows)
+                known = np.isin(np.fromiter((row[0] for row in rows), dtype=np.int64), indexed)
+                pending = [row for row, seen in zip(rows, known) if not seen]
+                # 对象存储时先取本地副本
+                found = await asyncio.gather(*(storage.fetch(file_path) for _, _, file_path in pending))
+                pending = [row for row, local in zip(pending, found) if local is not None]
+                stats["skipped"] += len(found) - len(pending)
+                vectors = await asyncio.gather(*(
+                    tracing.run_in_worker(pool, "embeddings.embed_image", embed_image_sync, str(local[0]))
+                    for local in found if local is not None
+                ))
+                done = [(row, vector) for row, vector in zip(pending, vectors) if vector is not None]
+                stats["skipped"] += len(pending) - len(done)
+                if not done:
+                    continue
+                image_ids = [row[0] for row, _ in done]
+                tags = await EmbeddingService._tags(db, image_ids)
+                await asyncio.to_thread(
+                    embedding_index.add,
+                    image_ids,
+                    [row[1] for row, _ in done],
+                    np.stack([vector for _, vector in done]),
+                    [tags[i] for i in image_ids],
+                )
+                stats["indexed"] += len(done)
+        return stats
+
+
+def _warm_index() -> None:
+    embedding_index.size
+
+
+warmups.register("embeddings.index", _warm_index)
@@ -1,20 +1,102 @@
+import asyncio
 import os
+import struct
 import uuid
+from collections.abc import AsyncIterator
 from pathlib import Path
 from datetime import datetime
 from fastapi import UploadFile
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.core.metrics import observe
+from app.core.storage import storage
+from app.core.weights import weights
+from app.services.embeddings import EmbeddingService
+from app.services.lesions import encode_areas
 from app.models.facesim import (
     FaceImage, SkinAnalysis, Simulation,
     ImageQualityStatus, SkinIssueType, SimulationStatus
 )
 
-# 配置
-UPLOAD_DIR = Path("uploads/facesim")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# 配置：上传图片、模拟图与对比图的对象键前缀（见 app.core.storage）
+UPLOAD_PREFIX = "uploads/facesim"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def upload_key(filename: str) -> str:
+    return f"{UPLOAD_PREFIX}/{filename}"
+
+# 模型权重（部署到 settings.weights_dir 后自动内存映射，未部署时走占位实现）
+weights.register("skin_detector", "skin_detector.safetensors")
+weights.register("face_simulator", "face_simulator.safetensors")
+
+
+def read_image_size(file_path: str) -> tuple[int, int] | None:
+    """仅读取文件头获取 PNG / JPEG 宽高，无法识别时返回 None"""
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker = f.read(4)
+                if len(marker) < 4 or marker[0] != 0xFF:
+                    return None
+                length = struct.unpack(">H", marker[2:])[0]
+                # SOF0-SOF15（不含 DHT / JPG / DAC）
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    except OSError:
+        return None
+
+
+# 质检与检测为纯同步函数，可在进程池中执行（见 app.services.ingest）
+def check_image_quality_sync(file_path: str) -> dict:
+    """图片质检（AI 占位）"""
+    # TODO: 集成真实 AI 质检模型
+    return {
+        "status": ImageQualityStatus.PASSED,
+        "score": 0.92,
+        "issues": {
+            "brightness": "good",
+            "blur": "none",
+            "face_detected": True
+        }
+    }
+
+
+def detect_skin_issues_sync(file_path: str, issue_types: list[SkinIssueType]) -> list[dict]:
+    """检测皮肤问题（AI 占位）"""
+    # TODO: 集成真实 AI 检测模型，权重取 weights.get("skin_detector")（可在 areas 中附带 "mask" 二值掩码数组）
+    size = read_image_size(file_path)
+    frame = {"width": size[0], "height": size[1]} if size else {}
+    results = []
+    for issue_type in issue_types:
+        results.append({
+            "issue_type": issue_type,
+            "severity": 6,
+            "areas": {
+                "regions": [
+                    {"x": 100, "y": 150, "width": 50, "height": 50},
+                    {"x": 200, "y": 180, "width": 40, "height": 40}
+                ],
+                "frame": frame
+            },
+            "confidence": 0.87
+        })
+    return results
+
+
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
 
 
 class FaceSimService:
@@ -23,22 +105,19 @@ class FaceSimService:
     @staticmethod
     async def upload_image(db: AsyncSession, user_id: int, file: UploadFile) -> FaceImage:
         """上传并质检图片"""
-        # 保存文件
+        # 保存文件（流式写入存储，同时计算内容哈希）
         file_ext = Path(file.filename).suffix
-        filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = UPLOAD_DIR / filename
-
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        key = upload_key(f"{uuid.uuid4()}{file_ext}")
+        stored = await storage.save(key, _iter_upload(file), content_type=file.content_type)
 
         # 质检（占位实现）
-        quality_result = await FaceSimService._check_image_quality(str(file_path))
+        quality_result = await FaceSimService._check_image_quality(str(await storage.local_file(key)))
 
         # 创建记录
         image = FaceImage(
             user_id=user_id,
-            file_path=str(file_path),
+            file_path=key,
+            content_hash=stored.sha256,
             quality_status=quality_result["status"],
             quality_score=quality_result["score"],
             quality_issues=quality_result["issues"]
@@ -46,21 +125,13 @@ class FaceSimService:
         db.add(image)
         await db.commit()
         await db.refresh(image)
+        await EmbeddingService.index_image(image.id, user_id, image.file_path)
         return image
 
     @staticmethod
     async def _check_image_quality(file_path: str) -> dict:
-        """图片质检（AI 占位）"""
-        # TODO: 集成真实 AI 质检模型
-        return {
-            "status": ImageQualityStatus.PASSED,
-            "score": 0.92,
-            "issues": {
-                "brightness": "good",
-                "blur": "none",
-                "face_detected": True
-            }
-        }
+        """图片质检（AI 占位），在线程池中执行"""
+        return await asyncio.to_thread(check_image_quality_sync, file_path)
 
     @staticmethod
     async def analyze_skin(
@@ -77,7 +148,7 @@ class FaceSimService:
 
         # AI 分析（占位实现）
         analysis_results = await FaceSimService._detect_skin_issues(
-            image.file_path, issue_types
+            str(await storage.local_file(image.file_path)), issue_types
         )
 
         # 保存分析结果
@@ -87,8 +158,8 @@ class FaceSimService:
                 image_id=image_id,
                 issue_type=result["issue_type"],
                 severity=result["severity"],
-                detected_areas=result["areas"],
-                confidence=result["confidence"]
+                confidence=result["confidence"],
+                **encode_areas(result["areas"])
             )
             db.add(analysis)
             analyses.append(analysis)
@@ -96,29 +167,17 @@ class FaceSimService:
         await db.commit()
         for analysis in analyses:
             await db.refresh(analysis)
+        await EmbeddingService.tag_image(image_id, issue_types=[a["issue_type"] for a in analysis_results])
         return analyses
 
     @staticmethod
+    @observe("facesim.detect_skin_issues")
     async def _detect_skin_issues(
         file_path: str,
         issue_types: list[SkinIssueType]
     ) -> list[dict]:
-        """检测皮肤问题（AI 占位）"""
-        # TODO: 集成真实 AI 检测模型
-        results = []
-        for issue_type in issue_types:
-            results.append({
-                "issue_type": issue_type,
-                "severity": 6,
-                "areas": {
-                    "regions": [
-                        {"x": 100, "y": 150, "width": 50, "height": 50},
-                        {"x": 200, "y": 180, "width": 40, "height": 40}
-                    ]
-                },
-                "confidence": 0.87
-            })
-        return results
+        """检测皮肤问题（AI 占位），在线程池中执行"""
+        return await asyncio.to_thread(detect_skin_issues_sync, file_path, issue_types)
 
     @staticmethod
     async def create_simulation(
@@ -152,18 +211,25 @@ class FaceSimService:
         await db.commit()
         await db.refresh(simulation)
 
-        # 生成模拟图（占位实现）
-        simulated_path = await FaceSimService._generate_simulation(
-            analysis.image.file_path,
-            analysis.issue_type,
-            intensity
-        )
+        try:
+            # 生成模拟图（占位实现）
+            simulated_path = await FaceSimService._generate_simulation(
+                analysis.image.file_path,
+                analysis.issue_type,
+                intensity
+            )
 
-        # 生成对比图
-        comparison_path = await FaceSimService._generate_comparison(
-            analysis.image.file_path,
-            simulated_path
-        )
+            # 生成对比图
+            comparison_path = await FaceSimService._generate_comparison(
+                analysis.image.file_path,
+                simulated_path
+            )
+        except Exception:
+            # 生成失败立即标记，不等清理任务按超时处理
+            simulation.status = SimulationStatus.FAILED
+            simulation.completed_at = datetime.utcnow()
+            await db.commit()
+            raise
 
         # 更新记录
         simulation.simulated_image_path = simulated_path
@@ -172,57 +238,64 @@ class FaceSimService:
         simulation.completed_at = datetime.utcnow()
         await db.commit()
         await db.refresh(simulation)
+        await EmbeddingService.tag_image(analysis.image_id, treatments=[treatment_type])
 
         return simulation
 
     @staticmethod
+    @observe("facesim.generate_simulation")
     async def _generate_simulation(
         original_path: str,
         issue_type: SkinIssueType,
         intensity: int
     ) -> str:
-        """生成模拟效果图（AI 占位）"""
-        # TODO: 集成真实 AI 模拟模型
-        filename = f"sim_{uuid.uuid4()}.jpg"
-        output_path = UPLOAD_DIR / filename
+        """生成模拟效果图（AI 占位），返回对象键"""
+        # TODO: 集成真实 AI 模拟模型，权重取 weights.get("face_simulator")，
+        # 原图用 storage.local_file 取本地文件，结果写到 storage.staging_path 后 save_file
+        key = upload_key(f"sim_{uuid.uuid4()}.jpg")
 
         # 占位：复制原图
-        import shutil
-        shutil.copy(original_path, output_path)
+        await storage.copy(original_path, key)
 
-        return str(output_path)
+        return key
 
     @staticmethod
+    @observe("facesim.generate_comparison")
     async def _generate_comparison(original_path: str, simulated_path: str) -> str:
-        """生成对比图（带水印和免责声明）"""
+        """生成对比图（带水印和免责声明），返回对象键"""
         # TODO: 使用 PIL 生成真实对比图
-        filename = f"comp_{uuid.uuid4()}.jpg"
-        output_path = UPLOAD_DIR / filename
+        key = upload_key(f"comp_{uuid.uuid4()}.jpg")
 
         # 占位：复制模拟图
-        import shutil
-        shutil.copy(simulated_path, output_path)
+        await storage.copy(simulated_path, key)
 
-        return str(output_path)
+        return key
 
     @staticmethod
     async def get_simulations(
         db: AsyncSession,
         user_id: int,
         skip: int = 0,
-        limit: int = 20
+        limit: int = 20,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None
     ) -> tuple[list[Simulation], int]:
-        """获取模拟记录列表"""
+        """获取模拟记录列表（指定时间范围时 PostgreSQL 只扫描对应月份分区）"""
+        conditions = [Simulation.user_id == user_id]
+        if created_after is not None:
+            conditions.append(Simulation.created_at >= created_after)
+        if created_before is not None:
+            conditions.append(Simulation.created_at < created_before)
+
         # 查询总数
-        count_result = await db.execute(
-            select(Simulation).where(Simulation.user_id == user_id)
+        total = await db.scalar(
+            select(func.count()).select_from(Simulation).where(*conditions)
         )
-        total = len(count_result.all())
 
         # 查询列表
         result = await db.execute(
             select(Simulation)
-            .where(Simulation.user_id == user_id)
+            .where(*conditions)
             .order_by(Simulation.created_at.desc())
             .offset(skip)
             .limit(limit)
@@ -231,6 +304,27 @@ class FaceSimService:
 
         return list(simulations), total
 
+    @staticmethod
+    async def get_image(db: AsyncSession, image_id: int, user_id: int) -> FaceImage | None:
+        """获取用户自己的图片记录"""
+        result = await db.execute(
+            select(FaceImage).where(FaceImage.id == image_id, FaceImage.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_simulation_file_path(
+        db: AsyncSession,
+        simulation_id: int,
+        user_id: int,
+        kind: str
+    ) -> str | None:
+        """获取模拟效果图（simulated）或对比图（comparison）的文件路径"""
+        column = Simulation.simulated_image_path if kind == "simulated" else Simulation.comparison_image_path
+        return await db.scalar(
+            select(column).where(Simulation.id == simulation_id, Simulation.user_id == user_id)
+        )
+
     @staticmethod
     async def get_simulation_detail(
         db: AsyncSession,
@@ -0,0 +1,331 @@
+"""历史照片批量导入
+
+读取目录、zip 或 tar（含 stdin 流）中的照片：
+- 按内容 SHA-256 去重（同一用户已导入过的照片直接跳过），文件按哈希命名写入上传目录
+  （对象存储时先写本地副本，处理完成后上传）；
+- 质检与皮肤检测在进程池中执行，已读入内存、尚未写库的图片数不超过 max_in_flight；
+- FaceImage 与 SkinAnalysis 按批在同一事务中写入；
+- 每批提交后更新断点文件（已连续完成的条目序号），崩溃后重跑会跳过已完成条目，
+  未记录在断点内但已入库的照片由哈希去重兜底。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core import tracing
+from app.core.storage import storage
+from app.core.warmup import lazy_import
+from app.models.facesim import FaceImage, ImageQualityStatus, SkinAnalysis, SkinIssueType
+from app.services.embeddings import embed_image_sync, embedding_index
+from app.services.facesim import check_image_quality_sync, detect_skin_issues_sync, upload_key
+from app.services.lesions import encode_areas
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def _is_image(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def iter_source(source: str | Path, skip: int = 0) -> Iterator[tuple[int, str, bytes]]:
+    """按稳定顺序遍历图片，产出 (序号, 名称, 内容)；序号小于 skip 的条目不读取内容"""
+    if str(source) == "-":
+        archive = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+        yield from _iter_tar(archive, skip)
+        return
+
+    path = Path(source)
+    if path.is_dir():
+        index = 0
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if not _is_image(name):
+                    continue
+                if index >= skip:
+                    file_path = Path(root) / name
+                    yield index, str(file_path.relative_to(path)), file_path.read_bytes()
+                index += 1
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [m for m in archive.infolist() if not m.is_dir() and _is_image(m.filename)]
+            for index, member in enumerate(members):
+                if index >= skip:
+                    yield index, member.filename, archive.read(member)
+    elif tarfile.is_tarfile(path):
+        # 流式读取，不随机访问，支持 .tar.gz / .tar.zst 等大归档
+        with tarfile.open(path, mode="r|*") as archive:
+            yield from _iter_tar(archive, skip)
+    else:
+        raise ValueError(f"不支持的导入源: {source}")
+
+
+def _iter_tar(archive: tarfile.TarFile, skip: int) -> Iterator[tuple[int, str, bytes]]:
+    index = 0
+    for member in archive:
+        if not member.isfile() or not _is_image(member.name):
+            continue
+        if index >= skip:
+            yield index, member.name, archive.extractfile(member).read()
+        index += 1
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def process_image(file_path: str, issue_types: list[SkinIssueType]) -> dict:
+    """进程池任务：质检，合格则检测并编码皮损区域、计算人脸向量"""
+    quality = check_image_quality_sync(file_path)
+    analyses = []
+    embedding = None
+    if quality["status"] == ImageQualityStatus.PASSED:
+        embedding = embed_image_sync(file_path)
+        for result in detect_skin_issues_sync(file_path, issue_types):
+            analyses.append({
+                "issue_type": result["issue_type"],
+                "severity": result["severity"],
+                "confidence": result["confidence"],
+                **encode_areas(result["areas"]),
+            })
+    return {"quality": quality, "analyses": analyses, "embedding": embedding}
+
+
+@dataclass
+class IngestStats:
+    """导入统计"""
+    read: int = 0  # 本次读取的图片数
+    imported: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    analyses: int = 0
+    resumed_from: int = 0  # 断点跳过的条目数
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def images_per_second(self) -> float:
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("started")
+        data["elapsed_seconds"] = round(self.elapsed, 2)
+        data["images_per_second"] = round(self.images_per_second, 2)
+        return data
+
+
+class Checkpoint:
+    """断点：记录已连续完成（写库、去重或失败）的条目数"""
+
+    def __init__(self, path: Path | None, source: str):
+        self.path = path
+        self.source = source
+        self.committed = 0
+        self._done: set[int] = set()
+        if path is not None and path.exists():
+            data = json.loads(path.read_text())
+            if data.get("source") == source:
+                self.committed = data["committed"]
+
+    def mark(self, indexes: list[int]) -> None:
+        self._done.update(indexes)
+        while self.committed in self._done:
+            self._done.remove(self.committed)
+            self.committed += 1
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"source": self.source, "committed": self.committed}))
+        tmp.replace(self.path)
+
+
+class IngestService:
+    """批量导入服务"""
+
+    @staticmethod
+    async def _known_hashes(db: AsyncSession, user_id: int) -> set[str]:
+        result = await db.execute(
+            select(FaceImage.content_hash).where(
+                FaceImage.user_id == user_id, FaceImage.content_hash.is_not(None)
+            )
+        )
+        return set(result.scalars())
+
+    @staticmethod
+    async def _flush(db: AsyncSession, user_id: int, batch: list[dict]) -> int:
+        """一个事务内写入一批图片及其分析结果，返回分析条数"""
+        rows = await db.execute(
+            insert(FaceImage).returning(FaceImage.id, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": user_id,
+                    "file_path": item["file_path"],
+                    "content_hash": item["content_hash"],
+                    "quality_status": item["quality"]["status"],
+                    "quality_score": item["quality"]["score"],
+                    "quality_issues": item["quality"]["issues"],
+                }
+                for item in batch
+            ],
+        )
+        image_ids = rows.scalars().all()
+        analyses = [
+            {"image_id": image_id, **analysis}
+            for image_id, item in zip(image_ids, batch)
+            for analysis in item["analyses"]
+        ]
+        if analyses:
+            await db.execute(insert(SkinAnalysis), analyses)
+        await db.commit()
+
+        embedded = [(image_id, item) for image_id, item in zip(image_ids, batch) if item["embedding"] is not None]
+        if embedded:
+            tags = await asyncio.to_thread(
+                embedding_index.encode_tags,
+                [([a["issue_type"] for a in item["analyses"]], ()) for _, item in embedded],
+            )
+            await asyncio.to_thread(
+                embedding_index.add,
+                [image_id for image_id, _ in embedded],
+                [user_id] * len(embedded),
+                np.stack([item["embedding"] for _, item in embedded]),
+                tags,
+            )
+        return len(analyses)
+
+    @staticmethod
+    async def ingest(
+        db: AsyncSession,
+        user_id: int,
+        source: str | Path,
+        issue_types: list[SkinIssueType],
+        workers: int | None = None,
+        batch_size: int | None = None,
+        max_in_flight: int | None = None,
+        checkpoint_path: Path | None = None,
+        on_progress: Callable[[IngestStats], None] | None = None,
+        progress_interval: float = 5.0
+    ) -> IngestStats:
+        """导入照片并返回统计"""
+        workers = workers or settings.ingest_workers or os.cpu_count() or 1
+        batch_size = batch_size or settings.ingest_batch_size
+        max_in_flight = max_in_flight or settings.ingest_max_in_flight
+
+        checkpoint = Checkpoint(checkpoint_path, str(source))
+        stats = IngestStats(resumed_from=checkpoint.committed)
+        known = await IngestService._known_hashes(db, user_id)
+
+        slots = asyncio.Semaphore(max_in_flight)
+        pending: set[asyncio.Task] = set()
+        batch: list[dict] = []
+        batch_indexes: list[int] = []
+        done_indexes: list[int] = []  # 重复或失败、无需写库的条目
+        last_report = time.monotonic()
+
+        async def flush() -> None:
+            nonlocal batch, batch_indexes
+            # 先取出当前批次：写库期间完成的任务会追加到新的批次中
+            items, indexes = batch, batch_indexes + done_indexes
+            batch, batch_indexes = [], []
+            done_indexes.clear()
+            if items:
+                stats.analyses += await IngestService._flush(db, user_id, items)
+                stats.imported += len(items)
+                for _ in items:
+                    slots.release()
+            checkpoint.mark(indexes)
+            checkpoint.save()
+
+        async def handle(index: int, name: str, key: str, content_hash: str) -> None:
+            try:
+                result = await tracing.run_in_worker(
+                    pool, "ingest.process_image", process_image, str(storage.staging_path(key)), issue_types
+                )
+                # 本地文件处理完再提交到对象存储（本地磁盘存储时无操作）
+                await storage.save_file(key)
+            except Exception:
+                logger.exception("处理失败: %s", name)
+                stats.failed += 1
+                done_indexes.append(index)
+                slots.release()
+                return
+            batch.append({"file_path": key, "content_hash": content_hash, **result})
+            batch_indexes.append(index)
+
+        def report() -> None:
+            nonlocal last_report
+            if on_progress and time.monotonic() - last_report >= progress_interval:
+                last_report = time.monotonic()
+                on_progress(stats)
+
+        # 与 provisioning 相同：进程内有线程池与监控线程，直接 fork 可能继承被其他线程持有的锁，改用 forkserver
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            source_iter = iter_source(source, skip=checkpoint.committed)
+            while True:
+                # 名额被待写库的结果占满时先落库，避免 max_in_flight < batch_size 时互相等待
+                while slots.locked():
+                    if batch:
+                        await flush()
+                    else:
+                        await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await slots.acquire()
+                item = await asyncio.to_thread(next, source_iter, None)
+                if item is None:
+                    slots.release()
+                    break
+                index, name, data = item
+                stats.read += 1
+
+                content_hash = hashlib.sha256(data).hexdigest()
+                if content_hash in known:
+                    stats.duplicates += 1
+                    done_indexes.append(index)
+                    slots.release()
+                else:
+                    known.add(content_hash)
+                    # 按内容寻址命名，崩溃重跑时覆盖写入同一文件
+                    key = upload_key(f"{content_hash}{Path(name).suffix.lower()}")
+                    await asyncio.to_thread(_write_file, storage.staging_path(key), data)
+                    task = asyncio.create_task(handle(index, name, key, content_hash))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                del item, data
+
+                if len(batch) >= batch_size:
+                    await flush()
+                report()
+
+            if pending:
+                await asyncio.gather(*pending)
+            await flush()
+
+        if on_progress:
+            on_progress(stats)
+        return stats
@@ -0,0 +1,289 @@
+"""清理任务：卡住的模拟、孤儿文件与数据保留
+
+- fail_stale_simulations：PROCESSING 超时的模拟标记为 FAILED；
+- reconcile_uploads：按页遍历存储中的上传对象（本地为 os.scandir，对象存储为 ListObjectsV2），分批 IN 查询，
+  删除超过宽限期且未被 FaceImage / Simulation（含已归档为 Parquet 的模拟）引用的对象；
+- enforce_retention：按保留天数与每用户（诊所账号）图片数上限删除最旧的图片及其分析、模拟记录和文件，
+  并在相似检索索引中标记删除。
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.storage import storage
+from app.models.facesim import FaceImage, Simulation, SimulationStatus, SkinAnalysis
+from app.services.embeddings import embedding_index
+from app.services.facesim import UPLOAD_PREFIX
+from app.services.partitioning import PartitionService
+from app.services.variants import variant_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JanitorReport:
+    """清理报告"""
+    stale_simulations: int = 0
+    scanned_files: int = 0
+    scanned_bytes: int = 0
+    orphan_files: int = 0
+    orphan_bytes: int = 0
+    retention_images: int = 0
+    retention_files: int = 0
+    disk: dict = field(default_factory=dict)
+    seconds: dict = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _variant_paths(hashes: list[str]) -> list[str]:
+    return [str(path) for h in hashes for path in variant_cache.root.glob(f"{h}-*")]
+
+
+def _unlink_all(paths: list[str]) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+class JanitorService:
+    """清理服务"""
+
+    @staticmethod
+    async def fail_stale_simulations(db: AsyncSession, timeout_minutes: int | None = None) -> int:
+        """将超时仍在 PROCESSING 的模拟标记为 FAILED，返回条数"""
+        timeout_minutes = timeout_minutes or settings.stale_simulation_minutes
+        now = datetime.utcnow()
+        result = await db.execute(
+            update(Simulation)
+            .where(
+                Simulation.status == SimulationStatus.PROCESSING,
+                Simulation.created_at < now - timedelta(minutes=timeout_minutes),
+            )
+            .values(status=SimulationStatus.FAILED, completed_at=now)
+        )
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def _referenced(db: AsyncSession, paths: list[str]) -> set[str]:
+        """返回 paths 中仍被数据库引用的路径"""
+        referenced = set()
+        for column in (
+            FaceImage.file_path,
+            Simulation.simulated_image_path,
+            Simulation.comparison_image_path,
+        ):
+            result = await db.execute(select(column).where(column.in_(paths)))
+            referenced.update(result.scalars())
+        return referenced
+
+    @staticmethod
+    async def reconcile_uploads(
+        db: AsyncSession,
+        report: JanitorReport,
+        prefix: str = UPLOAD_PREFIX,
+        grace_minutes: int | None = None,
+        dry_run: bool = False
+    ) -> None:
+        """删除 prefix 下未被引用的对象；宽限期内的对象可能属于尚未提交的事务，跳过"""
+        grace_minutes = settings.orphan_grace_minutes if grace_minutes is None else grace_minutes
+        cutoff = time.time() - grace_minutes * 60
+        # 分区归档后模拟记录只留在 Parquet 中，其结果图与对比图仍需保留
+        archived = await asyncio.to_thread(
+            PartitionService.archived_values,
+            "simulations", ("simulated_image_path", "comparison_image_path"),
+        )
+        async for page in storage.list(prefix):
+            report.scanned_files += len(page)
+            report.scanned_bytes += sum(obj.size for obj in page)
+            candidates = {obj.key: obj.size for obj in page if obj.mtime < cutoff}
+            if not candidates:
+                continue
+            referenced = await JanitorService._referenced(db, list(candidates))
+            orphans = [key for key in candidates if key not in referenced and key not in archived]
+            report.orphan_files += len(orphans)
+            report.orphan_bytes += sum(candidates[key] for key in orphans)
+            if orphans and not dry_run:
+                await storage.delete(orphans)
+
+    @staticmethod
+    async def _expired_image_ids(db: AsyncSession, limit: int) -> list[int]:
+        ids: list[int] = []
+        if settings.retention_days:
+            cutoff = datetime.utcnow() - timedelta(days=settings.retention_days)
+            result = await db.execute(
+                select(FaceImage.id).where(FaceImage.created_at < cutoff).limit(limit)
+            )
+            ids.extend(result.scalars())
+        max_images = settings.retention_max_images
+        if max_images and len(ids) < limit:
+            over_quota = await db.execute(
+                select(FaceImage.user_id)
+                .group_by(FaceImage.user_id)
+                .having(func.count() > max_images)
+            )
+            for user_id in over_quota.scalars():
+                result = await db.execute(
+                    select(FaceImage.id)
+                    .where(FaceImage.user_id == user_id)
+                    .order_by(FaceImage.created_at.desc(), FaceImage.id.desc())
+                    .offset(max_images)
+                    .limit(limit - len(ids))
+                )
+                ids.extend(result.scalars())
+                if len(ids) >= limit:
+                    break
+        return list(dict.fromkeys(ids))
+
+    @staticmethod
+    async def _expired_batches(db: AsyncSession, batch_size: int):
+        """只读遍历全部过期图片（dry-run 用，不删除所以不能像正式执行那样反复取第一批）：
+        超过保留天数的按 id 翻页，超出每用户上限的按用户翻页并排除已按天数计入的"""
+        cutoff = datetime.utcnow() - timedelta(days=settings.retention_days) if settings.retention_days else None
+        if cutoff is not None:
+            last_id = 0
+            while ids := list((await db.execute(
+                select(FaceImage.id)
+                .where(FaceImage.created_at < cutoff, FaceImage.id > last_id)
+                .order_by(FaceImage.id)
+                .limit(batch_size)
+            )).scalars()):
+                yield ids
+                last_id = ids[-1]
+        max_images = settings.retention_max_images
+        if not max_images:
+            return
+        over_quota = (await db.execute(
+            select(FaceImage.user_id).group_by(FaceImage.user_id).having(func.count() > max_images)
+        )).scalars().all()
+        for user_id in over_quota:
+            # 按时间倒序，早于 cutoff 的都排在末尾，过滤掉后前 max_images 条仍是保留的图片
+            query = (
+                select(FaceImage.id)
+                .where(FaceImage.user_id == user_id)
+                .order_by(FaceImage.created_at.desc(), FaceImage.id.desc())
+            )
+            if cutoff is not None:
+                query = query.where(FaceImage.created_at >= cutoff)
+            offset = max_images
+            while ids := list((await db.execute(query.offset(offset).limit(batch_size))).scalars()):
+                yield ids
+                offset += len(ids)
+
+    @staticmethod
+    async def _retention_targets(db: AsyncSession, image_ids: list[int]) -> tuple[list[int], list[str], list[str]]:
+        """一批图片的 (分析 ID, 待删文件, 待删变体的内容哈希)
+
+        导入按内容哈希命名文件、只在同一用户内去重，不同用户的图片可能共用同一个文件与变体，
+        仍被本批以外的记录引用的文件和哈希不删除。
+        """
+        images = (await db.execute(
+            select(FaceImage.file_path, FaceImage.content_hash).where(FaceImage.id.in_(image_ids))
+        )).all()
+        paths = {file_path for file_path, _ in images}
+        # 转码变体以原图内容哈希为前缀，一并删除
+        hashes = {content_hash for _, content_hash in images if content_hash}
+        analysis_ids = list((await db.execute(
+            select(SkinAnalysis.id).where(SkinAnalysis.image_id.in_(image_ids))
+        )).scalars())
+        if analysis_ids:
+            result = await db.execute(
+                select(Simulation.simulated_image_path, Simulation.comparison_image_path)
+                .where(Simulation.analysis_id.in_(analysis_ids))
+            )
+            paths.update(p for row in result for p in row if p)
+
+        if paths:
+            shared = await db.execute(
+                select(FaceImage.file_path)
+                .where(FaceImage.file_path.in_(paths), FaceImage.id.not_in(image_ids))
+            )
+            paths.difference_update(shared.scalars())
+        if paths:
+            others = [Simulation.analysis_id.not_in(analysis_ids)] if analysis_ids else []
+            for column in (Simulation.simulated_image_path, Simulation.comparison_image_path):
+                shared = await db.execute(select(column).where(column.in_(paths), *others))
+                paths.difference_update(shared.scalars())
+        if hashes:
+            shared = await db.execute(
+                select(FaceImage.content_hash)
+                .where(FaceImage.content_hash.in_(hashes), FaceImage.id.not_in(image_ids))
+            )
+            hashes.difference_update(shared.scalars())
+        return analysis_ids, sorted(paths), sorted(hashes)
+
+    @staticmethod
+    async def enforce_retention(
+        db: AsyncSession,
+        report: JanitorReport,
+        batch_size: int = 200,
+        dry_run: bool = False
+    ) -> None:
+        """按保留策略删除最旧的图片；先提交数据库删除再删文件，删文件失败由下次对账兜底"""
+        if not settings.retention_days and not settings.retention_max_images:
+            return
+        if dry_run:
+            # 同样过期的其他批次仍计为引用，共用文件数只会少算
+            async for image_ids in JanitorService._expired_batches(db, batch_size):
+                _, paths, _ = await JanitorService._retention_targets(db, image_ids)
+                report.retention_images += len(image_ids)
+                report.retention_files += len(paths)
+            return
+
+        while image_ids := await JanitorService._expired_image_ids(db, batch_size):
+            analysis_ids, paths, hashes = await JanitorService._retention_targets(db, image_ids)
+            report.retention_images += len(image_ids)
+            if analysis_ids:
+                await db.execute(delete(Simulation).where(Simulation.analysis_id.in_(analysis_ids)))
+                await db.execute(delete(SkinAnalysis).where(SkinAnalysis.id.in_(analysis_ids)))
+            await db.execute(delete(FaceImage).where(FaceImage.id.in_(image_ids)))
+            await db.commit()
+            await asyncio.to_thread(embedding_index.remove, image_ids)
+            if paths:
+                report.retention_files += await storage.delete(paths)
+            if hashes:
+                report.retention_files += await asyncio.to_thread(lambda: _unlink_all(_variant_paths(hashes)))
+
+    @staticmethod
+    async def run(db: AsyncSession, prefix: str = UPLOAD_PREFIX, dry_run: bool = False) -> JanitorReport:
+        """执行一轮完整清理"""
+        report = JanitorReport()
+
+        start = time.perf_counter()
+        if not dry_run:
+            report.stale_simulations = await JanitorService.fail_stale_simulations(db)
+        report.seconds["stale_simulations"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        await JanitorService.enforce_retention(db, report, dry_run=dry_run)
+        report.seconds["retention"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        await JanitorService.reconcile_uploads(db, report, prefix, dry_run=dry_run)
+        report.seconds["scan"] = round(time.perf_counter() - start, 3)
+
+        if storage.is_local and storage.root.exists():
+            usage = shutil.disk_usage(storage.root)
+            report.disk = {
+                "uploads_bytes": report.scanned_bytes - (0 if dry_run else report.orphan_bytes),
+                "total_bytes": usage.total,
+                "free_bytes": usage.free,
+                "used_percent": round(usage.used / usage.total * 100, 1) if usage.total else None,
+            }
+        logger.info("清理完成: %s", report.as_dict())
+        return report
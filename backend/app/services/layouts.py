@@ -0,0 +1,424 @@
+"""海报模板布局的内容寻址存储
+
+布局配置不再整块存在模板行上，而是拆成不可变的内容寻址节点（layout_nodes）：
+- 编码后不小于 NODE_MIN_BYTES 的对象 / 数组单独存为节点，在父节点中替换为 {"$ref": 哈希}，
+  更小的子树内联；哈希取节点规范 JSON（含子节点哈希）的 SHA-256，相同子树在所有模板与版本间只存一份；
+- 拆分只由子树内容决定，同一内容总得到同一哈希，复制模板只需指向同一个根节点；
+- 局部修改（JSON Patch 的 add / replace / remove）只重建从根到修改处路径上的节点，其余子树沿用原哈希；
+- 比较两棵树时哈希相同的子树直接跳过，结果为可回放的 JSON Patch；
+- 节点不可变，各 worker 按哈希缓存节点与物化后的子树，渲染端同样可按子树哈希缓存图层，
+  修改一个字段只使路径上的节点失效。
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.metrics import observe
+from app.database import dialect_insert
+from app.models.brandguard import LayoutNode
+
+REF = "$ref"
+# 拆分阈值决定节点边界与内容哈希，改动会使已存节点与新算出的哈希不一致，因此固定为常量（与 0008 迁移相同）
+NODE_MIN_BYTES = 128
+
+
+def canonical_json(value: Any) -> bytes:
+    """规范 JSON：键排序、无空白，保证同一内容得到同一哈希"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and REF in value
+
+
+def child_refs(value: Any) -> Iterator[str]:
+    """节点体中（含内联子树）引用的子节点哈希"""
+    if is_ref(value):
+        yield value[REF]
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from child_refs(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from child_refs(item)
+
+
+def seal(body: dict | list, nodes: dict[str, Any], root: bool = False) -> Any:
+    """子树已拆分的对象 / 数组：足够大（或为根）时记入 nodes 并返回引用，否则原样内联"""
+    encoded = canonical_json(body)
+    if not root and len(encoded) < NODE_MIN_BYTES:
+        return body
+    digest = hashlib.sha256(encoded).hexdigest()
+    nodes[digest] = body
+    return {REF: digest}
+
+
+def split(value: Any, nodes: dict[str, Any], root: bool = False) -> Any:
+    """把 JSON 值拆成内容寻址节点（新节点记入 nodes），返回其在父节点中的表示"""
+    if isinstance(value, dict):
+        if REF in value:
+            raise ValueError(f"布局配置不能使用保留键 {REF}")
+        body = {key: split(item, nodes) for key, item in value.items()}
+    elif isinstance(value, list):
+        body = [split(item, nodes) for item in value]
+    else:
+        return value
+    return seal(body, nodes, root)
+
+
+def parse_pointer(path: str) -> list[str]:
+    """JSON Pointer（RFC 6901）-> 路径片段"""
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise ValueError(f"路径格式错误：{path}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def format_pointer(tokens: Iterable[str | int]) -> str:
+    return "".join("/" + str(token).replace("~", "~0").replace("/", "~1") for token in tokens)
+
+
+def _list_index(token: str, length: int, allow_end: bool, path: str) -> int:
+    if allow_end and token == "-":
+        return length
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise ValueError(f"路径不存在：{path}")
+    index = int(token)
+    if index > length or (index == length and not allow_end):
+        raise ValueError(f"路径不存在：{path}")
+    return index
+
+
+ALIGN_MAX_CELLS = 250_000  # 数组对齐的动态规划表上限，超出时按位置一一比较
+
+
+def _align(a: list, b: list) -> list[tuple[int, int]]:
+    """最长公共子序列对齐，返回相同元素的下标对（子树以引用比较，代价很小）"""
+    if not a or not b or len(a) * len(b) > ALIGN_MAX_CELLS:
+        return []
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) - 1, -1, -1):
+        for j in range(len(b) - 1, -1, -1):
+            lengths[i][j] = (
+                lengths[i + 1][j + 1] + 1 if a[i] == b[j] else max(lengths[i + 1][j], lengths[i][j + 1])
+            )
+    pairs = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            pairs.append((i, j))
+            i += 1
+            j += 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+class LayoutCache:
+    """按哈希缓存节点体与物化后的子树；内容不可变、在请求间共享，调用方不得修改返回的对象"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._bodies: OrderedDict[str, Any] = OrderedDict()
+        self._trees: OrderedDict[str, Any] = OrderedDict()
+
+    @staticmethod
+    def _get(table: OrderedDict, digest: str) -> Any:
+        value = table.get(digest)
+        if value is not None:
+            table.move_to_end(digest)
+        return value
+
+    def _put(self, table: OrderedDict, digest: str, value: Any) -> None:
+        table[digest] = value
+        table.move_to_end(digest)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+
+    def body(self, digest: str) -> Any:
+        return self._get(self._bodies, digest)
+
+    def add_body(self, digest: str, body: Any) -> None:
+        self._put(self._bodies, digest, body)
+
+    def tree(self, digest: str) -> Any:
+        return self._get(self._trees, digest)
+
+    def add_tree(self, digest: str, tree: Any) -> None:
+        self._put(self._trees, digest, tree)
+
+
+layout_cache = LayoutCache(settings.layout_cache_entries)
+
+
+def join_layout(value: Any, nodes: dict[str, Any]) -> Any:
+    """把引用替换为子树；已物化过的子树直接复用"""
+    if is_ref(value):
+        digest = value[REF]
+        tree = layout_cache.tree(digest)
+        if tree is None:
+            tree = join_layout(nodes[digest], nodes)
+            layout_cache.add_tree(digest, tree)
+        return tree
+    if isinstance(value, dict):
+        return {key: join_layout(item, nodes) for key, item in value.items()}
+    if isinstance(value, list):
+        return [join_layout(item, nodes) for item in value]
+    return value
+
+
+class LayoutService:
+    """布局节点读写、局部修改与比较"""
+
+    @staticmethod
+    async def _bodies(db: AsyncSession, digests: Iterable[str]) -> dict[str, Any]:
+        """一批节点体：先查缓存，未命中的一次批量查库；不存在的节点不在结果中"""
+        found: dict[str, Any] = {}
+        missing = []
+        for digest in digests:
+            body = layout_cache.body(digest)
+            if body is None:
+                missing.append(digest)
+            else:
+                found[digest] = body
+        if missing:
+            rows = await db.execute(
+                select(LayoutNode.hash, LayoutNode.body).where(LayoutNode.hash.in_(missing))
+            )
+            for digest, body in rows:
+                found[digest] = body
+                layout_cache.add_body(digest, body)
+        return found
+
+    @staticmethod
+    async def fetch_nodes(db: AsyncSession, roots: Iterable[str], materialized: bool = False) -> dict[str, Any]:
+        """取出根哈希可达的节点：先查缓存，未命中的逐层批量查库；
+        materialized 为真时不展开已有物化缓存的子树（物化时用不到它们的节点）"""
+        found: dict[str, Any] = {}
+        pending = {digest for digest in roots if not (materialized and layout_cache.tree(digest) is not None)}
+        while pending:
+            found.update(await LayoutService._bodies(db, pending))
+            lost = [digest for digest in pending if digest not in found]
+            if lost:
+                raise LookupError(f"布局节点不存在：{lost[0]}")
+            children = {
+                child
+                for digest in pending
+                for child in child_refs(found[digest])
+                if not (materialized and layout_cache.tree(child) is not None)
+            }
+            pending = children - found.keys()
+        return found
+
+    @staticmethod
+    @observe("layouts.materialize")
+    async def materialize(db: AsyncSession, roots: Iterable[str]) -> dict[str, Any]:
+        """根哈希 -> 完整布局（多个模板一起取时共享节点查询与子树缓存）"""
+        roots = set(roots)
+        return await LayoutService._materialize(db, roots, lambda nodes: {
+            digest: join_layout({REF: digest}, nodes) for digest in roots
+        })
+
+    @staticmethod
+    async def _materialize_value(db: AsyncSession, value: Any) -> Any:
+        return await LayoutService._materialize(db, set(child_refs(value)), lambda nodes: join_layout(value, nodes))
+
+    @staticmethod
+    async def _materialize(db: AsyncSession, roots: set[str], build):
+        nodes = await LayoutService.fetch_nodes(db, roots, materialized=True)
+        try:
+            return build(nodes)
+        except KeyError:
+            # 物化过程中新加入的子树把查询时仍在缓存中的子树挤出，改为取全部节点
+            return build(await LayoutService.fetch_nodes(db, roots))
+
+    @staticmethod
+    async def _body(db: AsyncSession, digest: str, new_nodes: dict[str, Any]) -> Any:
+        if digest in new_nodes:
+            return new_nodes[digest]
+        body = layout_cache.body(digest)
+        if body is None:
+            body = await db.scalar(select(LayoutNode.body).where(LayoutNode.hash == digest))
+            if body is None:
+                raise LookupError(f"布局节点不存在：{digest}")
+            layout_cache.add_body(digest, body)
+        return body
+
+    @staticmethod
+    async def _store(db: AsyncSession, root: str, nodes: dict[str, Any]) -> None:
+        """写入根可达的新节点；已存在的节点不重复写入（并发写入同一节点时忽略冲突）"""
+        reachable = {}
+        pending = [root]
+        while pending:
+            digest = pending.pop()
+            if digest in nodes and digest not in reachable:
+                reachable[digest] = nodes[digest]
+                pending.extend(child_refs(nodes[digest]))
+        if not reachable:
+            return
+        existing = set((await db.execute(
+            select(LayoutNode.hash).where(LayoutNode.hash.in_(reachable))
+        )).scalars())
+        rows = [
+            {"hash": digest, "body": body, "size": len(canonical_json(body))}
+            for digest, body in reachable.items()
+            if digest not in existing
+        ]
+        if rows:
+            stmt = dialect_insert(db)(LayoutNode).values(rows)
+            await db.execute(stmt.on_conflict_do_nothing(index_elements=["hash"]))
+        for digest, body in reachable.items():
+            layout_cache.add_body(digest, body)
+
+    @staticmethod
+    @observe("layouts.save")
+    async def save(db: AsyncSession, layout: dict) -> str:
+        """保存整份布局（不提交），返回根哈希；布局中含保留键时抛出 ValueError"""
+        nodes: dict[str, Any] = {}
+        root = split(layout, nodes, root=True)[REF]
+        await LayoutService._store(db, root, nodes)
+        return root
+
+    @staticmethod
+    async def _apply(
+        db: AsyncSession,
+        value: Any,
+        tokens: list[str],
+        op: dict,
+        nodes: dict[str, Any],
+        root: bool = False
+    ) -> Any:
+        """沿路径复制节点并应用一个操作，返回修改后子树的表示"""
+        path = op["path"]
+        body = await LayoutService._body(db, value[REF], nodes) if is_ref(value) else value
+        key, rest = tokens[0], tokens[1:]
+        if isinstance(body, dict):
+            body = dict(body)
+            if (rest or op["op"] != "add") and key not in body:
+                raise ValueError(f"路径不存在：{path}")
+            if rest:
+                body[key] = await LayoutService._apply(db, body[key], rest, op, nodes)
+            elif op["op"] == "remove":
+                del body[key]
+            else:
+                body[key] = split(op["value"], nodes)
+        elif isinstance(body, list):
+            body = list(body)
+            index = _list_index(key, len(body), not rest and op["op"] == "add", path)
+            if rest:
+                body[index] = await LayoutService._apply(db, body[index], rest, op, nodes)
+            elif op["op"] == "remove":
+                del body[index]
+            elif op["op"] == "replace":
+                body[index] = split(op["value"], nodes)
+            else:
+                body.insert(index, split(op["value"], nodes))
+        else:
+            raise ValueError(f"路径不存在：{path}")
+        return seal(body, nodes, root)
+
+    @staticmethod
+    @observe("layouts.patch")
+    async def patch(db: AsyncSession, root: str, ops: list[dict]) -> str:
+        """按顺序应用 JSON Patch 操作（不提交），返回新的根哈希；路径无效时抛出 ValueError"""
+        nodes: dict[str, Any] = {}
+        value = {REF: root}
+        for op in ops:
+            tokens = parse_pointer(op["path"])
+            if not tokens:
+                if op["op"] == "remove" or not isinstance(op.get("value"), dict):
+                    raise ValueError("根路径只能整体替换为对象")
+                value = split(op["value"], nodes, root=True)
+            else:
+                value = await LayoutService._apply(db, value, tokens, op, nodes, root=True)
+        await LayoutService._store(db, value[REF], nodes)
+        return value[REF]
+
+    @staticmethod
+    @observe("layouts.diff")
+    async def diff(db: AsyncSession, old: str, new: str) -> list[dict]:
+        """old -> new 的 JSON Patch；哈希相同的子树不展开"""
+        ops: list[dict] = []
+
+        async def walk(a: Any, b: Any, path: list) -> None:
+            # 同一内容的表示唯一：引用相同即子树相同，内联子树直接比较
+            if a == b:
+                return
+            a_body = await LayoutService._body(db, a[REF], {}) if is_ref(a) else a
+            b_body = await LayoutService._body(db, b[REF], {}) if is_ref(b) else b
+            if isinstance(a_body, dict) and isinstance(b_body, dict):
+                for key in a_body:
+                    if key not in b_body:
+                        ops.append({"op": "remove", "path": format_pointer(path + [key])})
+                for key, item in b_body.items():
+                    if key in a_body:
+                        await walk(a_body[key], item, path + [key])
+                    else:
+                        ops.append({
+                            "op": "add",
+                            "path": format_pointer(path + [key]),
+                            "value": await LayoutService._materialize_value(db, item),
+                        })
+            elif isinstance(a_body, list) and isinstance(b_body, list):
+                # 先去掉相同的首尾元素，缩小对齐范围
+                start = 0
+                while start < min(len(a_body), len(b_body)) and a_body[start] == b_body[start]:
+                    start += 1
+                end = 0
+                while (
+                    end < min(len(a_body), len(b_body)) - start
+                    and a_body[len(a_body) - 1 - end] == b_body[len(b_body) - 1 - end]
+                ):
+                    end += 1
+                a_mid = a_body[start:len(a_body) - end]
+                b_mid = b_body[start:len(b_body) - end]
+                # 按对齐结果逐段输出：段内一一对应的元素递归比较，多出的新增或删除；
+                # 操作按顺序回放，下标随之前的增删移动
+                position = start
+                i = j = 0
+                for match_i, match_j in _align(a_mid, b_mid) + [(len(a_mid), len(b_mid))]:
+                    a_gap, b_gap = a_mid[i:match_i], b_mid[j:match_j]
+                    common = min(len(a_gap), len(b_gap))
+                    for k in range(common):
+                        await walk(a_gap[k], b_gap[k], path + [position + k])
+                    for k in range(common, len(b_gap)):
+                        ops.append({
+                            "op": "add",
+                            "path": format_pointer(path + [position + k]),
+                            "value": await LayoutService._materialize_value(db, b_gap[k]),
+                        })
+                    for _ in range(common, len(a_gap)):
+                        ops.append({"op": "remove", "path": format_pointer(path + [position + common])})
+                    position += len(b_gap) + 1
+                    i, j = match_i + 1, match_j + 1
+            else:
+                ops.append({
+                    "op": "replace",
+                    "path": format_pointer(path),
+                    "value": await LayoutService._materialize_value(db, b),
+                })
+
+        await walk({REF: old}, {REF: new}, [])
+        return ops
+
+    @staticmethod
+    async def get_node(db: AsyncSession, digest: str, roots: Iterable[str]) -> Any | None:
+        """单个节点体（子树为引用），供渲染端按哈希逐层取用；只返回从 roots 逐层向下可达的节点"""
+        seen: set[str] = set()
+        pending = set(roots)
+        while pending:
+            bodies = await LayoutService._bodies(db, pending)
+            if digest in bodies:
+                return bodies[digest]
+            seen |= pending
+            pending = {child for body in bodies.values() for child in child_refs(body)} - seen
+        return None
@@ -0,0 +1,201 @@
+"""皮损区域紧凑存储与空间查询
+
+- 检测框：int16 小端 (x, y, width, height) 连续数组，np.frombuffer 零拷贝解码为 (N, 4) 视图；
+- 掩码：行优先展开后的游程编码（uint32，从 0 游程开始），头部为 uint16 (height, width)；
+- 每条分析记录另存外包框（bbox_*）与画面尺寸，查询时先用外包框在 SQL 中过滤，
+  只解码可能命中的记录。
+"""
+import logging
+import struct
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.warmup import lazy_import
+from app.models.facesim import FaceImage, SkinAnalysis, SkinIssueType
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+
+BOX_DTYPE = "<i2"
+INT16_MAX = 32767
+
+# 面部分区（相对画面宽高的归一化坐标 x0, y0, x1, y1），一个分区可由多个矩形组成
+FACE_REGIONS: dict[str, list[tuple[float, float, float, float]]] = {
+    "forehead": [(0.25, 0.08, 0.75, 0.30)],
+    "nose": [(0.42, 0.30, 0.58, 0.62)],
+    "t_zone": [(0.25, 0.08, 0.75, 0.30), (0.40, 0.30, 0.60, 0.65)],
+    "left_cheek": [(0.15, 0.40, 0.42, 0.72)],
+    "right_cheek": [(0.58, 0.40, 0.85, 0.72)],
+    "chin": [(0.35, 0.75, 0.65, 0.95)],
+}
+
+
+def pack_boxes(regions: list[dict]) -> bytes:
+    """[{x, y, width, height}, ...] -> int16 紧凑字节"""
+    if not regions:
+        return b""
+    array = np.array(
+        [[r["x"], r["y"], r["width"], r["height"]] for r in regions], dtype=np.int64
+    )
+    clipped = np.clip(array, 0, INT16_MAX)
+    out_of_range = (clipped != array).any(axis=1)
+    if out_of_range.any():
+        # 检测器输出越界（负坐标或超大画面），截断后存储并留下记录以便排查
+        logger.warning(
+            "%d 个检测框坐标超出 [0, %d]，已截断: %s",
+            int(out_of_range.sum()), INT16_MAX, array[out_of_range][:5].tolist()
+        )
+    return clipped.astype(BOX_DTYPE).tobytes()
+
+
+def unpack_boxes(data: bytes | None):
+    """紧凑字节 -> (N, 4) int16 只读视图（零拷贝）"""
+    if not data:
+        return np.empty((0, 4), dtype=BOX_DTYPE)
+    return np.frombuffer(data, dtype=BOX_DTYPE).reshape(-1, 4)
+
+
+def boxes_to_regions(data: bytes | None) -> list[dict]:
+    return [
+        {"x": x, "y": y, "width": w, "height": h}
+        for x, y, w, h in unpack_boxes(data).tolist()
+    ]
+
+
+def encode_mask(mask) -> bytes:
+    """二值掩码 (H, W) -> 游程编码字节"""
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    flat = mask.ravel()
+    # 值发生变化的位置即游程边界；首个游程固定为 0 值
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    runs = np.diff(bounds).astype("<u4")
+    if flat.size and flat[0]:
+        runs = np.concatenate((np.zeros(1, dtype="<u4"), runs))
+    return struct.pack("<HH", height, width) + runs.tobytes()
+
+
+def decode_mask(data: bytes):
+    """游程编码字节 -> 二值掩码 (H, W)"""
+    height, width = struct.unpack_from("<HH", data)
+    runs = np.frombuffer(data, dtype="<u4", offset=4)
+    values = np.arange(runs.size) % 2 == 1
+    return np.repeat(values, runs).reshape(height, width)
+
+
+def encode_areas(areas: dict) -> dict:
+    """检测器输出 -> SkinAnalysis 列值（坐标进紧凑列，其余字段留在 detected_areas）"""
+    regions = areas.get("regions") or []
+    frame = areas.get("frame") or {}
+    mask = areas.get("mask")
+    meta = {k: v for k, v in areas.items() if k not in ("regions", "mask", "frame")}
+
+    values = {
+        "detected_areas": meta,
+        "boxes": pack_boxes(regions),
+        "mask_rle": encode_mask(mask) if mask is not None else None,
+        "region_count": len(regions),
+        "frame_width": frame.get("width"),
+        "frame_height": frame.get("height"),
+        "bbox_x0": None, "bbox_y0": None, "bbox_x1": None, "bbox_y1": None,
+    }
+    if regions:
+        boxes = unpack_boxes(values["boxes"]).astype(np.int32)
+        values.update(
+            bbox_x0=int(boxes[:, 0].min()),
+            bbox_y0=int(boxes[:, 1].min()),
+            bbox_x1=int((boxes[:, 0] + boxes[:, 2]).max()),
+            bbox_y1=int((boxes[:, 1] + boxes[:, 3]).max()),
+        )
+    return values
+
+
+def region_boxes(region: str, width: int, height: int):
+    """面部分区 -> 绝对像素坐标 (K, 4) 的 x0, y0, x1, y1"""
+    if region not in FACE_REGIONS:
+        raise ValueError(f"未知面部分区: {region}")
+    return np.array(FACE_REGIONS[region], dtype=np.float64) * np.array([width, height, width, height])
+
+
+def select_in_boxes(boxes, areas) -> "np.ndarray":
+    """返回中心点落在任一区域 (x0, y0, x1, y1) 内的检测框掩码"""
+    boxes = boxes.astype(np.int32)
+    cx = boxes[:, 0] + boxes[:, 2] / 2
+    cy = boxes[:, 1] + boxes[:, 3] / 2
+    areas = np.asarray(areas, dtype=np.float64).reshape(-1, 4)
+    inside = (
+        (cx[:, None] >= areas[None, :, 0]) & (cx[:, None] < areas[None, :, 2])
+        & (cy[:, None] >= areas[None, :, 1]) & (cy[:, None] < areas[None, :, 3])
+    )
+    return inside.any(axis=1)
+
+
+class LesionService:
+    """皮损空间查询服务"""
+
+    @staticmethod
+    async def query_lesions(
+        db: AsyncSession,
+        user_id: int,
+        image_id: int,
+        issue_type: SkinIssueType | None = None,
+        region: str | None = None,
+        bbox: tuple[int, int, int, int] | None = None
+    ) -> list[dict]:
+        """按面部分区或外包框查询某张图片的皮损（bbox 为 x0, y0, x1, y1 像素坐标）"""
+        if region is not None and region not in FACE_REGIONS:
+            raise ValueError(f"未知面部分区: {region}")
+
+        owner = await db.scalar(select(FaceImage.user_id).where(FaceImage.id == image_id))
+        if owner != user_id:
+            raise LookupError("图片不存在")
+
+        conditions = [SkinAnalysis.image_id == image_id]
+        if issue_type is not None:
+            conditions.append(SkinAnalysis.issue_type == issue_type)
+        if bbox is not None:
+            x0, y0, x1, y1 = bbox
+            # 外包框不相交的记录无需解码；旧数据没有外包框时保留，解码后再判断
+            conditions.append(
+                (SkinAnalysis.bbox_x0.is_(None))
+                | (
+                    (SkinAnalysis.bbox_x0 < x1) & (SkinAnalysis.bbox_x1 > x0)
+                    & (SkinAnalysis.bbox_y0 < y1) & (SkinAnalysis.bbox_y1 > y0)
+                )
+            )
+
+        result = await db.execute(
+            select(
+                SkinAnalysis.id,
+                SkinAnalysis.issue_type,
+                SkinAnalysis.boxes,
+                SkinAnalysis.detected_areas,
+                SkinAnalysis.frame_width,
+                SkinAnalysis.frame_height,
+            ).where(*conditions)
+        )
+
+        lesions = []
+        for analysis_id, kind, packed, areas, frame_width, frame_height in result:
+            if packed is None:
+                packed = pack_boxes((areas or {}).get("regions") or [])
+            boxes = unpack_boxes(packed)
+            if not len(boxes):
+                continue
+            selected = np.ones(len(boxes), dtype=bool)
+            if bbox is not None:
+                selected &= select_in_boxes(boxes, bbox)
+            if region is not None:
+                if not frame_width or not frame_height:
+                    continue
+                selected &= select_in_boxes(boxes, region_boxes(region, frame_width, frame_height))
+            for x, y, w, h in boxes[selected].tolist():
+                lesions.append({
+                    "analysis_id": analysis_id,
+                    "issue_type": kind,
+                    "x": x, "y": y, "width": w, "height": h,
+                })
+        return lesions
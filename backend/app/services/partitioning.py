@@ -0,0 +1,267 @@
+"""月度分区维护与冷数据归档（仅 PostgreSQL）
+
+- ensure_partitions：提前创建未来几个月的分区，避免数据落入 DEFAULT 分区；
+- archive_expired：将超过保留期的分区流式导出为 Parquet（zstd 压缩，按 month=YYYY-MM 目录组织），
+  导出成功后再 DETACH + DROP，热表大小与索引深度保持有界；DEFAULT 分区中超过保留期的行
+  按月导出后删除；
+- query_archive：按月份与等值条件查询已归档数据（pyarrow dataset，按目录与行组统计裁剪）。
+"""
+import json
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from enum import Enum
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("simulations", "skin_analyses", "generated_posters")
+
+_PARTITION_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_floor(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+@dataclass
+class Partition:
+    """月度分区"""
+    table: str
+    name: str
+    start: date
+
+    @property
+    def end(self) -> date:
+        return add_months(self.start, 1)
+
+
+def _require_postgres(conn: AsyncConnection) -> None:
+    if conn.dialect.name != "postgresql":
+        raise RuntimeError("分区与归档仅支持 PostgreSQL")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("归档需要安装 pyarrow") from e
+    return pyarrow
+
+
+def _to_archive_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class PartitionService:
+    """分区维护与归档服务"""
+
+    @staticmethod
+    async def list_partitions(conn: AsyncConnection, table: str) -> list[Partition]:
+        """列出表的月度分区（不含 DEFAULT），按时间升序"""
+        _require_postgres(conn)
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ), {"table": table})
+        partitions = []
+        for (name,) in result:
+            match = _PARTITION_RE.match(name)
+            if match and match["table"] == table:
+                partitions.append(Partition(table, name, date(int(match["year"]), int(match["month"]), 1)))
+        return sorted(partitions, key=lambda p: p.start)
+
+    @staticmethod
+    async def ensure_partitions(conn: AsyncConnection, months_ahead: int | None = None) -> list[str]:
+        """创建当月及未来 months_ahead 个月的分区，返回新建分区名"""
+        _require_postgres(conn)
+        months_ahead = settings.partition_months_ahead if months_ahead is None else months_ahead
+        current = month_floor(datetime.utcnow())
+        created = []
+        for table in PARTITIONED_TABLES:
+            existing = {p.name for p in await PartitionService.list_partitions(conn, table)}
+            for n in range(months_ahead + 1):
+                start = add_months(current, n)
+                name = f"{table}_p{start:%Y%m}"
+                if name in existing:
+                    continue
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{add_months(start, 1):%Y-%m-%d}')"
+                ))
+                created.append(name)
+        return created
+
+    @staticmethod
+    async def _export(conn: AsyncConnection, query: str, params: dict, target: Path,
+                      batch_size: int = 10_000) -> int:
+        """流式导出查询结果为 Parquet（先写临时文件），返回行数；无数据时不生成文件"""
+        pa = _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(".parquet.tmp")
+
+        rows = 0
+        writer = None
+        result = await conn.stream(text(query), params)
+        try:
+            async for batch in result.partitions(batch_size):
+                columns = list(result.keys())
+                data = {c: [_to_archive_value(row[i]) for row in batch] for i, c in enumerate(columns)}
+                table = pa.table(data)
+                if writer is None:
+                    # 首批全为空的列推断为 null 类型，统一放宽为字符串，后续批次再按此 schema 转换
+                    schema = pa.schema([
+                        pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                        for f in table.schema
+                    ])
+                    writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+                table = table.cast(writer.schema)
+                writer.write_table(table)
+                rows += len(batch)
+        finally:
+            await result.close()
+            if writer is not None:
+                writer.close()
+        if writer is not None:
+            tmp.replace(target)
+        return rows
+
+    @staticmethod
+    async def export_partition(conn: AsyncConnection, partition: Partition, archive_dir: Path,
+                               batch_size: int = 10_000) -> tuple[Path, int]:
+        """流式导出单个分区为 Parquet，返回 (文件路径, 行数)"""
+        target = archive_dir / partition.table / f"month={partition.start:%Y-%m}" / "part-0.parquet"
+        rows = await PartitionService._export(
+            conn, f"SELECT * FROM {partition.name} ORDER BY id", {}, target, batch_size
+        )
+        return target, rows
+
+    @staticmethod
+    async def archive_default(conn: AsyncConnection, table: str, cutoff: date, archive_dir: Path) -> list[dict]:
+        """DEFAULT 分区（月度分区缺失期间写入的行）中早于 cutoff 的行按月导出后删除
+
+        导出与删除在同一个 REPEATABLE READ 事务里，删除的正是导出快照中的行，并发写入的新行留到下次归档。
+        """
+        default = f"{table}_default"
+        result = await conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', created_at) FROM {default} WHERE created_at < :cutoff"
+        ), {"cutoff": datetime(cutoff.year, cutoff.month, cutoff.day)})
+        months = sorted(month_floor(value) for value in result.scalars())
+        await conn.commit()
+
+        archived = []
+        isolation_level = conn.default_isolation_level
+        await conn.execution_options(isolation_level="REPEATABLE READ")
+        try:
+            for month in months:
+                start, end = month, add_months(month, 1)
+                where = "created_at >= :start AND created_at < :end"
+                params = {"start": datetime(start.year, start.month, 1), "end": datetime(end.year, end.month, 1)}
+                # 同一月份可能多次落入 DEFAULT，每次归档单独成文件
+                target = (
+                    archive_dir / table / f"month={start:%Y-%m}"
+                    / f"default-{datetime.utcnow():%Y%m%d%H%M%S}.parquet"
+                )
+                rows = await PartitionService._export(
+                    conn, f"SELECT * FROM {default} WHERE {where} ORDER BY id", params, target
+                )
+                await conn.execute(text(f"DELETE FROM {default} WHERE {where}"), params)
+                await conn.commit()
+                logger.info("已归档 %s 中 %s 的 %d 行 -> %s", default, f"{start:%Y-%m}", rows, target)
+                archived.append({"partition": default, "month": f"{start:%Y-%m}", "rows": rows,
+                                 "path": str(target) if rows else None})
+        finally:
+            await conn.rollback()
+            await conn.execution_options(isolation_level=isolation_level)
+        return archived
+
+    @staticmethod
+    async def archive_expired(conn: AsyncConnection, retention_months: int | None = None,
+                              archive_dir: Path | None = None) -> list[dict]:
+        """归档并删除超过保留期的分区"""
+        _require_postgres(conn)
+        retention_months = settings.partition_retention_months if retention_months is None else retention_months
+        archive_dir = Path(archive_dir or settings.archive_dir)
+        cutoff = add_months(month_floor(datetime.utcnow()), -retention_months)
+
+        archived = []
+        for table in PARTITIONED_TABLES:
+            for partition in await PartitionService.list_partitions(conn, table):
+                if partition.end > cutoff:
+                    continue
+                path, rows = await PartitionService.export_partition(conn, partition, archive_dir)
+                # 结束导出所在的事务（释放游标对分区的占用），之后才能 DROP
+                await conn.commit()
+                await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition.name}"))
+                await conn.execute(text(f"DROP TABLE {partition.name}"))
+                await conn.commit()
+                logger.info("已归档分区 %s（%d 行）-> %s", partition.name, rows, path)
+                archived.append({"partition": partition.name, "rows": rows, "path": str(path) if rows else None})
+            archived += await PartitionService.archive_default(conn, table, cutoff, archive_dir)
+        return archived
+
+    @staticmethod
+    def archived_values(table: str, columns: tuple[str, ...], archive_dir: Path | None = None) -> set:
+        """已归档数据中 columns 各列出现过的非空值（只读取这几列），供对账把归档记录仍引用的文件算作引用"""
+        root = Path(archive_dir or settings.archive_dir) / table
+        if not root.exists():
+            return set()
+        _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        values = set()
+        dataset = ds.dataset(root, format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(columns=list(columns)):
+            for column in batch.columns:
+                values.update(value for value in column.to_pylist() if value)
+        return values
+
+    @staticmethod
+    def query_archive(table: str, start: date | None = None, end: date | None = None,
+                      filters: dict | None = None, limit: int = 1000,
+                      archive_dir: Path | None = None) -> list[dict]:
+        """查询已归档数据：start/end 按月份裁剪目录，filters 为列等值条件"""
+        _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        root = Path(archive_dir or settings.archive_dir) / table
+        if not root.exists():
+            return []
+        dataset = ds.dataset(root, format="parquet", partitioning="hive")
+
+        expression = None
+
+        def _and(expr):
+            nonlocal expression
+            expression = expr if expression is None else expression & expr
+
+        if start is not None:
+            _and(ds.field("month") >= f"{start:%Y-%m}")
+        if end is not None:
+            _and(ds.field("month") <= f"{end:%Y-%m}")
+        for column, value in (filters or {}).items():
+            _and(ds.field(column) == value)
+
+        rows = dataset.head(limit, filter=expression) if expression is not None else dataset.head(limit)
+        return rows.to_pylist()
+
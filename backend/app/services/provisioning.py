@@ -0,0 +1,220 @@
+"""批量开通员工账号
+
+连锁诊所上线时一次创建数百个账号，逐个调用 AuthService.create_user 需要每人两次查重、
+一次 bcrypt（约 0.2~0.4 秒）、一次插入和提交。批量开通：
+- 每行单独校验格式，批次内重复与库中已有的用户名 / 邮箱用一条查询检出，逐行报告错误，其余行照常开通；
+- 密码哈希在进程池中并行计算；
+- 所有通过校验的账号在一个事务中以一条多行 INSERT 写入。与并发注册冲突导致唯一约束失败时，
+  回滚后重新查重并重试一次，已计算的哈希不会重算。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core import tracing
+from app.core.metrics import observe
+from app.models.user import User
+from app.schemas.user import UserCreate
+from app.services.auth import pwd_context
+
+logger = logging.getLogger(__name__)
+
+INSERT_ATTEMPTS = 2
+
+
+def hash_passwords_sync(passwords: list[str]) -> list[str]:
+    """进程池任务：哈希一组密码"""
+    return [pwd_context.hash(p) for p in passwords]
+
+
+@dataclass
+class ProvisionError:
+    """单行开通失败原因"""
+    row: int  # 在提交列表中的序号（从 0 开始）
+    username: str | None
+    field: str | None
+    message: str
+    duplicate_of: int | None = None  # 批次内重复时，首次出现的行序号
+
+
+@dataclass
+class ProvisionResult:
+    """批量开通结果"""
+    created: list[dict] = field(default_factory=list)  # {"row", "id", "username"}
+    errors: list[ProvisionError] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "errors": [vars(e) for e in sorted(self.errors, key=lambda e: e.row)],
+            "elapsed_seconds": round(self.elapsed, 2),
+        }
+
+
+class ProvisioningService:
+    """批量开通服务"""
+
+    @staticmethod
+    def _validate(records: list[Any], result: ProvisionResult) -> tuple[list[UserCreate | None], list[int]]:
+        """逐行校验为 UserCreate，返回 (与 records 对齐的结果，失败行为 None, 通过的行)"""
+        users: list[UserCreate | None] = []
+        accepted = []
+        for row, record in enumerate(records):
+            if isinstance(record, UserCreate):
+                users.append(record)
+                accepted.append(row)
+                continue
+            try:
+                users.append(UserCreate.model_validate(record))
+                accepted.append(row)
+            except ValidationError as e:
+                first = e.errors()[0]
+                username = record.get("username") if isinstance(record, dict) else None
+                result.errors.append(ProvisionError(
+                    row,
+                    username if isinstance(username, str) and username else None,
+                    ".".join(str(part) for part in first["loc"]) or None,
+                    first["msg"],
+                ))
+                users.append(None)
+        return users, accepted
+
+    @staticmethod
+    def _check_batch(users: list[UserCreate | None], rows: list[int], result: ProvisionResult) -> list[int]:
+        """批次内查重：用户名 / 邮箱重复时保留第一次出现的行"""
+        seen_usernames: dict[str, int] = {}
+        seen_emails: dict[str, int] = {}
+        accepted = []
+        for row in rows:
+            user = users[row]
+            if user.username in seen_usernames:
+                result.errors.append(ProvisionError(
+                    row, user.username, "username", "批次内用户名重复", seen_usernames[user.username]
+                ))
+            elif user.email in seen_emails:
+                result.errors.append(ProvisionError(
+                    row, user.username, "email", "批次内邮箱重复", seen_emails[user.email]
+                ))
+            else:
+                seen_usernames[user.username] = row
+                seen_emails[user.email] = row
+                accepted.append(row)
+        return accepted
+
+    @staticmethod
+    async def _check_existing(
+        db: AsyncSession, users: list[UserCreate | None], rows: list[int], result: ProvisionResult
+    ) -> list[int]:
+        """一条查询检出库中已存在的用户名与邮箱"""
+        if not rows:
+            return rows
+        usernames = {users[row].username for row in rows}
+        emails = {users[row].email for row in rows}
+        existing = await db.execute(
+            select(User.username, User.email).where(
+                or_(User.username.in_(usernames), User.email.in_(emails))
+            )
+        )
+        taken_usernames, taken_emails = set(), set()
+        for username, email in existing:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        accepted = []
+        for row in rows:
+            user = users[row]
+            if user.username in taken_usernames:
+                result.errors.append(ProvisionError(row, user.username, "username", "用户名已存在"))
+            elif user.email in taken_emails:
+                result.errors.append(ProvisionError(row, user.username, "email", "邮箱已存在"))
+            else:
+                accepted.append(row)
+        return accepted
+
+    @staticmethod
+    async def _hash_passwords(passwords: list[str], workers: int) -> list[str]:
+        """按进程数切块并行哈希，保持顺序"""
+        workers = max(1, min(workers, len(passwords)))
+        if workers == 1:
+            return await asyncio.to_thread(hash_passwords_sync, passwords)
+        size = -(-len(passwords) // workers)
+        chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        # 服务进程内有线程池与监控线程，直接 fork 可能继承被其他线程持有的锁，改用 forkserver
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as pool:
+            hashed = await asyncio.gather(*(
+                tracing.run_in_worker(pool, "provisioning.hash_passwords", hash_passwords_sync, chunk)
+                for chunk in chunks
+            ))
+        return [h for chunk in hashed for h in chunk]
+
+    @staticmethod
+    @observe("provisioning.provision")
+    async def provision(
+        db: AsyncSession,
+        records: list[Any],
+        workers: int | None = None,
+        dry_run: bool = False
+    ) -> ProvisionResult:
+        """批量开通账号（records 为 UserCreate 或原始行）；校验失败的行记入 errors，其余行全部写入，dry_run 时只校验不写库"""
+        workers = workers or settings.provision_workers or os.cpu_count() or 1
+        result = ProvisionResult()
+
+        users, rows = ProvisioningService._validate(records, result)
+        rows = ProvisioningService._check_batch(users, rows, result)
+        rows = await ProvisioningService._check_existing(db, users, rows, result)
+        if dry_run or not rows:
+            return result
+
+        hashed = dict(zip(rows, await ProvisioningService._hash_passwords(
+            [users[row].password for row in rows], workers
+        )))
+
+        for attempt in range(INSERT_ATTEMPTS):
+            try:
+                inserted = await db.execute(
+                    insert(User).returning(User.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "username": users[row].username,
+                            "email": users[row].email,
+                            "hashed_password": hashed[row],
+                            "role": users[row].role,
+                        }
+                        for row in rows
+                    ],
+                )
+                ids = inserted.scalars().all()
+                await db.commit()
+                break
+            except IntegrityError:
+                # 查重之后有并发注册抢先写入了相同的用户名或邮箱
+                await db.rollback()
+                if attempt == INSERT_ATTEMPTS - 1:
+                    raise
+                logger.warning("批量开通与并发注册冲突，重新查重后重试")
+                rows = await ProvisioningService._check_existing(db, users, rows, result)
+                if not rows:
+                    return result
+
+        result.created = [
+            {"row": row, "id": user_id, "username": users[row].username}
+            for row, user_id in zip(rows, ids)
+        ]
+        return result
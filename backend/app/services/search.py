@@ -0,0 +1,288 @@
+"""海报与模板全文检索（中文二元组倒排索引）
+
+- 分词：NFKC 归一化并转小写；连续汉字切成二元组（单字成词时保留单字），英文与数字按整词；
+- 索引：search_postings（所有者, 词元, 文档）与 search_terms（词元文档频次），
+  随海报 / 模板写入在同一事务中增量更新；
+- 查询：每个查询词元对应一个候选组，从文档频次最低的组开始取倒排表，
+  其余组只在候选文档内求交，打分为 Σ 权重 × idf，按分数与新旧排序后分页。
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import dialect_insert
+from app.models.brandguard import GeneratedPoster, PosterTemplate
+from app.models.search import SearchPosting, SearchTerm
+
+DOC_POSTER = "poster"
+DOC_TEMPLATE = "template"
+DOC_MODELS = {DOC_POSTER: GeneratedPoster, DOC_TEMPLATE: PosterTemplate}
+
+TITLE_WEIGHT = 3
+MAX_TOKEN_LENGTH = 32
+MAX_CANDIDATES = 50_000  # 最稀有词元的倒排表超过该长度时截断（按 doc_id 倒序，优先新文档）
+ID_CHUNK = 2000
+SNIPPET_RADIUS = 30
+
+_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[0-9a-z]+")
+
+
+def _normalize(text: str | None) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str | None) -> Counter:
+    """文本 -> 词元频次"""
+    tokens = Counter()
+    for match in _RUN.finditer(_normalize(text)):
+        run = match.group()
+        if run.isascii():
+            tokens[run[:MAX_TOKEN_LENGTH]] += 1
+        elif len(run) == 1:
+            tokens[run] += 1
+        else:
+            for i in range(len(run) - 1):
+                tokens[run[i:i + 2]] += 1
+    return tokens
+
+
+def document_tokens(title: str | None, body: str | None) -> Counter:
+    weights = Counter()
+    for token, n in tokenize(title).items():
+        weights[token] += n * TITLE_WEIGHT
+    weights.update(tokenize(body))
+    return weights
+
+
+@dataclass(frozen=True)
+class QueryTerm:
+    """查询词元；单个汉字按前缀匹配该字本身及所有以该字开头的二元组"""
+    token: str
+    prefix: bool = False
+
+    def condition(self, column):
+        return column.like(f"{self.token}%") if self.prefix else column == self.token
+
+
+def query_terms(query: str) -> list[QueryTerm]:
+    terms = []
+    for token in tokenize(query):
+        terms.append(QueryTerm(token, prefix=len(token) == 1 and not token.isascii()))
+    return terms
+
+
+def make_snippet(text: str, query: str) -> str:
+    """截取首个命中位置附近的片段"""
+    text = text or ""
+    normalized = _normalize(text)
+    needle = _normalize(query).strip()
+    position = normalized.find(needle) if needle else -1
+    if position < 0:
+        terms = tokenize(query)
+        position = min((p for p in (normalized.find(t) for t in terms) if p >= 0), default=0)
+    start = max(position - SNIPPET_RADIUS, 0)
+    end = min(position + len(needle) + SNIPPET_RADIUS, len(text))
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class SearchService:
+    """检索索引维护与查询"""
+
+    @staticmethod
+    async def _add_terms(db: AsyncSession, owner_id: int, counts: Counter) -> None:
+        if not counts:
+            return
+        # 按词元排序写入，并发事务以相同顺序加行锁，避免互相死锁
+        stmt = dialect_insert(db)(SearchTerm).values([
+            {"owner_id": owner_id, "token": token, "doc_count": n} for token, n in sorted(counts.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["owner_id", "token"],
+            set_={"doc_count": SearchTerm.doc_count + stmt.excluded.doc_count},
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def remove_document(db: AsyncSession, owner_id: int, doc_type: str, doc_id: int) -> None:
+        """删除文档的倒排记录并回退文档频次（不提交）"""
+        result = await db.execute(
+            delete(SearchPosting)
+            .where(SearchPosting.doc_type == doc_type, SearchPosting.doc_id == doc_id)
+            .returning(SearchPosting.token)
+        )
+        tokens = list(result.scalars())
+        if tokens:
+            await SearchService._add_terms(db, owner_id, Counter({t: -1 for t in tokens}))
+
+    @staticmethod
+    async def index_document(
+        db: AsyncSession,
+        owner_id: int,
+        doc_type: str,
+        doc_id: int,
+        title: str | None,
+        body: str | None,
+        replace: bool = False
+    ) -> None:
+        """写入文档倒排记录（不提交，由调用方与业务数据同一事务提交）"""
+        if replace:
+            await SearchService.remove_document(db, owner_id, doc_type, doc_id)
+        weights = document_tokens(title, body)
+        if not weights:
+            return
+        await db.execute(
+            SearchPosting.__table__.insert(),
+            [
+                {"owner_id": owner_id, "token": token, "doc_type": doc_type, "doc_id": doc_id, "weight": weight}
+                for token, weight in weights.items()
+            ],
+        )
+        await SearchService._add_terms(db, owner_id, Counter(dict.fromkeys(weights, 1)))
+
+    @staticmethod
+    async def _document_frequency(db: AsyncSession, owner_id: int, term: QueryTerm) -> int:
+        return await db.scalar(
+            select(func.coalesce(func.sum(SearchTerm.doc_count), 0))
+            .where(SearchTerm.owner_id == owner_id, term.condition(SearchTerm.token))
+        )
+
+    @staticmethod
+    async def _postings(
+        db: AsyncSession,
+        owner_id: int,
+        term: QueryTerm,
+        doc_types: list[str],
+        doc_ids: list[int] | None = None
+    ) -> dict[tuple[str, int], int]:
+        base = select(SearchPosting.doc_type, SearchPosting.doc_id, func.sum(SearchPosting.weight)).where(
+            SearchPosting.owner_id == owner_id,
+            term.condition(SearchPosting.token),
+            SearchPosting.doc_type.in_(doc_types),
+        ).group_by(SearchPosting.doc_type, SearchPosting.doc_id)
+
+        postings = {}
+        if doc_ids is None:
+            result = await db.execute(base.order_by(SearchPosting.doc_id.desc()).limit(MAX_CANDIDATES))
+            postings.update(((t, i), w) for t, i, w in result)
+            return postings
+        for start in range(0, len(doc_ids), ID_CHUNK):
+            result = await db.execute(base.where(SearchPosting.doc_id.in_(doc_ids[start:start + ID_CHUNK])))
+            postings.update(((t, i), w) for t, i, w in result)
+        return postings
+
+    @staticmethod
+    async def search(
+        db: AsyncSession,
+        owner_id: int,
+        query: str,
+        doc_types: list[str] | None = None,
+        skip: int = 0,
+        limit: int = 20
+    ) -> tuple[list[dict], int]:
+        """检索，返回 (当前页结果, 命中总数)"""
+        doc_types = doc_types or list(DOC_MODELS)
+        terms = query_terms(query)
+        if not terms:
+            return [], 0
+
+        frequencies = {
+            term: await SearchService._document_frequency(db, owner_id, term) for term in terms
+        }
+        if not all(frequencies.values()):
+            return [], 0
+        ordered = sorted(terms, key=frequencies.get)
+
+        scores: dict[tuple[str, int], float] = {}
+        for term in ordered:
+            idf = 1.0 / math.log2(1 + frequencies[term])
+            if not scores:
+                postings = await SearchService._postings(db, owner_id, term, doc_types)
+                scores = {key: weight * idf for key, weight in postings.items()}
+            else:
+                doc_ids = sorted({doc_id for _, doc_id in scores})
+                postings = await SearchService._postings(db, owner_id, term, doc_types, doc_ids)
+                scores = {key: scores[key] + weight * idf for key, weight in postings.items() if key in scores}
+            if not scores:
+                return [], 0
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0][1]))
+        page = ranked[skip:skip + limit]
+        return await SearchService._hydrate(db, owner_id, page, query), len(ranked)
+
+    @staticmethod
+    async def _hydrate(
+        db: AsyncSession,
+        owner_id: int,
+        page: list[tuple[tuple[str, int], float]],
+        query: str
+    ) -> list[dict]:
+        documents = {}
+        for doc_type, model in DOC_MODELS.items():
+            ids = [doc_id for (t, doc_id), _ in page if t == doc_type]
+            if not ids:
+                continue
+            result = await db.execute(select(model).where(model.id.in_(ids), model.user_id == owner_id))
+            for row in result.scalars():
+                documents[(doc_type, row.id)] = row
+
+        items = []
+        for key, score in page:
+            row = documents.get(key)
+            if row is None:
+                continue
+            doc_type = key[0]
+            title = row.title if doc_type == DOC_POSTER else row.name
+            body = row.content if doc_type == DOC_POSTER else row.description
+            items.append({
+                "doc_type": doc_type,
+                "id": row.id,
+                "title": title,
+                "snippet": make_snippet(body or title, query),
+                "score": round(score, 4),
+                "created_at": row.created_at,
+            })
+        return items
+
+    @staticmethod
+    async def rebuild(db: AsyncSession, batch_size: int = 1000) -> dict[str, int]:
+        """清空并重建全部索引"""
+        await db.execute(delete(SearchPosting))
+        await db.execute(delete(SearchTerm))
+        await db.commit()
+
+        indexed = {}
+        for doc_type, model in DOC_MODELS.items():
+            title_col, body_col = (
+                (model.title, model.content) if doc_type == DOC_POSTER else (model.name, model.description)
+            )
+            last_id, count = 0, 0
+            while True:
+                rows = (await db.execute(
+                    select(model.id, model.user_id, title_col, body_col)
+                    .where(model.id > last_id).order_by(model.id).limit(batch_size)
+                )).all()
+                if not rows:
+                    break
+                postings = []
+                terms: dict[int, Counter] = {}
+                for doc_id, owner_id, title, body in rows:
+                    weights = document_tokens(title, body)
+                    postings.extend(
+                        {"owner_id": owner_id, "token": t, "doc_type": doc_type, "doc_id": doc_id, "weight": w}
+                        for t, w in weights.items()
+                    )
+                    terms.setdefault(owner_id, Counter()).update(weights.keys())
+                if postings:
+                    await db.execute(SearchPosting.__table__.insert(), postings)
+                for owner_id, counts in sorted(terms.items()):
+                    await SearchService._add_terms(db, owner_id, counts)
+                await db.commit()
+                last_id = rows[-1][0]
+                count += len(rows)
+            indexed[doc_type] = count
+        return indexed
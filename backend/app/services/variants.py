@@ -0,0 +1,259 @@
+"""图片格式协商与转码缓存
+
+- 按 Accept 选择 AVIF / WebP（均不接受时输出 JPEG），宽度吸附到固定档位，不放大；
+- 变体以 "<原图内容哈希>-<宽度>.<格式>" 命名写入磁盘缓存，内容不可变，可直接作为 ETag；
+- 缓存总大小超过上限时按最近使用时间淘汰；目录由多个 worker 共享，淘汰前重新统计目录，
+  每个 worker 另在写入上限的 RESCAN_FRACTION 后重新统计，超出上限的幅度约为 worker 数 × 该比例；
+- 同一变体的并发请求共享一次编码（进程内 single-flight，多 worker 间靠原子重命名保证安全）。
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.config import settings
+from app.core import tracing
+from app.core.warmup import lazy_import, warmups
+
+logger = logging.getLogger(__name__)
+
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+features = lazy_import("PIL.features")
+
+RESCAN_FRACTION = 0.05  # 本进程写入达到上限的该比例后重新统计目录（其他 worker 的写入只有统计才可见）
+EVICT_TO = 0.9  # 淘汰到上限的该比例，避免之后每次写入都触发统计
+
+
+@dataclass(frozen=True)
+class VariantFormat:
+    """输出格式"""
+    name: str
+    media_type: str
+    suffix: str
+    pillow_format: str
+    options: tuple[tuple[str, object], ...]
+
+
+FORMATS = {
+    "avif": VariantFormat("avif", "image/avif", ".avif", "AVIF", (("quality", 55), ("speed", 6))),
+    "webp": VariantFormat("webp", "image/webp", ".webp", "WEBP", (("quality", 80), ("method", 4))),
+    "jpeg": VariantFormat("jpeg", "image/jpeg", ".jpg", "JPEG", (("quality", 82), ("optimize", True))),
+}
+# 按压缩率从高到低尝试
+PREFERENCE = ("avif", "webp")
+
+
+def _parse_accept(accept: str) -> dict[str, float]:
+    accepted = {}
+    for part in accept.split(","):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            accepted[media_type.lower()] = quality
+    return accepted
+
+
+def supported_formats() -> tuple[str, ...]:
+    """当前 Pillow 构建可编码的格式"""
+    return tuple(name for name in PREFERENCE if features.check(name))
+
+
+def negotiate_format(accept: str | None) -> VariantFormat | None:
+    """按 Accept 选择压缩格式；不接受 AVIF / WebP（含 image/* 通配）时返回 None"""
+    if not accept:
+        return None
+    accepted = _parse_accept(accept)
+    # 通配符不代表客户端能解码新格式，只认显式声明
+    candidates = [
+        name for name in supported_formats()
+        if accepted.get(FORMATS[name].media_type, 0) > 0
+    ]
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda name: accepted[FORMATS[name].media_type])
+    return FORMATS[best]
+
+
+def snap_width(width: int | None) -> int | None:
+    """吸附到不小于请求宽度的档位，超过最大档位时取最大档位"""
+    if width is None:
+        return None
+    widths = sorted(settings.variant_widths)
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def transcode_sync(source: Path, target: Path, fmt: VariantFormat, width: int | None) -> int:
+    """解码、按宽度缩放并编码到 target（先写临时文件再原子替换），返回文件大小"""
+    with Image.open(source) as img:
+        if width is not None and img.format == "JPEG":
+            # JPEG 可在解码时按 1/2、1/4、1/8 降采样，大图缩略时省去大部分解码开销；
+            # 按正方形请求，EXIF 旋转后宽度仍不小于目标宽度
+            img.draft("RGB", (width, width))
+        img = ImageOps.exif_transpose(img)
+        if width is not None and img.width > width:
+            img = img.resize((width, round(width * img.height / img.width)), Image.Resampling.LANCZOS)
+        if fmt.name == "jpeg" or img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB" if fmt.name == "jpeg" or "A" not in img.getbands() else "RGBA")
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        img.save(tmp, fmt.pillow_format, **dict(fmt.options))
+    tmp.replace(target)
+    return target.stat().st_size
+
+
+def _scan(root: Path) -> OrderedDict[str, int]:
+    """扫描缓存目录，按访问时间重建 LRU 顺序"""
+    root.mkdir(parents=True, exist_ok=True)
+    found = []
+    with os.scandir(root) as it:
+        for entry in it:
+            try:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat_result = entry.stat()
+                    found.append((max(stat_result.st_atime, stat_result.st_mtime), entry.name, stat_result.st_size))
+            except FileNotFoundError:
+                pass
+    found.sort()
+    return OrderedDict((name, size) for _, name, size in found)
+
+
+def _unlink_all(paths: list[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+class VariantCache:
+    """大小受限的磁盘 LRU 变体缓存
+
+    LRU 记录只在事件循环上读写，不需要加锁；扫描、utime、转码与淘汰删除都放到线程池。
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] | None = None
+        self._total = 0
+        self._written = 0  # 上次统计目录后本进程写入的字节数
+        self._rescanning = False
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def load(self) -> OrderedDict[str, int]:
+        """首次使用时扫描缓存目录"""
+        if self._entries is None:
+            entries = await asyncio.to_thread(_scan, self.root)
+            # 并发的首次请求可能都扫描了一遍，只采用先完成的结果
+            if self._entries is None:
+                self._entries = entries
+                self._total = sum(entries.values())
+        return self._entries
+
+    async def _touch(self, name: str) -> bool:
+        """刷新 LRU 顺序；文件已被其他 worker 淘汰时移除记录并返回 False"""
+        self._entries.move_to_end(name)
+        try:
+            await asyncio.to_thread(os.utime, self.root / name)
+        except FileNotFoundError:
+            self._total -= self._entries.pop(name, 0)
+            return False
+        return True
+
+    async def _add(self, name: str, size: int) -> None:
+        entries = await self.load()
+        self._total += size - entries.pop(name, 0)
+        entries[name] = size
+        self._written += size
+        if self._total <= self.max_bytes and self._written < self.max_bytes * RESCAN_FRACTION:
+            return
+        if self._rescanning:
+            return
+        self._rescanning = True
+        try:
+            # 本进程的记录不含其他 worker 写入的变体：重新统计目录，按所有 worker 的访问时间淘汰
+            entries = self._entries = await asyncio.to_thread(_scan, self.root)
+            self._total = sum(entries.values())
+            self._written = 0
+            evicted = []
+            if self._total > self.max_bytes:
+                while self._total > self.max_bytes * EVICT_TO and len(entries) > 1:
+                    oldest, oldest_size = entries.popitem(last=False)
+                    self._total -= oldest_size
+                    evicted.append(self.root / oldest)
+            if evicted:
+                await asyncio.to_thread(_unlink_all, evicted)
+        finally:
+            self._rescanning = False
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    async def _encode(self, source: Path, path: Path, fmt: VariantFormat, width: int | None) -> Path:
+        with tracing.span("variants.transcode", attributes={"image.format": fmt.name, "image.width": width}):
+            size = await asyncio.to_thread(transcode_sync, source, path, fmt, width)
+        await self._add(path.name, size)
+        return path
+
+    def _encode_done(self, name: str, task: asyncio.Task) -> None:
+        if self._inflight.get(name) is task:
+            del self._inflight[name]
+        if not task.cancelled():
+            # 等待者都已取消时异常无人读取，避免 "exception was never retrieved" 警告
+            task.exception()
+
+    async def get(self, source: Path, source_hash: str, fmt: VariantFormat, width: int | None) -> Path:
+        """返回变体文件路径，未命中时编码（并发请求共享同一次编码）"""
+        name = f"{source_hash}-{width or 'full'}{fmt.suffix}"
+        path = self.root / name
+        if name in await self.load() and await self._touch(name):
+            return path
+
+        # 编码是独立任务，发起它的请求被取消也不影响其他等待者；各请求经 shield 等待
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.create_task(self._encode(source, path, fmt, width))
+            self._inflight[name] = task
+            task.add_done_callback(lambda done: self._encode_done(name, done))
+        return await asyncio.shield(task)
+
+
+async def get_variant(
+    source: Path,
+    source_hash: str,
+    accept: str | None,
+    width: int | None
+) -> tuple[Path, VariantFormat] | None:
+    """按 Accept 与宽度取变体；无需转码或原图无法解码时返回 None（下发原图）"""
+    fmt = negotiate_format(accept)
+    width = snap_width(width)
+    if fmt is None and width is None:
+        return None
+    fmt = fmt or FORMATS["jpeg"]
+    try:
+        return await variant_cache.get(source, source_hash, fmt, width), fmt
+    except (OSError, ValueError) as e:
+        logger.warning("转码失败，下发原图 %s: %s", source, e)
+        return None
+
+
+variant_cache = VariantCache(settings.variant_cache_dir, settings.variant_cache_max_mb * 1024 * 1024)
+
+
+def _warm_codecs() -> None:
+    Image.init()
+    supported_formats()
+
+
+warmups.register("variants.pillow", _warm_codecs)
+warmups.register("variants.cache", variant_cache.load)
@@ -0,0 +1 @@
+# 性能基准与压测脚本
@@ -0,0 +1,111 @@
+"""相似病例向量索引查询基准
+
+在临时目录生成 N 行随机单位向量（含所有者与标签分布），训练 IVF 后测量过滤 top-k 查询延迟，
+并与暴力全量内积对比召回率。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_embeddings --rows 1000000 --json
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.embeddings import DELETED, EMBEDDING_DIM, EmbeddingIndex
+
+
+def build(root: str, rows: int, owners: int, seed: int) -> EmbeddingIndex:
+    rng = np.random.default_rng(seed)
+    index = EmbeddingIndex(root)
+    # 聚簇分布比均匀随机更接近真实向量
+    centers = rng.standard_normal((256, EMBEDDING_DIM)).astype(np.float32)
+    chunk = 100_000
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, EMBEDDING_DIM))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        tags = np.zeros(n, dtype=np.uint64)
+        # 皮肤问题：每张图随机 1-2 类；治疗类型：约 30% 的图做过第一种治疗
+        tags |= np.uint64(1) << rng.integers(0, 4, n).astype(np.uint64)
+        tags |= np.uint64(1) << rng.integers(0, 4, n).astype(np.uint64)
+        tags |= np.where(rng.random(n) < 0.3, np.uint64(1 << 8), np.uint64(0))
+        index.add(
+            list(range(start + 1, start + n + 1)),
+            rng.integers(1, owners + 1, n).tolist(),
+            vectors.astype(np.float32),
+            tags.tolist(),
+        )
+    index.encode_tags([((), ["祛痘"])])
+    return index
+
+
+def main(args) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        index = build(root, args.rows, args.owners, args.seed)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trained = index.train(args.lists)
+        train_seconds = time.perf_counter() - start
+
+        rng = np.random.default_rng(args.seed + 1)
+        queries = np.asarray(index._maps["vectors"][rng.integers(0, index.size, args.queries)])
+        filters = [
+            {},
+            {"issue_type": "acne"},
+            {"issue_type": "wrinkle", "treatment": "祛痘"},
+        ]
+        result = {
+            "rows": index.size,
+            "lists": trained["lists"],
+            "nprobe": args.nprobe,
+            "build_seconds": round(build_seconds, 2),
+            "train_seconds": round(train_seconds, 2),
+        }
+        vectors, owners, tags = index._maps["vectors"], index._maps["owners"], index._maps["tags"]
+        for spec in filters:
+            name = "+".join(spec.values()) or "none"
+            latencies, recalls = [], []
+            for query in queries:
+                owner = 1
+                start = time.perf_counter()
+                hits = index.search(query, owner, args.k, nprobe=args.nprobe, **spec)
+                latencies.append(time.perf_counter() - start)
+
+                required = index._tag_bits([spec["issue_type"]] if "issue_type" in spec else (),
+                                           [spec["treatment"]] if "treatment" in spec else ())
+                mask = (owners == owner) & ((tags & (np.uint64(required) | DELETED)) == np.uint64(required))
+                rows = np.flatnonzero(mask)
+                exact = set(index._maps["ids"][rows[np.argsort(-(vectors[rows] @ query))[:args.k]]].tolist())
+                recalls.append(len(exact & {i for i, _ in hits}) / max(len(exact), 1))
+            latencies.sort()
+            result[f"filter={name}"] = {
+                "p50_ms": round(statistics.median(latencies) * 1e3, 2),
+                "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1e3, 2),
+                "recall_at_k": round(statistics.mean(recalls), 3),
+            }
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="相似病例向量索引查询基准")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--owners", type=int, default=1, help="所有者（诊所账号）数，查询固定为 1 号")
+    parser.add_argument("--lists", type=int, default=None, help="IVF 列表数，默认 sqrt(行数)")
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    result = main(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for key, value in result.items():
+            print(f"{key:>32}: {value}")
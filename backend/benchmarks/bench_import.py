@@ -0,0 +1,110 @@
+"""冷启动基准：导入耗时与就绪耗时
+
+在全新子进程中执行 `import app.main`（-X importtime），统计总导入耗时和
+累计耗时最高的模块；再测一次从进程启动到 lifespan 预热完成（/ready 为 200）的耗时。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_import --runs 5 --top 15 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+READY_SCRIPT = """
+import asyncio, time
+start = time.perf_counter()
+from app.main import app
+from app.core.warmup import warmups
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        while not warmups.ready:
+            await asyncio.sleep(0.001)
+    return time.perf_counter()
+
+ready = asyncio.run(main())
+print(f"{(imported - start) * 1000:.2f} {(ready - start) * 1000:.2f}")
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """解析 -X importtime 输出，返回 (模块, self_us, cumulative_us)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line.split(":", 1)[1].split("|"))
+        rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def run_once(env: dict) -> tuple[float, list[tuple[str, int, int]]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    total = next((cum for name, _, cum in rows if name == "app.main"), 0)
+    return total / 1000, rows
+
+
+def run_ready(env: dict) -> tuple[float, float]:
+    proc = subprocess.run(
+        [sys.executable, "-c", READY_SCRIPT],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    imported_ms, ready_ms = proc.stdout.split()[-2:]
+    return float(imported_ms), float(ready_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="冷启动基准")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--warmup-mode", default="background", choices=["eager", "background", "lazy"])
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    env = {**os.environ, "WARMUP_MODE": args.warmup_mode}
+    totals, last_rows = [], []
+    for _ in range(args.runs):
+        total_ms, last_rows = run_once(env)
+        totals.append(total_ms)
+
+    ready_runs = [run_ready(env) for _ in range(args.runs)]
+    top = sorted(
+        (row for row in last_rows if row[0].split(".")[0] != "app" or row[0] == "app.main"),
+        key=lambda row: row[2], reverse=True,
+    )[:args.top]
+    app_modules = sorted((row for row in last_rows if row[0].startswith("app.")), key=lambda row: row[1], reverse=True)
+
+    result = {
+        "runs": args.runs,
+        "warmup_mode": args.warmup_mode,
+        "import_app_main_ms": round(statistics.median(totals), 2),
+        "process_import_ms": round(statistics.median(r[0] for r in ready_runs), 2),
+        "process_ready_ms": round(statistics.median(r[1] for r in ready_runs), 2),
+        "top_cumulative_ms": {name: round(cum / 1000, 2) for name, _, cum in top},
+        "app_modules_self_ms": {name: round(self_us / 1000, 2) for name, self_us, _ in app_modules[:args.top]},
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for name, ms in value.items():
+                print(f"    {name:<48} {ms:>9} ms")
+        else:
+            print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
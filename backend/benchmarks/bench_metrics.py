@@ -0,0 +1,115 @@
+"""MetricsMiddleware 单请求开销基准
+
+直接以 ASGI 调用方式驱动一个最小 FastAPI 应用（不经过网络与 HTTP 客户端），
+分别测量挂载/不挂载中间件时的单请求耗时，差值即中间件开销。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_metrics --requests 20000 --json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from fastapi import FastAPI
+
+from app.core.metrics import MetricsMiddleware, observe
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def drive(app, n: int) -> float:
+    """顺序发送 n 个请求，返回平均单请求耗时（秒）"""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def make_scope(i: int) -> dict:
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/items/{i}",
+            "raw_path": f"/items/{i}".encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1),
+            "server": ("bench", 80),
+        }
+
+    # 预热，触发中间件栈构建
+    for i in range(200):
+        await app(make_scope(i), receive, send)
+
+    start = time.perf_counter()
+    for i in range(n):
+        await app(make_scope(i), receive, send)
+    return (time.perf_counter() - start) / n
+
+
+def bench_observe(n: int) -> float:
+    """observe 装饰器单次调用开销（秒）"""
+    @observe("bench.noop")
+    def noop():
+        return None
+
+    def plain():
+        return None
+
+    start = time.perf_counter()
+    for _ in range(n):
+        noop()
+    wrapped = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        plain()
+    return (wrapped - (time.perf_counter() - start)) / n
+
+
+async def main(args) -> dict:
+    baseline_runs, metrics_runs = [], []
+    for _ in range(args.repeat):
+        baseline_runs.append(await drive(build_app(False), args.requests))
+        metrics_runs.append(await drive(build_app(True), args.requests))
+
+    baseline = statistics.median(baseline_runs)
+    with_metrics = statistics.median(metrics_runs)
+    return {
+        "requests": args.requests,
+        "repeat": args.repeat,
+        "baseline_us": round(baseline * 1e6, 2),
+        "with_metrics_us": round(with_metrics * 1e6, 2),
+        "middleware_overhead_us": round((with_metrics - baseline) * 1e6, 2),
+        "observe_overhead_us": round(bench_observe(args.requests * 5) * 1e6, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MetricsMiddleware 开销基准")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for key, value in result.items():
+            print(f"{key:>24}: {value}")
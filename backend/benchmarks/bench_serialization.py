@@ -0,0 +1,115 @@
+"""列表接口序列化开销基准
+
+对比 1k 条记录时的单条序列化成本：
+- legacy: 手动 model_validate 每一项 + FastAPI response_model 二次校验 + jsonable_encoder + json
+- fast:   预构建 ModelSerializer，一次 from_attributes 校验 + pydantic-core 直接输出 JSON
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_serialization --items 1000 --json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.core.responses import ModelSerializer
+from app.schemas.brandguard import GeneratedPosterResponse, PosterTemplateResponse
+from app.schemas.facesim import SimulationListItem, SimulationListResponse
+from benchmarks.micro import _posters, _simulations
+
+
+def _templates(n: int) -> list:
+    from datetime import datetime
+
+    from app.models.brandguard import PosterTemplate
+
+    now = datetime.utcnow()
+    return [
+        PosterTemplate(
+            id=i, user_id=1, name=f"模板 {i}", description="基准模板",
+            layout_config={"layers": [{"type": "text", "x": 80, "y": 120 + j * 40} for j in range(8)]},
+            layout_hash="0" * 64, version=1,
+            width=1080, height=1920, thumbnail_url=None, created_at=now, updated_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+class LegacyPath:
+    """模拟 FastAPI 对 response_model 的处理流程（字段同样只构建一次）"""
+
+    def __init__(self, response_model):
+        self.field = create_model_field(name="response", type_=response_model, mode="serialization")
+        self.loop = asyncio.new_event_loop()
+
+    def __call__(self, content) -> bytes:
+        data = self.loop.run_until_complete(serialize_response(field=self.field, response_content=content))
+        return JSONResponse(data).body
+
+
+def timed(func, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表序列化基准")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    sims, posters, templates = _simulations(args.items), _posters(args.items), _templates(args.items)
+    legacy_sims = LegacyPath(SimulationListResponse)
+    legacy_posters = LegacyPath(list[GeneratedPosterResponse])
+    legacy_templates = LegacyPath(list[PosterTemplateResponse])
+    fast_sims = ModelSerializer(SimulationListResponse)
+    fast_posters = ModelSerializer(list[GeneratedPosterResponse])
+    fast_templates = ModelSerializer(list[PosterTemplateResponse])
+    cases = {
+        "simulations": (
+            lambda: legacy_sims(SimulationListResponse(
+                total=len(sims), items=[SimulationListItem.model_validate(s) for s in sims]
+            )),
+            lambda: fast_sims.dump({"total": len(sims), "items": sims}),
+        ),
+        "posters": (
+            lambda: legacy_posters(posters),
+            lambda: fast_posters.dump(posters),
+        ),
+        "templates": (
+            lambda: legacy_templates(templates),
+            lambda: fast_templates.dump(templates),
+        ),
+    }
+
+    result = {"items": args.items, "rounds": args.rounds, "per_item_us": {}}
+    for name, (legacy, fast) in cases.items():
+        legacy()
+        fast()
+        legacy_s = timed(legacy, args.rounds)
+        fast_s = timed(fast, args.rounds)
+        result["per_item_us"][name] = {
+            "legacy": round(legacy_s / args.items * 1e6, 3),
+            "fast": round(fast_s / args.items * 1e6, 3),
+            "speedup": round(legacy_s / fast_s, 2),
+        }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for name, row in result["per_item_us"].items():
+            print(f"{name:<12} legacy {row['legacy']:>8} µs/item   fast {row['fast']:>8} µs/item   x{row['speedup']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""对象存储传输基准：分片并行度对上传 / 下载吞吐的影响
+
+对 S3 兼容端点（本地可用 docker compose 中的 MinIO）按 S3_* 配置上传、下载一个随机对象，
+分别以不同的分片并行度运行，报告 MB/s；下载前清空本地副本，测的是冷读。
+
+用法（在 backend 目录下）:
+    S3_ENDPOINT_URL=http://localhost:9000 S3_ACCESS_KEY=minioadmin S3_SECRET_KEY=minioadmin \\
+        python -m benchmarks.bench_storage --size-mb 256 --concurrency 1,4,8 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from app.config import settings
+from app.core.storage import ObjectCache, S3Storage
+
+KEY = "bench/storage.bin"
+
+
+async def _chunks(data: bytes, size: int = 1024 * 1024):
+    view = memoryview(data)
+    for start in range(0, len(data), size):
+        yield bytes(view[start:start + size])
+
+
+async def run_case(args, data: bytes, concurrency: int, cache_dir: str) -> dict:
+    storage = S3Storage(
+        args.endpoint or settings.s3_endpoint_url,
+        settings.s3_bucket,
+        settings.s3_region,
+        settings.s3_access_key,
+        settings.s3_secret_key,
+        cache=ObjectCache(cache_dir, 2 * len(data) + 1),
+        part_size=args.part_size_mb * 1024 * 1024,
+        concurrency=concurrency,
+    )
+    uploads, downloads = [], []
+    try:
+        await storage.ensure_bucket()
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            await storage.save(KEY, _chunks(data))
+            uploads.append(time.perf_counter() - start)
+
+            storage.cache.discard(KEY)
+            start = time.perf_counter()
+            found = await storage.fetch(KEY)
+            downloads.append(time.perf_counter() - start)
+            assert found is not None and found[1].st_size == len(data)
+            storage.cache.discard(KEY)
+        await storage.delete([KEY])
+    finally:
+        await storage.close()
+    mb = len(data) / 1024 / 1024
+    return {
+        "concurrency": concurrency,
+        "upload_mb_s": round(mb / statistics.median(uploads), 1),
+        "download_mb_s": round(mb / statistics.median(downloads), 1),
+    }
+
+
+async def main(args) -> dict:
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            results.append(await run_case(args, data, concurrency, tmp))
+    return {"size_mb": args.size_mb, "part_size_mb": args.part_size_mb, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对象存储分片并行传输基准")
+    parser.add_argument("--endpoint", help="默认取 S3_ENDPOINT_URL")
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--part-size-mb", type=int, default=settings.s3_part_size_mb)
+    parser.add_argument("--concurrency", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for row in result["results"]:
+            print(
+                f"concurrency={row['concurrency']:>2} "
+                f"upload={row['upload_mb_s']}MB/s download={row['download_mb_s']}MB/s"
+            )
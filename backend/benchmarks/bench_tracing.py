@@ -0,0 +1,85 @@
+"""TracingMiddleware 单请求开销基准
+
+与 bench_metrics 相同，以 ASGI 调用方式驱动一个最小 FastAPI 应用，每个请求内含若干 observe 子跨度，
+分别测量：不挂载追踪、挂载但未采样（尾部采样记录后丢弃，生产环境绝大多数请求的路径）、
+全部采样并导出到临时文件三种情况的单请求耗时。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_tracing --requests 20000 --spans 5 --json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+from pathlib import Path
+
+from fastapi import FastAPI
+
+from app.core.metrics import observe
+from app.core.tracing import TracingMiddleware, tracer
+from benchmarks.bench_metrics import drive
+
+
+def build_app(with_tracing: bool, spans: int) -> FastAPI:
+    app = FastAPI()
+
+    @observe("bench.step")
+    async def step():
+        return None
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        for _ in range(spans):
+            await step()
+        return {"id": item_id}
+
+    if with_tracing:
+        app.add_middleware(TracingMiddleware)
+    return app
+
+
+async def run_case(args, exporter: str, sample_ratio: float, file: str) -> float:
+    # 尾部阈值取足够大，未被头部采样的请求全部丢弃
+    tracer.configure(exporter, sample_ratio, 60_000, file=file, max_queue_spans=10_000_000)
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            runs.append(await drive(build_app(exporter != "none", args.spans), args.requests))
+    finally:
+        await asyncio.to_thread(tracer.shutdown)
+    return statistics.median(runs)
+
+
+async def main(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        file = str(Path(tmp) / "spans.jsonl")
+        baseline = await run_case(args, "none", 0.0, file)
+        unsampled = await run_case(args, "file", 0.0, file)
+        sampled = await run_case(args, "file", 1.0, file)
+    return {
+        "requests": args.requests,
+        "repeat": args.repeat,
+        "spans_per_request": args.spans + 1,
+        "baseline_us": round(baseline * 1e6, 2),
+        "unsampled_us": round(unsampled * 1e6, 2),
+        "sampled_us": round(sampled * 1e6, 2),
+        "unsampled_overhead_us": round((unsampled - baseline) * 1e6, 2),
+        "sampled_overhead_us": round((sampled - baseline) * 1e6, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TracingMiddleware 开销基准")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--spans", type=int, default=5, help="每个请求内的子跨度数")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for key, value in result.items():
+            print(f"{key:>24}: {value}")
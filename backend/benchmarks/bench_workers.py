@@ -0,0 +1,209 @@
+"""多 worker 部署基准：每 worker 内存与总吞吐
+
+按 gunicorn.conf.py 启动服务（临时 SQLite 库与临时权重目录），分别以 1 / 4 / 16 个 worker
+压测一个不访问数据库的接口，报告：
+- 总吞吐（req/s）与 p50 / p99 延迟；
+- 每个 worker 的 RSS、PSS（按共享进程数分摊后的内存）与 USS（独占内存），以及全部进程 PSS 之和。
+--compare-no-preload 时额外以 WEB_PRELOAD=0 运行，对比预加载的写时复制共享效果；
+--weights-mb 生成一份合成权重文件，观察内存映射权重是否只占一份物理内存。
+
+压测客户端与服务在同一台机器上争用 CPU，结果用于同机版本对比，不代表线上绝对值。
+需要 Linux（/proc）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_workers --workers 1,4,16 --duration 10 --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PAYLOAD = {"content": "热玛吉紧致提拉，效果自然持久，欢迎到院咨询。"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def memory(pid: int) -> dict[str, int]:
+    """RSS / PSS / USS（KB）"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                values[key] = int(rest.split()[0])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def client(url: str, path: str, duration: float, concurrency: int) -> list[float]:
+    """压测进程：在 duration 秒内以 concurrency 个并发连接循环请求，返回各请求耗时"""
+    async def run() -> list[float]:
+        latencies = []
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as http:
+            async def loop():
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    response = await http.post(path, json=PAYLOAD)
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return latencies
+
+    return asyncio.run(run())
+
+
+def wait_ready(url: str, workers: int, master: int, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health", timeout=2).status_code == 200 and len(children(master)) >= workers:
+                # 等所有 worker 完成 lifespan 预热
+                time.sleep(1)
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("服务启动超时")
+
+
+def run_case(args, workers: int, preload: bool, workdir: Path) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        BIND=f"127.0.0.1:{port}",
+        WEB_WORKERS=str(workers),
+        WEB_PRELOAD="1" if preload else "0",
+        DATABASE_URL=f"sqlite+aiosqlite:///{workdir / 'bench.db'}",
+        WEIGHTS_DIR=str(workdir / "models"),
+        METRICS_ENABLED="false",
+    )
+    log = open(workdir / f"gunicorn-{workers}-{int(preload)}.log", "wb")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null",
+         "app.main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        wait_ready(url, workers, server.pid)
+        with multiprocessing.Pool(args.clients) as pool:
+            start = time.perf_counter()
+            results = pool.starmap(
+                client, [(url, args.path, args.duration, args.concurrency)] * args.clients
+            )
+            elapsed = time.perf_counter() - start
+        latencies = sorted(l for r in results for l in r)
+
+        worker_pids = children(server.pid)
+        per_worker = [memory(pid) for pid in worker_pids]
+        master = memory(server.pid)
+        return {
+            "workers": workers,
+            "preload": preload,
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1e3, 2) if latencies else None,
+            "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1e3, 2) if latencies else None,
+            "worker_rss_mb": round(statistics.mean(m["rss"] for m in per_worker) / 1024, 1),
+            "worker_pss_mb": round(statistics.mean(m["pss"] for m in per_worker) / 1024, 1),
+            "worker_uss_mb": round(statistics.mean(m["uss"] for m in per_worker) / 1024, 1),
+            "master_rss_mb": round(master["rss"] / 1024, 1),
+            "total_pss_mb": round((master["pss"] + sum(m["pss"] for m in per_worker)) / 1024, 1),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+def main(args) -> dict:
+    from app.core.weights import save_weights
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        (workdir / "models").mkdir()
+        if args.weights_mb:
+            rng = np.random.default_rng(0)
+            save_weights(
+                workdir / "models" / "skin_detector.safetensors",
+                {"backbone": rng.standard_normal(args.weights_mb * 1024 * 1024 // 4, dtype=np.float32)},
+            )
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{workdir / 'bench.db'}"),
+        )
+        modes = [True, False] if args.compare_no_preload else [True]
+        for workers in args.workers:
+            for preload in modes:
+                results.append(run_case(args, workers, preload, workdir))
+                print(json.dumps(results[-1], ensure_ascii=False), file=sys.stderr, flush=True)
+    return {
+        "cpus": len(os.sched_getaffinity(0)),
+        "path": args.path,
+        "duration": args.duration,
+        "clients": args.clients,
+        "concurrency": args.concurrency,
+        "weights_mb": args.weights_mb,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多 worker 部署内存与吞吐基准")
+    parser.add_argument("--workers", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="每组压测秒数")
+    parser.add_argument("--clients", type=int, default=4, help="压测进程数")
+    parser.add_argument("--concurrency", type=int, default=32, help="每个压测进程的并发连接数")
+    parser.add_argument("--path", default="/brandguard/check-compliance")
+    parser.add_argument("--weights-mb", type=int, default=256, help="合成权重文件大小，0 表示不生成")
+    parser.add_argument("--compare-no-preload", action="store_true", help="同时以不预加载方式运行对比")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    result = main(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for row in result["results"]:
+            print(
+                f"workers={row['workers']:>3} preload={row['preload']!s:>5} "
+                f"rps={row['throughput_rps']:>8} p50={row['p50_ms']}ms p99={row['p99_ms']}ms "
+                f"rss={row['worker_rss_mb']}MB pss={row['worker_pss_mb']}MB uss={row['worker_uss_mb']}MB "
+                f"total_pss={row['total_pss_mb']}MB"
+            )
@@ -0,0 +1,446 @@
+"""API 压测套件
+
+默认在进程内以 ASGI 方式启动应用，使用临时 SQLite 库（也可通过 --database-url
+指向本地 Postgres），批量灌入仿真数据后按场景并发压测，输出吞吐、p50/p95/p99
+延迟与内存占用。结果为 JSON，便于不同版本间对比（--compare 旧结果.json）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.loadtest --concurrency 32 --requests 2000 --output run.json
+    python -m benchmarks.loadtest --base-url http://localhost:8000 --skip-seed
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+COMPLIANCE_SAMPLES = [
+    "热玛吉紧致提拉，效果自然持久，欢迎到院咨询。",
+    "超皮秒祛斑，最先进技术，一次见效无副作用！",
+    "水光针补水焕亮，专业医生团队为您定制方案。",
+    "光子嫩肤改善暗沉，疗程安排请咨询您的专属顾问。",
+]
+TREATMENTS = ["祛痘", "祛斑", "热玛吉", "水光针", "光子嫩肤", "超声刀"]
+
+
+# ---------------------------------------------------------------- 数据生成
+
+def synthetic_face_png(size: int = 256, seed: int = 0) -> bytes:
+    """生成一张合成“人脸”PNG（肤色椭圆 + 随机斑点），仅依赖标准库"""
+    rng = random.Random(seed)
+    cx, cy = size / 2, size / 2
+    rx, ry = size * 0.35, size * 0.45
+    spots = [(rng.uniform(cx - rx / 2, cx + rx / 2), rng.uniform(cy - ry / 2, cy + ry / 2)) for _ in range(12)]
+    rows = []
+    for y in range(size):
+        row = bytearray(b"\x00")
+        for x in range(size):
+            if ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1:
+                r, g, b = 233, 196, 170
+                if any((x - sx) ** 2 + (y - sy) ** 2 < 9 for sx, sy in spots):
+                    r, g, b = 190, 120, 110
+            else:
+                r, g, b = 245, 245, 245
+            row += bytes((r, g, b))
+        rows.append(bytes(row))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+async def seed(args) -> dict:
+    """灌入用户、图片、分析、模拟记录、模板与海报（图片经 storage 写入，数据库中存对象键）"""
+    from sqlalchemy import insert
+
+    from app.database import Base, engine
+    from app.models.brandguard import (
+        GeneratedPoster, LayoutNode, PosterTemplate, PosterTemplateVersion, VIConfig
+    )
+    from app.models.facesim import (
+        FaceImage, ImageQualityStatus, Simulation, SimulationStatus, SkinAnalysis, SkinIssueType
+    )
+    from app.models.user import User, UserRole
+    from app.core.storage import storage
+    from app.services.auth import AuthService
+    from app.services.facesim import upload_key
+    from app.services.layouts import REF, canonical_json, split
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    chunk_size = 5000
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    image_paths = []
+    for i in range(args.seed_image_files):
+        key = upload_key(f"seed_{i}.png")
+        path = storage.staging_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(synthetic_face_png(256, seed=i))
+        await storage.save_file(key, "image/png")
+        image_paths.append(key)
+
+    hashed = AuthService.hash_password(args.password)
+    roles = list(UserRole)
+
+    async def bulk(conn, model, rows):
+        for i in range(0, len(rows), chunk_size):
+            await conn.execute(insert(model), rows[i:i + chunk_size])
+
+    async with engine.begin() as conn:
+        users = [{
+            "id": 1, "username": "bench_manager", "email": "manager@bench.local",
+            "hashed_password": hashed, "role": UserRole.MANAGER, "is_active": True,
+            "created_at": now, "updated_at": now,
+        }]
+        for i in range(2, args.seed_users + 1):
+            users.append({
+                "id": i, "username": f"bench_user_{i}", "email": f"user{i}@bench.local",
+                "hashed_password": hashed, "role": roles[i % len(roles)], "is_active": True,
+                "created_at": now, "updated_at": now,
+            })
+        await bulk(conn, User, users)
+
+        n_images = max(1, args.seed_simulations // 10)
+        await bulk(conn, FaceImage, [{
+            "id": i, "user_id": 1, "file_path": image_paths[i % len(image_paths)],
+            "quality_status": ImageQualityStatus.PASSED, "quality_score": 0.92,
+            "quality_issues": {"brightness": "good", "blur": "none", "face_detected": True},
+            "created_at": now - timedelta(minutes=i),
+        } for i in range(1, n_images + 1)])
+
+        issue_types = list(SkinIssueType)
+        n_analyses = n_images * 2
+        await bulk(conn, SkinAnalysis, [{
+            "id": i, "image_id": (i - 1) // 2 + 1, "issue_type": issue_types[i % len(issue_types)],
+            "severity": rng.randint(1, 10), "confidence": round(rng.uniform(0.6, 0.99), 2),
+            "detected_areas": {"regions": [
+                {"x": rng.randint(0, 200), "y": rng.randint(0, 200), "width": 40, "height": 40}
+                for _ in range(rng.randint(1, 6))
+            ]},
+            "created_at": now - timedelta(minutes=i),
+        } for i in range(1, n_analyses + 1)])
+
+        await bulk(conn, Simulation, [{
+            "id": i, "analysis_id": rng.randint(1, n_analyses), "user_id": 1,
+            "treatment_type": rng.choice(TREATMENTS),
+            "simulated_image_path": image_paths[i % len(image_paths)],
+            "comparison_image_path": image_paths[(i + 1) % len(image_paths)],
+            "status": SimulationStatus.COMPLETED, "parameters": {"intensity": rng.randint(1, 10)},
+            "created_at": now - timedelta(minutes=i), "completed_at": now - timedelta(minutes=i),
+        } for i in range(1, args.seed_simulations + 1)])
+
+        await conn.execute(insert(VIConfig), [{
+            "user_id": 1, "brand_name": "Bench Clinic", "created_at": now, "updated_at": now,
+        }])
+        # 模板间只有标题图层不同，其余图层共享布局节点
+        nodes, layout_hashes = {}, []
+        for i in range(1, args.seed_templates + 1):
+            layers = [{"type": "text", "x": 80, "y": 120 + j * 40} for j in range(8)]
+            layout_hashes.append(split({"layers": [{"type": "title", "text": f"模板 {i}"}] + layers}, nodes, root=True)[REF])
+        await bulk(conn, LayoutNode, [
+            {"hash": digest, "body": body, "size": len(canonical_json(body)), "created_at": now}
+            for digest, body in nodes.items()
+        ])
+        await bulk(conn, PosterTemplate, [{
+            "id": i, "user_id": 1, "name": f"模板 {i}", "description": "压测模板",
+            "layout_hash": layout_hashes[i - 1], "version": 1,
+            "width": 1080, "height": 1920, "created_at": now, "updated_at": now,
+        } for i in range(1, args.seed_templates + 1)])
+        await bulk(conn, PosterTemplateVersion, [{
+            "template_id": i, "number": 1, "layout_hash": layout_hashes[i - 1], "created_at": now,
+        } for i in range(1, args.seed_templates + 1)])
+
+        await bulk(conn, GeneratedPoster, [{
+            "id": i, "user_id": 1, "template_id": rng.randint(1, args.seed_templates),
+            "title": f"{rng.choice(TREATMENTS)} 活动 {i}", "content": rng.choice(COMPLIANCE_SAMPLES),
+            "image_url": f"https://placeholder.com/poster_{i}.png", "compliance_checked": True,
+            "compliance_issues": None, "created_at": now - timedelta(minutes=i),
+        } for i in range(1, args.seed_posters + 1)])
+
+    return {
+        "users": args.seed_users,
+        "face_images": n_images,
+        "skin_analyses": n_analyses,
+        "simulations": args.seed_simulations,
+        "templates": args.seed_templates,
+        "posters": args.seed_posters,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+# ---------------------------------------------------------------- 场景
+
+def build_scenarios(args, counts: dict, face_png: bytes) -> dict:
+    n_analyses = counts.get("skin_analyses", 1)
+    n_sims = counts.get("simulations", 1)
+
+    async def login(client, rng):
+        return await client.post("/auth/login", data={"username": "bench_manager", "password": args.password})
+
+    async def upload(client, rng):
+        return await client.post("/facesim/upload", files={"file": ("face.png", face_png, "image/png")})
+
+    async def simulate(client, rng):
+        return await client.post("/facesim/simulate", json={
+            "analysis_id": rng.randint(1, n_analyses), "treatment_type": rng.choice(TREATMENTS),
+            "intensity": rng.randint(1, 10),
+        })
+
+    async def simulations(client, rng):
+        skip = rng.randint(0, max(0, n_sims - args.page_size))
+        return await client.get("/facesim/simulations", params={"skip": skip, "limit": args.page_size})
+
+    async def simulation_detail(client, rng):
+        return await client.get(f"/facesim/simulations/{rng.randint(1, n_sims)}")
+
+    async def vi_config(client, rng):
+        return await client.get("/brandguard/vi-config")
+
+    async def templates(client, rng):
+        return await client.get("/brandguard/templates")
+
+    async def posters(client, rng):
+        return await client.get("/brandguard/posters")
+
+    async def generate(client, rng):
+        return await client.post("/brandguard/generate", json={
+            "title": f"{rng.choice(TREATMENTS)} 限时活动", "content": rng.choice(COMPLIANCE_SAMPLES),
+        })
+
+    async def compliance(client, rng):
+        return await client.post("/brandguard/check-compliance", json={"content": rng.choice(COMPLIANCE_SAMPLES)})
+
+    return {
+        "auth_login": login,
+        "facesim_upload": upload,
+        "facesim_simulate": simulate,
+        "facesim_simulations": simulations,
+        "facesim_simulation_detail": simulation_detail,
+        "brandguard_vi_config": vi_config,
+        "brandguard_templates": templates,
+        "brandguard_posters": posters,
+        "brandguard_generate": generate,
+        "brandguard_check_compliance": compliance,
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+
+async def run_scenario(client, name: str, func, requests: int, concurrency: int, seed: int) -> dict:
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    remaining = requests
+
+    async def worker(worker_id: int):
+        nonlocal remaining
+        rng = random.Random(seed * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await func(client, rng)
+                code = str(response.status_code)
+            except Exception as e:  # 网络错误等也计入结果
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(v for k, v in statuses.items() if k.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(1 - ok / len(latencies), 4) if latencies else 0.0,
+        "status_counts": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "rss_mb": {"before": round(rss_before, 1), "after": round(current_rss_mb(), 1)},
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict) -> list[str]:
+    """与上一次结果逐场景对比"""
+    lines = []
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        rps_delta = (result["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100 if old["throughput_rps"] else 0
+        p99_delta = (result["latency_ms"]["p99"] - old["latency_ms"]["p99"]) / old["latency_ms"]["p99"] * 100 if old["latency_ms"]["p99"] else 0
+        lines.append(f"{name:<30} rps {rps_delta:+7.1f}%   p99 {p99_delta:+7.1f}%")
+    return lines
+
+
+async def main(args) -> dict:
+    import httpx
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="aestheticore-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    counts: dict = {}
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+        lifespan = None
+        database_url = None
+    else:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+        os.environ["DATABASE_URL"] = database_url
+        if not args.keep_rate_limits:
+            # 压测吞吐时关闭按用户限流与并发闸门，所有请求都来自同一个用户
+            os.environ["RATE_LIMITS"] = "{}"
+            os.environ["HEAVY_WORK_CONCURRENCY"] = str(max(args.concurrency, 8))
+            os.environ["HEAVY_WORK_QUEUE"] = str(args.concurrency * 4)
+        os.chdir(workdir)  # uploads/ 相对路径落在临时目录
+        sys.path.insert(0, str(BACKEND_DIR))
+        from app.database import engine
+        from app.main import app
+
+        engine.sync_engine.echo = False
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+        if not args.skip_seed:
+            counts = await seed(args)
+            print(f"seeded: {counts}", file=sys.stderr)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                   timeout=args.timeout)
+
+    if args.skip_seed or args.base_url:
+        counts = {
+            "skin_analyses": args.seed_simulations // 5 or 1,
+            "simulations": args.seed_simulations,
+        }
+
+    # facesim 路由按 JWT 识别用户，先以种子数据的 bench_manager（id=1）登录
+    response = await client.post("/auth/login", data={"username": "bench_manager", "password": args.password})
+    if response.status_code == 200:
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    else:
+        print(f"login as bench_manager failed: HTTP {response.status_code}", file=sys.stderr)
+
+    scenarios = build_scenarios(args, counts, synthetic_face_png(256, seed=args.seed))
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    results = {}
+    try:
+        for name in selected:
+            func = scenarios[name]
+            requests = args.requests_heavy if name in ("auth_login", "brandguard_posters") else args.requests
+            results[name] = await run_scenario(client, name, func, requests, args.concurrency, args.seed)
+            print(f"{name:<30} {results[name]['throughput_rps']:>9} rps  "
+                  f"p50 {results[name]['latency_ms']['p50']:>8} ms  p99 {results[name]['latency_ms']['p99']:>8} ms",
+                  file=sys.stderr)
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "target": args.base_url or "in-process",
+            "database": database_url.split("@")[-1] if database_url else None,
+            "concurrency": args.concurrency,
+            "seed": counts,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AesthetiCore API 压测")
+    parser.add_argument("--base-url", help="压测已启动的服务；不指定则进程内启动应用")
+    parser.add_argument("--database-url", help="进程内模式使用的数据库，默认临时 SQLite")
+    parser.add_argument("--workdir", help="进程内模式的工作目录（数据库与上传文件）")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="进程内模式保留限流配置")
+    parser.add_argument("--skip-seed", action="store_true", help="不灌数据，直接压测")
+    parser.add_argument("--scenarios", help="逗号分隔的场景名，默认全部")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="每个场景的请求数")
+    parser.add_argument("--requests-heavy", type=int, default=100, help="bcrypt 登录、海报全量列表等重场景的请求数")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seed-users", type=int, default=50)
+    parser.add_argument("--seed-simulations", type=int, default=100_000)
+    parser.add_argument("--seed-templates", type=int, default=200)
+    parser.add_argument("--seed-posters", type=int, default=10_000)
+    parser.add_argument("--seed-image-files", type=int, default=32)
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--output", help="结果 JSON 输出路径，默认打印到 stdout")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+    # 进程内模式会切换工作目录，先把输出路径固定下来
+    output = Path(args.output).resolve() if args.output else None
+    previous_path = Path(args.compare).resolve() if args.compare else None
+
+    result = asyncio.run(main(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if output:
+        output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    if previous_path:
+        previous = json.loads(previous_path.read_text(encoding="utf-8"))
+        print("\n".join(compare(result, previous)), file=sys.stderr)
@@ -0,0 +1,345 @@
+"""服务热路径微基准与回归门禁
+
+每个用例是一个生成器：yield 之前做准备，yield 出被测的零参函数，yield 之后清理。
+运行时自动校准循环次数，取多轮中位数作为单次耗时；与保存的基线对比，
+任一用例变慢超过阈值即以非零状态退出，可直接用作 CI 门禁；基线缺失时同样非零退出，
+除非指定 --allow-missing-baseline。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.micro --save                 # 在基准机器上生成/更新基线
+    python -m benchmarks.micro --threshold 10         # 与基线对比，超过 10% 视为回归
+    python -m benchmarks.micro -k compliance --json   # 只跑名称包含 compliance 的用例
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "micro.json"
+
+CASES: dict[str, object] = {}
+
+
+def case(name: str):
+    """注册一个基准用例"""
+    def decorator(func):
+        CASES[name] = func
+        return func
+    return decorator
+
+
+# ---------------------------------------------------------------- 违禁词审查
+
+def _lexicon(size: int) -> list[str]:
+    from app.services.brandguard import PROHIBITED_WORDS
+
+    rng = random.Random(size)
+    words = list(PROHIBITED_WORDS)
+    while len(words) < size:
+        words.append("".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 4))))
+    return words[:size]
+
+
+def _text(size: int) -> str:
+    rng = random.Random(size)
+    base = "热玛吉紧致提拉，效果自然持久，欢迎到院咨询。水光针补水焕亮，专业医生团队为您定制方案。"
+    chars = list((base * (size // len(base) + 1))[:size])
+    for _ in range(max(1, size // 500)):
+        chars.insert(rng.randint(0, len(chars)), "最先进")
+    return "".join(chars[:size])
+
+
+def _compliance_case(lexicon_size: int, text_size: int):
+    def bench():
+        from app.services import brandguard
+
+        original = brandguard.PROHIBITED_WORDS
+        brandguard.PROHIBITED_WORDS = _lexicon(lexicon_size)
+        text = _text(text_size)
+        try:
+            yield lambda: brandguard.BrandGuardService.check_compliance_sync(text)
+        finally:
+            brandguard.PROHIBITED_WORDS = original
+    return bench
+
+
+for _lex in (34, 500, 5000):
+    for _size in (100, 2000, 20000):
+        case(f"compliance[lexicon={_lex},text={_size}]")(_compliance_case(_lex, _size))
+
+
+# ---------------------------------------------------------------- JWT
+
+@case("auth.create_access_token")
+def bench_jwt_encode():
+    from app.models.user import UserRole
+    from app.services.auth import AuthService
+
+    yield lambda: AuthService.create_access_token(42, UserRole.CONSULTANT)
+
+
+@case("auth.decode_token")
+def bench_jwt_decode():
+    from app.models.user import UserRole
+    from app.services.auth import AuthService
+
+    token = AuthService.create_access_token(42, UserRole.CONSULTANT)
+    yield lambda: AuthService.decode_token(token)
+
+
+# ---------------------------------------------------------------- Pydantic 序列化
+
+def _simulations(n: int) -> list:
+    from app.models.facesim import Simulation, SimulationStatus
+
+    now = datetime.utcnow()
+    return [
+        Simulation(
+            id=i, analysis_id=i, user_id=1, treatment_type="祛痘",
+            simulated_image_path=f"uploads/facesim/sim_{i}.jpg",
+            comparison_image_path=f"uploads/facesim/comp_{i}.jpg",
+            status=SimulationStatus.COMPLETED, parameters={"intensity": 5},
+            created_at=now - timedelta(minutes=i), completed_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def _posters(n: int) -> list:
+    from app.models.brandguard import GeneratedPoster
+
+    now = datetime.utcnow()
+    return [
+        GeneratedPoster(
+            id=i, user_id=1, template_id=None, title=f"热玛吉 活动 {i}",
+            content="热玛吉紧致提拉，效果自然持久，欢迎到院咨询。",
+            image_url=f"https://placeholder.com/poster_{i}.png", compliance_checked=True,
+            compliance_issues=["包含违禁词: 最好"], created_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+@case("serialize.SimulationListResponse[1k]")
+def bench_simulation_list():
+    from app.schemas.facesim import SimulationListItem, SimulationListResponse
+
+    rows = _simulations(1000)
+
+    def run():
+        response = SimulationListResponse(
+            total=len(rows), items=[SimulationListItem.model_validate(s) for s in rows]
+        )
+        return response.model_dump_json()
+    yield run
+
+
+@case("serialize.GeneratedPosterResponse[1k]")
+def bench_poster_list():
+    from pydantic import TypeAdapter
+
+    from app.schemas.brandguard import GeneratedPosterResponse
+
+    rows = _posters(1000)
+    adapter = TypeAdapter(list[GeneratedPosterResponse])
+
+    def run():
+        return adapter.dump_json([GeneratedPosterResponse.model_validate(p) for p in rows])
+    yield run
+
+
+@case("serialize.SimulationListResponse[1k].fast")
+def bench_simulation_list_fast():
+    from app.core.responses import ModelSerializer
+    from app.schemas.facesim import SimulationListResponse
+
+    rows = _simulations(1000)
+    serializer = ModelSerializer(SimulationListResponse)
+    yield lambda: serializer.dump({"total": len(rows), "items": rows})
+
+
+@case("serialize.GeneratedPosterResponse[1k].fast")
+def bench_poster_list_fast():
+    from app.core.responses import ModelSerializer
+    from app.schemas.brandguard import GeneratedPosterResponse
+
+    rows = _posters(1000)
+    serializer = ModelSerializer(list[GeneratedPosterResponse])
+    yield lambda: serializer.dump(rows)
+
+
+# ---------------------------------------------------------------- 图像质检与合成
+
+def _face_image(tmp: str, name: str, size: int) -> Path:
+    """在临时目录写入一张合成人脸 PNG，供质检与合成用例使用真实可解码的图片"""
+    from benchmarks.loadtest import synthetic_face_png
+
+    path = Path(tmp) / name
+    path.write_bytes(synthetic_face_png(size))
+    return path
+
+
+@case("facesim.check_image_quality[1024px]")
+def bench_image_quality():
+    from app.services.facesim import FaceSimService
+
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(_face_image(tmp, "face.png", 1024))
+        try:
+            yield lambda: loop.run_until_complete(FaceSimService._check_image_quality(path))
+        finally:
+            loop.close()
+
+
+@case("facesim.generate_comparison[1024px]")
+def bench_comparison():
+    from app.core.storage import LocalStorage
+    from app.services import facesim
+
+    loop = asyncio.new_event_loop()
+    original_storage = facesim.storage
+    with tempfile.TemporaryDirectory() as tmp:
+        facesim.storage = LocalStorage(tmp)
+        _face_image(tmp, "original.png", 1024)
+        _face_image(tmp, "simulated.png", 1024)
+        outputs = []
+
+        def run():
+            outputs.append(loop.run_until_complete(
+                facesim.FaceSimService._generate_comparison("original.png", "simulated.png")
+            ))
+            if len(outputs) > 256:
+                for key in outputs:
+                    (Path(tmp) / key).unlink(missing_ok=True)
+                outputs.clear()
+        try:
+            yield run
+        finally:
+            facesim.storage = original_storage
+            loop.close()
+
+
+# ---------------------------------------------------------------- 运行器
+
+def measure(func, repeat: int, min_time: float) -> dict:
+    """校准循环次数后测 repeat 轮，返回单次耗时统计（纳秒）"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops * 1e9)
+    return {
+        "median_ns": round(statistics.median(samples), 1),
+        "min_ns": round(min(samples), 1),
+        "stdev_ns": round(statistics.stdev(samples), 1) if len(samples) > 1 else 0.0,
+        "loops": loops,
+        "rounds": repeat,
+    }
+
+
+def run_cases(names: list[str], repeat: int, min_time: float) -> dict:
+    results = {}
+    for name in names:
+        gen = CASES[name]()
+        func = next(gen)
+        try:
+            results[name] = measure(func, repeat, min_time)
+        finally:
+            gen.close()
+        print(f"{name:<48} {results[name]['median_ns'] / 1000:>12.2f} µs", file=sys.stderr)
+    return results
+
+
+def check_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """对比基线，返回超过阈值的回归描述"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        change = (result["median_ns"] - old["median_ns"]) / old["median_ns"] * 100
+        if change > threshold:
+            regressions.append(
+                f"{name}: {old['median_ns'] / 1000:.2f} µs -> {result['median_ns'] / 1000:.2f} µs ({change:+.1f}%)"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="服务热路径微基准")
+    parser.add_argument("-k", dest="keyword", help="只运行名称包含该关键字的用例")
+    parser.add_argument("--list", action="store_true", help="列出所有用例")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="每轮最短耗时（秒）")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="将本次结果写入基线")
+    parser.add_argument("--threshold", type=float, default=10.0, help="回归阈值（百分比）")
+    parser.add_argument("--allow-missing-baseline", action="store_true", help="基线不存在时跳过回归检查并以 0 退出")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 结果")
+    args = parser.parse_args()
+
+    names = [n for n in CASES if not args.keyword or args.keyword in n]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    results = run_cases(names, args.repeat, args.min_time)
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.save:
+        baseline = {}
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        baseline.setdefault("results", {}).update(results)
+        baseline["meta"] = report["meta"]
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"基线已保存: {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not args.baseline.exists():
+        # 门禁默认不放过缺失的基线，否则 CI 上基线丢失时永远通过
+        print(f"未找到基线 {args.baseline}（使用 --save 生成）", file=sys.stderr)
+        return 0 if args.allow_missing_baseline else 2
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = check_regressions(results, baseline, args.threshold)
+    if regressions:
+        print(f"性能回归（阈值 {args.threshold}%）:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    print(f"无回归（阈值 {args.threshold}%）", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""生产部署：gunicorn 预加载应用与模型权重后 fork 出 uvicorn worker
+
+用法（在 backend 目录下）:
+    gunicorn -c gunicorn.conf.py app.main:app
+
+- preload_app：master 导入应用并执行同步预热（重依赖导入、权重内存映射与预读），
+  worker 以写时复制方式共享这些内存页，内存映射的权重与向量索引共享同一份页缓存；
+- fork 前 gc.freeze()，避免 worker 中的垃圾回收遍历继承对象、触发写时复制；
+- worker 数默认取可用 CPU 核数（推理为 CPU 密集型，多于核数只会增加内存与切换开销；
+  容器中按 cgroup CPU 配额计算，而不是宿主机核数），
+  可用 WEB_WORKERS 覆盖；WEB_PRELOAD=0 关闭预加载（仅用于对比内存占用）。
+"""
+import gc
+import math
+import os
+
+from app.config import settings
+
+
+def available_cpus() -> int:
+    """可用 CPU 数：进程可调度的核数（3.13+ 用 os.process_cpu_count），再受 cgroup CPU 配额限制"""
+    process_cpu_count = getattr(os, "process_cpu_count", None)
+    cpus = process_cpu_count() if process_cpu_count else len(os.sched_getaffinity(0))
+    # cgroup v2：cpu.max 为 "<配额> <周期>"；v1：cfs_quota_us / cfs_period_us；配额 max / -1 表示不限
+    for quota_file, period_file in (
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ):
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+    return cpus
+
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = settings.web_workers or available_cpus()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("WEB_PRELOAD", "1") != "0"
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(server):
+    """master 已导入应用、尚未 fork：执行同步预热并冻结现有对象"""
+    if not preload_app:
+        return
+    from app.core.warmup import warmups
+    from app.core.weights import weights
+
+    warmups.run_sync()
+    mapped = weights.preload()
+    gc.freeze()
+    server.log.info("预加载完成，模型权重 %s，workers=%s", mapped or "未部署", server.num_workers)
+
+
+def post_fork(server, worker):
+    """fork 后丢弃继承的连接池（master 未建立连接，此处只做防御）"""
+    from app.database import engine
+
+    engine.sync_engine.dispose(close=False)
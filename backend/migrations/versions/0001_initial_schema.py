@@ -0,0 +1,133 @@
+"""初始表结构
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False),
+        sa.Column("email", sa.String(100), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("role", sa.Enum("CONSULTANT", "DOCTOR", "MANAGER", "MARKETING", name="userrole"), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "face_images",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("file_path", sa.String(500), nullable=False),
+        sa.Column("quality_status", sa.Enum("PENDING", "PASSED", "FAILED", name="imagequalitystatus"), nullable=False),
+        sa.Column("quality_score", sa.Float(), nullable=True),
+        sa.Column("quality_issues", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_face_images_id", "face_images", ["id"])
+    op.create_index("ix_face_images_user_id", "face_images", ["user_id"])
+
+    op.create_table(
+        "skin_analyses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("image_id", sa.Integer(), sa.ForeignKey("face_images.id"), nullable=False),
+        sa.Column("issue_type", sa.Enum("ACNE", "SPOT", "WRINKLE", "PORE", name="skinissuetype"), nullable=False),
+        sa.Column("severity", sa.Integer(), nullable=False),
+        sa.Column("detected_areas", sa.JSON(), nullable=False),
+        sa.Column("confidence", sa.Float(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_skin_analyses_id", "skin_analyses", ["id"])
+    op.create_index("ix_skin_analyses_image_id", "skin_analyses", ["image_id"])
+
+    op.create_table(
+        "simulations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("analysis_id", sa.Integer(), sa.ForeignKey("skin_analyses.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("treatment_type", sa.String(100), nullable=False),
+        sa.Column("simulated_image_path", sa.String(500), nullable=False),
+        sa.Column("comparison_image_path", sa.String(500), nullable=True),
+        sa.Column("status", sa.Enum("PROCESSING", "COMPLETED", "FAILED", name="simulationstatus"), nullable=False),
+        sa.Column("parameters", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_simulations_id", "simulations", ["id"])
+    op.create_index("ix_simulations_analysis_id", "simulations", ["analysis_id"])
+    op.create_index("ix_simulations_user_id", "simulations", ["user_id"])
+
+    op.create_table(
+        "vi_configs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("brand_name", sa.String(100), nullable=False),
+        sa.Column("primary_color", sa.String(7), nullable=False),
+        sa.Column("secondary_color", sa.String(7), nullable=False),
+        sa.Column("accent_color", sa.String(7), nullable=False),
+        sa.Column("logo_url", sa.String(500), nullable=True),
+        sa.Column("font_family", sa.String(100), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_vi_configs_id", "vi_configs", ["id"])
+    op.create_index("ix_vi_configs_user_id", "vi_configs", ["user_id"])
+
+    op.create_table(
+        "poster_templates",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("layout_config", sa.JSON(), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=False),
+        sa.Column("height", sa.Integer(), nullable=False),
+        sa.Column("thumbnail_url", sa.String(500), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_poster_templates_id", "poster_templates", ["id"])
+    op.create_index("ix_poster_templates_user_id", "poster_templates", ["user_id"])
+
+    op.create_table(
+        "generated_posters",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("template_id", sa.Integer(), sa.ForeignKey("poster_templates.id"), nullable=True),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("image_url", sa.String(500), nullable=False),
+        sa.Column("compliance_checked", sa.Boolean(), nullable=False),
+        sa.Column("compliance_issues", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_generated_posters_id", "generated_posters", ["id"])
+    op.create_index("ix_generated_posters_user_id", "generated_posters", ["user_id"])
+
+
+def downgrade() -> None:
+    for table in (
+        "generated_posters", "poster_templates", "vi_configs",
+        "simulations", "skin_analyses", "face_images", "users",
+    ):
+        op.drop_table(table)
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        for enum in ("simulationstatus", "skinissuetype", "imagequalitystatus", "userrole"):
+            sa.Enum(name=enum).drop(bind, checkfirst=True)
@@ -0,0 +1,127 @@
+"""按 created_at 月度分区 simulations / skin_analyses / generated_posters
+
+仅对 PostgreSQL 生效（SQLite 等本地替身保持普通表）。
+分区表的主键必须包含分区键，因此主键改为 (id, created_at)，
+simulations.analysis_id -> skin_analyses.id 的外键随之取消，由应用层保证一致性。
+之后的月份分区由 `python -m app.jobs.partitions maintain` 提前创建。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+TABLES = {
+    "simulations": {
+        "foreign_keys": [("user_id", "users")],
+        "indexes": [
+            ("ix_simulations_user_created", "user_id, created_at DESC"),
+            ("ix_simulations_analysis_id", "analysis_id"),
+            ("ix_simulations_id", "id"),
+        ],
+    },
+    "skin_analyses": {
+        "foreign_keys": [("image_id", "face_images")],
+        "indexes": [
+            ("ix_skin_analyses_image_id", "image_id"),
+            ("ix_skin_analyses_id", "id"),
+        ],
+    },
+    "generated_posters": {
+        "foreign_keys": [("user_id", "users"), ("template_id", "poster_templates")],
+        "indexes": [
+            ("ix_generated_posters_user_created", "user_id, created_at DESC"),
+            ("ix_generated_posters_id", "id"),
+        ],
+    },
+}
+
+
+def _add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _create_partitions(table: str, first: datetime, last: datetime) -> None:
+    month = first
+    while month <= last:
+        nxt = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{nxt:%Y-%m-%d}')"
+        )
+        month = nxt
+    op.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    now = datetime.utcnow()
+    current_month = datetime(now.year, now.month, 1)
+
+    op.drop_constraint("simulations_analysis_id_fkey", "simulations", type_="foreignkey")
+
+    for table, spec in TABLES.items():
+        legacy = f"{table}_legacy"
+        op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        # 改表名不会改约束与索引名，旧主键先让出 {table}_pkey，否则新主键会被自动命名为 {table}_pkey1
+        op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        for column, target in spec["foreign_keys"]:
+            op.create_foreign_key(f"{table}_{column}_fkey", table, target, [column], ["id"])
+
+        oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+        first = datetime(oldest.year, oldest.month, 1) if oldest else current_month
+        _create_partitions(table, min(first, current_month), _add_months(current_month, MONTHS_AHEAD))
+        op.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+
+    for table in TABLES:
+        op.execute(f"DROP TABLE {table}_legacy")
+    for table, spec in TABLES.items():
+        for name, columns in spec["indexes"]:
+            op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    for table, spec in TABLES.items():
+        partitioned = f"{table}_partitioned"
+        op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+        op.execute(f"ALTER TABLE {partitioned} RENAME CONSTRAINT {table}_pkey TO {partitioned}_pkey")
+        op.execute(f"CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {partitioned}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.execute(f"DROP TABLE {partitioned} CASCADE")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+        for column, target in spec["foreign_keys"]:
+            op.create_foreign_key(f"{table}_{column}_fkey", table, target, [column], ["id"])
+        for name, columns in spec["indexes"]:
+            op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+    # 归档会留下引用已归档分析的模拟记录，外键不校验已有行
+    op.execute(
+        "ALTER TABLE simulations ADD CONSTRAINT simulations_analysis_id_fkey "
+        "FOREIGN KEY (analysis_id) REFERENCES skin_analyses (id) NOT VALID"
+    )
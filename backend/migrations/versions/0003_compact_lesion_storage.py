@@ -0,0 +1,156 @@
+"""skin_analyses 检测区域紧凑存储与外包框列
+
+新增 int16 检测框 / 游程编码掩码二进制列、画面尺寸与外包框列，
+并把旧数据 detected_areas.regions 中的坐标迁移到紧凑列。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+import logging
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+COLUMNS = (
+    "boxes", "mask_rle", "region_count", "frame_width", "frame_height",
+    "bbox_x0", "bbox_y0", "bbox_x1", "bbox_y1",
+)
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# 编码格式随本迁移固定（与 app.services.lesions 在本版本的实现一致），不依赖应用代码与 numpy：
+# 检测框为 int16 小端 (x, y, width, height)，掩码为头部 uint16 (height, width) + uint32 游程
+INT16_MAX = 32767
+
+
+def pack_boxes(analysis_id: int, regions: list[dict]) -> bytes:
+    boxes = [(r["x"], r["y"], r["width"], r["height"]) for r in regions]
+    clipped = [tuple(min(max(int(v), 0), INT16_MAX) for v in box) for box in boxes]
+    if clipped != boxes:
+        logger.warning("skin_analyses.id=%s 的检测框坐标超出 [0, %d]，已截断", analysis_id, INT16_MAX)
+    return b"".join(struct.pack("<4h", *box) for box in clipped)
+
+
+def encode_mask(mask: list[list]) -> bytes:
+    flat = [bool(v) for row in mask for v in row]
+    runs, current, length = [], False, 0
+    for value in flat:
+        if value != current:
+            runs.append(length)
+            current, length = value, 0
+        length += 1
+    runs.append(length)
+    height = len(mask)
+    width = len(mask[0]) if mask else 0
+    return struct.pack("<HH", height, width) + struct.pack(f"<{len(runs)}I", *runs)
+
+
+def encode_areas(analysis_id: int, areas: dict) -> dict:
+    """detected_areas -> 紧凑列值（坐标进紧凑列，其余字段留在 detected_areas）"""
+    regions = areas.get("regions") or []
+    frame = areas.get("frame") or {}
+    mask = areas.get("mask")
+    boxes = pack_boxes(analysis_id, regions)
+    values = {
+        "detected_areas": {k: v for k, v in areas.items() if k not in ("regions", "mask", "frame")},
+        "boxes": boxes,
+        "mask_rle": encode_mask(mask) if mask is not None else None,
+        "region_count": len(regions),
+        "frame_width": frame.get("width"),
+        "frame_height": frame.get("height"),
+        "bbox_x0": None, "bbox_y0": None, "bbox_x1": None, "bbox_y1": None,
+    }
+    if regions:
+        unpacked = list(struct.iter_unpack("<4h", boxes))
+        values.update(
+            bbox_x0=min(x for x, _, _, _ in unpacked),
+            bbox_y0=min(y for _, y, _, _ in unpacked),
+            bbox_x1=max(x + w for x, _, w, _ in unpacked),
+            bbox_y1=max(y + h for _, y, _, h in unpacked),
+        )
+    return values
+
+
+skin_analyses = sa.table(
+    "skin_analyses",
+    sa.column("id", sa.Integer()),
+    sa.column("detected_areas", sa.JSON()),
+    sa.column("boxes", sa.LargeBinary()),
+    sa.column("mask_rle", sa.LargeBinary()),
+    *(sa.column(name, sa.Integer()) for name in COLUMNS[2:]),
+)
+
+
+def upgrade() -> None:
+    op.add_column("skin_analyses", sa.Column("boxes", sa.LargeBinary(), nullable=True))
+    op.add_column("skin_analyses", sa.Column("mask_rle", sa.LargeBinary(), nullable=True))
+    op.add_column("skin_analyses", sa.Column("region_count", sa.Integer(), nullable=False, server_default="0"))
+    for name in COLUMNS[3:]:
+        op.add_column("skin_analyses", sa.Column(name, sa.Integer(), nullable=True))
+    op.create_index("ix_skin_analyses_image_issue", "skin_analyses", ["image_id", "issue_type"])
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(skin_analyses.c.id, skin_analyses.c.detected_areas)
+            .where(skin_analyses.c.id > last_id, skin_analyses.c.boxes.is_(None))
+            .order_by(skin_analyses.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        # 整批一次 executemany，不逐行往返
+        bind.execute(
+            skin_analyses.update()
+            .where(skin_analyses.c.id == sa.bindparam("analysis_id"))
+            .values({name: sa.bindparam(f"new_{name}") for name in ("detected_areas", *COLUMNS)}),
+            [
+                {"analysis_id": analysis_id, **{
+                    f"new_{name}": value for name, value in encode_areas(analysis_id, areas or {}).items()
+                }}
+                for analysis_id, areas in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    # 把坐标写回 detected_areas.regions，再删除紧凑列
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(skin_analyses.c.id, skin_analyses.c.detected_areas, skin_analyses.c.boxes)
+            .where(skin_analyses.c.id > last_id, skin_analyses.c.boxes.is_not(None))
+            .order_by(skin_analyses.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            skin_analyses.update()
+            .where(skin_analyses.c.id == sa.bindparam("analysis_id"))
+            .values(detected_areas=sa.bindparam("areas")),
+            [
+                {"analysis_id": analysis_id, "areas": {**(areas or {}), "regions": [
+                    {"x": x, "y": y, "width": w, "height": h} for x, y, w, h in struct.iter_unpack("<4h", boxes)
+                ]}}
+                for analysis_id, areas, boxes in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+    op.drop_index("ix_skin_analyses_image_issue", table_name="skin_analyses")
+    for name in COLUMNS:
+        op.drop_column("skin_analyses", name)
@@ -0,0 +1,24 @@
+"""face_images 增加内容哈希，用于批量导入去重
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("face_images", sa.Column("content_hash", sa.String(64), nullable=True))
+    op.create_index("ix_face_images_user_hash", "face_images", ["user_id", "content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_face_images_user_hash", table_name="face_images")
+    op.drop_column("face_images", "content_hash")
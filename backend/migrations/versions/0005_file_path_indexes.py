@@ -0,0 +1,29 @@
+"""文件路径索引，供清理任务按批对账上传目录
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_face_images_file_path", "face_images", "file_path"),
+    ("ix_simulations_simulated_image_path", "simulations", "simulated_image_path"),
+    ("ix_simulations_comparison_image_path", "simulations", "comparison_image_path"),
+)
+
+
+def upgrade() -> None:
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column])
+
+
+def downgrade() -> None:
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
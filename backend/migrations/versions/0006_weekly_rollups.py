@@ -0,0 +1,45 @@
+"""模拟与海报周汇总表及水位表
+
+建表后执行 `python -m app.jobs.rollup backfill` 计入历史数据。
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "simulation_weekly_rollups",
+        sa.Column("week", sa.Date(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("treatment_type", sa.String(100), primary_key=True),
+        sa.Column("simulations", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "poster_weekly_rollups",
+        sa.Column("week", sa.Date(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("posters", sa.Integer(), nullable=False),
+        sa.Column("violations", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("source", sa.String(50), primary_key=True),
+        sa.Column("last_id", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_watermarks")
+    op.drop_table("poster_weekly_rollups")
+    op.drop_table("simulation_weekly_rollups")
@@ -0,0 +1,43 @@
+"""海报与模板检索索引（中文二元组倒排表）
+
+建表后执行 `python -m app.jobs.search_index rebuild` 为历史数据建索引。
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# 与模型一致：PostgreSQL 下词元列用 "C" 排序规则，单字前缀 LIKE 可走主键范围扫描
+TOKEN_TYPE = sa.String(32).with_variant(sa.String(32, collation="C"), "postgresql")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "search_postings",
+        sa.Column("owner_id", sa.Integer(), primary_key=True),
+        sa.Column("token", TOKEN_TYPE, primary_key=True),
+        sa.Column("doc_type", sa.String(16), primary_key=True),
+        sa.Column("doc_id", sa.Integer(), primary_key=True),
+        sa.Column("weight", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_search_postings_doc", "search_postings", ["doc_type", "doc_id"])
+    op.create_table(
+        "search_terms",
+        sa.Column("owner_id", sa.Integer(), primary_key=True),
+        sa.Column("token", TOKEN_TYPE, primary_key=True),
+        sa.Column("doc_count", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("search_terms")
+    op.drop_index("ix_search_postings_doc", table_name="search_postings")
+    op.drop_table("search_postings")
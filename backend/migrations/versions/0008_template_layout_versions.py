@@ -0,0 +1,179 @@
+"""海报模板布局改为内容寻址节点存储，并记录模板版本
+
+新增 layout_nodes（不可变的布局子树，按内容哈希去重）与 poster_template_versions，
+poster_templates 增加 layout_hash / version / forked_from_id，
+把已有模板的 layout_config 拆分为节点后删除该列。
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# 拆分规则随本迁移固定，不随应用代码变化：
+# 与 app.services.layouts 在本版本的实现一致，保证迁移写入的哈希与应用算出的相同
+REF = "$ref"
+NODE_MIN_BYTES = 128
+
+
+def canonical_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+
+
+def split(value, nodes: dict, root: bool = False):
+    """把 JSON 值拆成内容寻址节点（记入 nodes），返回其在父节点中的表示"""
+    if isinstance(value, dict):
+        body = {key: split(item, nodes) for key, item in value.items()}
+    elif isinstance(value, list):
+        body = [split(item, nodes) for item in value]
+    else:
+        return value
+    encoded = canonical_json(body)
+    if not root and len(encoded) < NODE_MIN_BYTES:
+        return body
+    digest = hashlib.sha256(encoded).hexdigest()
+    nodes[digest] = body
+    return {REF: digest}
+
+
+def join_layout(value, nodes: dict):
+    """把引用替换为子树"""
+    if isinstance(value, dict) and len(value) == 1 and REF in value:
+        return join_layout(nodes[value[REF]], nodes)
+    if isinstance(value, dict):
+        return {key: join_layout(item, nodes) for key, item in value.items()}
+    if isinstance(value, list):
+        return [join_layout(item, nodes) for item in value]
+    return value
+
+poster_templates = sa.table(
+    "poster_templates",
+    sa.column("id", sa.Integer()),
+    sa.column("layout_config", sa.JSON()),
+    sa.column("layout_hash", sa.String()),
+    sa.column("version", sa.Integer()),
+    sa.column("created_at", sa.DateTime()),
+)
+layout_nodes = sa.table(
+    "layout_nodes",
+    sa.column("hash", sa.String()),
+    sa.column("body", sa.JSON()),
+    sa.column("size", sa.Integer()),
+    sa.column("created_at", sa.DateTime()),
+)
+poster_template_versions = sa.table(
+    "poster_template_versions",
+    sa.column("template_id", sa.Integer()),
+    sa.column("number", sa.Integer()),
+    sa.column("layout_hash", sa.String()),
+    sa.column("created_at", sa.DateTime()),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "layout_nodes",
+        sa.Column("hash", sa.String(64), primary_key=True),
+        sa.Column("body", sa.JSON(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "poster_template_versions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("template_id", sa.Integer(), sa.ForeignKey("poster_templates.id"), nullable=False),
+        sa.Column("number", sa.Integer(), nullable=False),
+        sa.Column("layout_hash", sa.String(64), sa.ForeignKey("layout_nodes.hash"), nullable=False),
+        sa.Column("parent_id", sa.Integer(), sa.ForeignKey("poster_template_versions.id"), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("template_id", "number", name="uq_poster_template_versions_number"),
+    )
+    op.create_index("ix_poster_template_versions_template_id", "poster_template_versions", ["template_id"])
+    with op.batch_alter_table("poster_templates") as batch:
+        batch.add_column(sa.Column("layout_hash", sa.String(64), nullable=True))
+        batch.add_column(sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+        batch.add_column(sa.Column("forked_from_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key("fk_poster_templates_layout_hash", "layout_nodes", ["layout_hash"], ["hash"])
+        batch.create_foreign_key("fk_poster_templates_forked_from_id", "poster_templates", ["forked_from_id"], ["id"])
+
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    stored: set[str] = set()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(poster_templates.c.id, poster_templates.c.layout_config, poster_templates.c.created_at)
+            .where(poster_templates.c.id > last_id)
+            .order_by(poster_templates.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        nodes: dict = {}
+        hashes = {}
+        for template_id, layout, _ in rows:
+            hashes[template_id] = split(layout or {}, nodes, root=True)[REF]
+        # 节点先于引用它的模板写入
+        new_nodes = [
+            {"hash": digest, "body": body, "size": len(canonical_json(body)), "created_at": now}
+            for digest, body in nodes.items()
+            if digest not in stored
+        ]
+        if new_nodes:
+            bind.execute(layout_nodes.insert(), new_nodes)
+            stored.update(node["hash"] for node in new_nodes)
+        bind.execute(
+            poster_templates.update()
+            .where(poster_templates.c.id == sa.bindparam("template_id"))
+            .values(layout_hash=sa.bindparam("root_hash")),
+            [{"template_id": template_id, "root_hash": layout_hash} for template_id, layout_hash in hashes.items()],
+        )
+        bind.execute(poster_template_versions.insert(), [
+            {"template_id": template_id, "number": 1, "layout_hash": hashes[template_id], "created_at": created_at}
+            for template_id, _, created_at in rows
+        ])
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table("poster_templates") as batch:
+        batch.alter_column("layout_hash", existing_type=sa.String(64), nullable=False)
+        batch.drop_column("layout_config")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("poster_templates") as batch:
+        batch.add_column(sa.Column("layout_config", sa.JSON(), nullable=True))
+
+    # 还原每个模板当前版本的完整布局（版本历史随表删除）
+    bind = op.get_bind()
+    nodes = dict(bind.execute(sa.select(layout_nodes.c.hash, layout_nodes.c.body)).all())
+    rows = bind.execute(sa.select(poster_templates.c.id, poster_templates.c.layout_hash)).all()
+    for template_id, layout_hash in rows:
+        bind.execute(
+            poster_templates.update()
+            .where(poster_templates.c.id == template_id)
+            .values(layout_config=join_layout({REF: layout_hash}, nodes))
+        )
+
+    with op.batch_alter_table("poster_templates") as batch:
+        batch.alter_column("layout_config", existing_type=sa.JSON(), nullable=False)
+        batch.drop_constraint("fk_poster_templates_forked_from_id", type_="foreignkey")
+        batch.drop_constraint("fk_poster_templates_layout_hash", type_="foreignkey")
+        batch.drop_column("forked_from_id")
+        batch.drop_column("version")
+        batch.drop_column("layout_hash")
+    op.drop_index("ix_poster_template_versions_template_id", table_name="poster_template_versions")
+    op.drop_table("poster_template_versions")
+    op.drop_table("layout_nodes")